@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""Measures how parsing the output of `ezjail-admin list` scales with the number of jails, and how much memory the
+parsed listing takes, compared with the former parser that built a :py:class:`dict` per jail.
+
+Usage::
+
+    python benchmarks/bench_ezjail_list.py [--jails 1000 10000 100000] [--runs 5]
+
+Listings are synthetic: every jail has a main ip and two additional ones.
+"""
+from __future__ import absolute_import, print_function, unicode_literals
+
+import argparse
+import timeit
+
+from pybsd import EzjailAdmin, Master
+
+
+class ListingExecutor(object):
+    output = ''
+
+    def __call__(self, *args, **kwargs):
+        return 0, self.output, ''
+
+
+class BenchMaster(Master):
+    ExecutorClass = ListingExecutor
+
+
+def listing(jails):
+    lines = ['STA JID  IP              Hostname                       Root Directory',
+             '--- ---- --------------- ------------------------------ ------------------------']
+    for i in range(jails):
+        ip = '10.{}.{}.{}/24'.format(i // 65536, i // 256 % 256, i % 256)
+        lines.append('ZR  {:<4} {:<15} {:<30} /usr/jails/jail{}'.format(i + 1, ip, 'jail{}'.format(i), i))
+        lines.append('    {:<4} re0|2a01:4f8:210:41e6::{:x}/100'.format(i + 1, i))
+        lines.append('    {:<4} lo1|127.{}.{}.{}/24'.format(i + 1, i // 65536, i // 256 % 256, i % 256))
+    return '\n'.join(lines) + '\n'
+
+
+def legacy_parse(out):
+    # The former parser: a dict per jail, its name popped out of the split row
+    headers = ('status', 'jid', 'ip', 'name', 'root')
+    jails = {}
+    current_name = current_jail = None
+    for line in out.splitlines()[2:]:
+        if line[0:4] != '    ':
+            line = line.strip()
+            if not line:
+                continue
+            if current_jail is not None:
+                jails[current_name] = current_jail
+            current_jail = dict(zip(headers, line.split()))
+            current_jail['ips'] = [current_jail['ip']]
+            current_name = current_jail.pop('name')
+        else:
+            line = line.strip()
+            if not line:
+                continue
+            current_jail['ips'].append(line.split()[1].split('|')[1])
+    if current_jail is not None:
+        jails[current_name] = current_jail
+    return jails
+
+
+def measure(parse, runs):
+    import tracemalloc  # python >= 3.4, imported here so that the module can be collected on python 2
+    elapsed = min(timeit.repeat(parse, number=1, repeat=runs))
+    tracemalloc.start()
+    result = parse()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return elapsed, retained, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--jails', type=int, nargs='+', default=[1000, 10000, 100000], help='sizes of the listings')
+    parser.add_argument('--runs', type=int, default=5, help='number of parses per measure, the fastest is kept')
+    options = parser.parse_args()
+    system = BenchMaster(name='bench', ext_if=('re0', ['8.8.8.8/24']))
+    command = EzjailAdmin(system)
+    parsers = [('legacy', lambda: legacy_parse(system.execute.output)), ('list', command.list)]
+    for jails in sorted(options.jails):
+        system.execute.output = listing(jails)
+        for name, parse in parsers:
+            elapsed, retained, peak = measure(parse, options.runs)
+            print('{:>7} jails {:<7} {:>9.1f}ms {:>7.2f}us/jail {:>9.1f}KB retained {:>9.1f}KB peak'.format(
+                jails, name, elapsed * 1e3, elapsed / jails * 1e6, retained / 1024., peak / 1024.))
+
+
+if __name__ == '__main__':
+    main()
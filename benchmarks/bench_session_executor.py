@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""Compares the cost of running many short commands through :py:class:`~pybsd.executors.Executor`, which spawns a process
+per command, and :py:class:`~pybsd.executors.SessionExecutor`, which runs them all through one long-lived shell.
+
+Usage::
+
+    python benchmarks/bench_session_executor.py [--runs 200] [--heap-mb 0] [--cmd uname]
+
+`--heap-mb` grows the benchmark's heap before timing, to emulate a controller holding a large model.
+"""
+from __future__ import absolute_import, print_function, unicode_literals
+
+import argparse
+import timeit
+
+from pybsd.executors import Executor, SessionExecutor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=200, help='number of commands per executor')
+    parser.add_argument('--heap-mb', type=int, default=0, help='approximate size of the ballast kept on the heap')
+    parser.add_argument('--cmd', nargs='+', default=['uname'], help='the command to run')
+    options = parser.parse_args()
+    ballast = [bytearray(1024 * 1024) for _ in range(options.heap_mb)]  # noqa
+
+    session = SessionExecutor()
+    session(*options.cmd)  # the shell's startup is not part of the measure
+    for executor in (Executor(), session):
+        elapsed = timeit.timeit(lambda: executor(*options.cmd), number=options.runs)
+        print('{:<16} {:>6} runs {:>9.3f}s {:>9.1f}us/run'.format(executor.__class__.__name__, options.runs, elapsed,
+                                                                  elapsed / options.runs * 1e6))
+    session.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""Compares the latency of launching a process through :py:class:`subprocess.Popen` and through
+:py:class:`~pybsd.processes.SpawnedProcess` as the controller's heap grows.
+
+Usage::
+
+    python benchmarks/bench_spawn.py [--runs 200] [--heap-mb 0 256 1024] [--cmd uname]
+
+The ballast's pages are written to, so that they are actually mapped and have to be accounted for by fork.
+"""
+from __future__ import absolute_import, print_function, unicode_literals
+
+import argparse
+import subprocess
+import timeit
+
+from pybsd.processes import HAS_POSIX_SPAWN, SpawnedProcess
+
+
+def launch(cls, cmd):
+    proc = cls(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    proc.communicate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=200, help='number of processes launched per measure')
+    parser.add_argument('--heap-mb', type=int, nargs='+', default=[0, 256, 1024],
+                        help='approximate sizes of the ballast kept on the heap')
+    parser.add_argument('--cmd', nargs='+', default=['uname'], help='the command to run')
+    options = parser.parse_args()
+    launchers = [subprocess.Popen] + ([SpawnedProcess] if HAS_POSIX_SPAWN else [])
+    ballast = []
+    for heap_mb in sorted(options.heap_mb):
+        while len(ballast) < heap_mb:
+            ballast.append(b'\x01' * 1024 * 1024)
+        for cls in launchers:
+            elapsed = timeit.timeit(lambda: launch(cls, options.cmd), number=options.runs)
+            print('{:>6}MB {:<16} {:>6} runs {:>9.3f}s {:>9.1f}us/run'.format(heap_mb, cls.__name__, options.runs, elapsed,
+                                                                              elapsed / options.runs * 1e6))
+
+
+if __name__ == '__main__':
+    main()
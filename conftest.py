@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+import sys
+
+collect_ignore = []
+if sys.version_info < (3, 7):
+    # pybsd.aio can not be parsed before python 3.5, and its doctests and tests run coroutines with asyncio.run
+    collect_ignore.extend(['src/pybsd/aio.py', 'tests/test_aio.py'])
@@ -30,6 +30,7 @@ requirements = [
 ]
 if sys.version_info.major == 2:
     requirements.append('py2-ipaddress')
+    requirements.append('selectors34')
 
 setup(
     name="PyBSD",
@@ -3,12 +3,13 @@ from __future__ import absolute_import, print_function, unicode_literals
 
 import logging
 
-from .commands import BaseCommand, EzjailAdmin  # noqa
+from .commands import BaseCommand, EzjailAdmin, EzjailConfig, Jexec, Jls  # noqa
 from .exceptions import (AttachNonJailError, AttachNonMasterError, CommandConnectionError, CommandNotImplementedError,  # noqa
-                         DuplicateIPError, DuplicateJailHostnameError, DuplicateJailNameError, DuplicateJailUidError,  # noqa
-                         InvalidCommandExecutorError, InvalidCommandNameError, InvalidMainIPError, InvalidOutputError,  # noqa
-                         InvalidUIDError, JailAlreadyAttachedError, MasterJailError, MasterJailMismatchError, MissingMainIPError,  # noqa
-                         PyBSDError, SubprocessError, WhitespaceError)  # noqa
+                         CommandTimeoutError, DependencyCycleError, DuplicateIPError, DuplicateJailHostnameError,  # noqa
+                         DuplicateJailNameError, DuplicateJailUidError, ExecutionTimeoutError, InvalidCommandExecutorError,  # noqa
+                         InvalidCommandNameError, InvalidMainIPError, InvalidOutputError, InvalidUIDError,  # noqa
+                         JailAlreadyAttachedError, MasterJailError, MasterJailMismatchError, MissingMainIPError,  # noqa
+                         PyBSDError, SubprocessError, TranscriptMissError, WhitespaceError)  # noqa
 from .executors import Executor  # noqa
 from .handlers import BaseJailHandler  # noqa
 from .network import Interface  # noqa
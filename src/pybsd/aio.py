@@ -0,0 +1,367 @@
+# -*- coding: utf-8 -*-
+"""Asyncio-based counterparts of :py:mod:`pybsd.executors` and of the command invocation layer.
+
+This module requires python >= 3.5 and is therefore never imported implicitly on older interpreters.
+"""
+from __future__ import absolute_import, print_function, unicode_literals
+
+import asyncio
+import logging
+import os
+import signal
+import socket
+import weakref
+
+from .cache import SingleFlight
+from .exceptions import CommandConnectionError, CommandNotImplementedError, CommandTimeoutError, ExecutionTimeoutError
+from .executors import Executor
+from .instrumentation import timer
+
+__logger__ = logging.getLogger('pybsd')
+
+
+class ConcurrencyLimits(object):
+    """Caps the number of commands that run simultaneously, both globally and for each host
+
+    Parameters
+    ----------
+    global_limit : Optional[:py:class:`int`]
+        The maximum number of commands running at the same time over all hosts. `None` means unbounded.
+    per_host_limit : Optional[:py:class:`int`]
+        The maximum number of commands running at the same time on any one host. `None` means unbounded.
+    """
+    def __init__(self, global_limit=None, per_host_limit=None):
+        self.global_limit = global_limit
+        self.per_host_limit = per_host_limit
+        # asyncio primitives are bound to an event loop, so they are kept per loop
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def _semaphore(self, key, limit):
+        if limit is None:
+            return None
+        semaphores = self._semaphores.setdefault(asyncio.get_event_loop(), {})
+        if key not in semaphores:
+            semaphores[key] = asyncio.Semaphore(limit)
+        return semaphores[key]
+
+    def slot(self, host):
+        """Returns an asynchronous context manager that holds a global and a per-host slot while it is entered
+
+        Parameters
+        ----------
+        host : :py:class:`str`
+            The host the command will run on
+
+        Returns
+        -------
+        : :py:class:`~pybsd.aio.Slot`
+        """
+        return Slot(self._semaphore(None, self.global_limit), self._semaphore(host, self.per_host_limit))
+
+
+class Slot(object):
+    """An asynchronous context manager acquiring a global and a per-host semaphore, in that order"""
+    def __init__(self, *semaphores):
+        self.semaphores = [s for s in semaphores if s is not None]
+
+    async def __aenter__(self):
+        acquired = []
+        try:
+            for semaphore in self.semaphores:
+                await semaphore.acquire()
+                acquired.append(semaphore)
+        except BaseException:
+            for semaphore in reversed(acquired):
+                semaphore.release()
+            raise
+        return self
+
+    async def __aexit__(self, *exc_info):
+        for semaphore in reversed(self.semaphores):
+            semaphore.release()
+
+
+class AsyncExecutor(Executor):
+    """Executes a command without blocking the event loop
+
+    Calling an instance returns a coroutine that resolves to the same `rc`/`out`/`err` result as
+    :py:class:`~pybsd.executors.Executor` would, so hundreds of hosts can be driven concurrently by one process. The
+    executor's synchronous APIs, :py:meth:`~pybsd.executors.Executor.stream`, :py:meth:`~pybsd.executors.Executor.batch`,
+    :py:meth:`~pybsd.executors.Executor.map` and :py:meth:`~pybsd.executors.Executor.pipe`, are not available: they
+    raise a :py:class:`TypeError`.
+
+    Example
+    -------
+    >>> import asyncio
+    >>> from pybsd.aio import AsyncExecutor
+    >>> execute = AsyncExecutor()
+    >>> asyncio.run(execute('echo', 'foo'))
+    (0, 'foo\\n', '')
+
+    Parameters
+    ----------
+    instance : Optional[`any`]
+        The remote instance the commands are executed on. Local execution if None.
+    prefix_args : Optional[:py:class:`tuple`]
+        Arguments prepended to every command.
+    splitlines : Optional[:py:class:`bool`]
+        Whether out and err should be returned as lists of lines.
+    transport : Optional[:py:class:`~pybsd.transports.BaseTransport`]
+        The transport to `instance`. If not specified, it is taken from :py:data:`pybsd.transports.pool`. The transport's
+        channel cap is not enforced, use `limits` instead.
+    limits : Optional[:py:class:`~pybsd.aio.ConcurrencyLimits`]
+        The limits this executor abides by. Defaults to the class-wide `limits`, which is shared by all executors.
+
+    Attributes
+    ----------
+    limits : :py:class:`~pybsd.aio.ConcurrencyLimits`
+        the default limits, shared by all instances. Unbounded unless reconfigured.
+    """
+    limits = ConcurrencyLimits()
+
+    def __init__(self, instance=None, prefix_args=(), splitlines=False, transport=None, limits=None):
+        super(AsyncExecutor, self).__init__(instance=instance, prefix_args=prefix_args, splitlines=splitlines,
+                                            transport=transport)
+        if limits is not None:
+            self.limits = limits
+
+    async def __call__(self, *cmd_args, **kwargs):
+        args = self.prefix_args + cmd_args
+        rc = kwargs.pop('rc', None)
+        out = kwargs.pop('out', None)
+        err = kwargs.pop('err', None)
+        stdin = kwargs.pop('stdin', None)
+        raw = kwargs.pop('raw', False)
+        tag = kwargs.pop('tag', None)
+        timeout = kwargs.pop('timeout', self.timeout)
+        run_kwargs = {} if timeout is None else {'timeout': timeout}
+        async with self.limits.slot(self.host):
+            if self.instrumentation is None:
+                _rc, _out, _err = await self._run(args, stdin, **run_kwargs)
+            else:
+                sample = self.instrumentation.start(tag or self._tag(args), args, stdin)
+                try:
+                    _rc, _out, _err = await self._run(args, stdin, sample, **run_kwargs)
+                except Exception as e:
+                    self.instrumentation.finish(sample, error=e)
+                    raise
+                self.instrumentation.finish(sample, _rc, _out, _err)
+        return self._result(args, _rc, _out, _err, rc=rc, out=out, err=err, raw=raw)
+
+    def _synchronous(self, name):
+        raise TypeError('{} has no synchronous `{}`, use an Executor instead'.format(type(self).__name__, name))
+
+    def stream(self, *cmd_args, **kwargs):
+        self._synchronous('stream')
+
+    def batch(self, stop_on_error=False, timeout=None, tag=None):
+        self._synchronous('batch')
+
+    def map(self, commands, max_workers=8, ordered=True, timeout=None):
+        self._synchronous('map')
+
+    def pipe(self, *commands, **kwargs):
+        self._synchronous('pipe')
+
+    async def _run(self, args, stdin=None, sample=None, timeout=None):
+        if self.instance is None:
+            __logger__.debug('Executing locally (async):\n%s', args)
+        else:
+            __logger__.debug('Executing on `%s` (async):\n%s', self.host, args)
+            args = self.transport.wrap(args)
+        started = timer()
+        proc = await asyncio.create_subprocess_exec(*args,
+                                                    stdin=asyncio.subprocess.PIPE if stdin is not None else None,
+                                                    stdout=asyncio.subprocess.PIPE,
+                                                    stderr=asyncio.subprocess.PIPE,
+                                                    start_new_session=timeout is not None)
+        if sample is not None:
+            sample.spawn_time = timer() - started
+        try:
+            if timeout is None:
+                _out, _err = await proc.communicate(input=stdin)
+            else:
+                _out, _err = await asyncio.wait_for(proc.communicate(input=stdin), timeout)
+        except asyncio.TimeoutError:
+            await self._terminate(proc, group=True)
+            raise ExecutionTimeoutError(args, timeout)
+        except asyncio.CancelledError:
+            # Cancelled callers, such as the overdue ones of :py:func:`gather`, do not leave their process behind
+            await self._terminate(proc, group=timeout is not None)
+            raise
+        if self.instance is not None:
+            self.transport.check(proc.returncode, _err)
+        return proc.returncode, _out, _err
+
+    async def _terminate(self, proc, group=False):
+        # Terminates an overdue process, and its process group if it leads one: SIGTERM first, then SIGKILL once
+        # `kill_grace` expired
+        for sig in (signal.SIGTERM, signal.SIGKILL):
+            try:
+                if group:
+                    os.killpg(proc.pid, sig)
+                else:
+                    proc.send_signal(sig)
+            except OSError:
+                pass
+            try:
+                await asyncio.wait_for(proc.wait(), self.kill_grace)
+                return
+            except asyncio.TimeoutError:
+                pass
+
+
+async def gather(*aws, timeout=None, return_exceptions=False):
+    """Awaits many awaitables, typically commands run on different hosts, within a shared deadline
+
+    Unlike :py:func:`asyncio.gather`, a deadline does not discard the results that arrived in time: the awaitables that
+    are still pending when it expires are cancelled, which terminates their commands, and None takes their place.
+
+    Example
+    -------
+    >>> import asyncio
+    >>> from pybsd.aio import AsyncExecutor, gather
+    >>> execute = AsyncExecutor()
+    >>> asyncio.run(gather(execute('echo', 'foo'), execute('sleep', '5'), timeout=1))
+    [(0, 'foo\\n', ''), None]
+
+    Parameters
+    ----------
+    aws : awaitables
+        The awaitables to wait for
+    timeout : Optional[:py:class:`float`]
+        How long, in seconds, to wait for them. Forever if None.
+    return_exceptions : Optional[:py:class:`bool`]
+        Whether exceptions are returned in place of their awaitable's result. Otherwise, the first one, in order, is
+        raised once every awaitable completed or was cancelled.
+
+    Returns
+    -------
+    : :py:class:`list`
+        the awaitables' results, in order, or None for those that did not complete within `timeout`
+    """
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    if not tasks:
+        return []
+    try:
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+    finally:
+        overdue = [task for task in tasks if not task.done()]
+        for task in overdue:
+            task.cancel()
+        if overdue:
+            await asyncio.wait(overdue)
+    results = []
+    for task in tasks:
+        if task in pending:
+            results.append(None)
+        elif task.exception() is not None and not return_exceptions:
+            raise task.exception()
+        else:
+            results.append(task.exception() or task.result())
+    return results
+
+
+class AsyncSingleFlight(SingleFlight):
+    """A :py:class:`~pybsd.cache.SingleFlight` that can also coalesce coroutines
+
+    Threads and coroutines are coalesced separately: a coroutine never waits for a thread, nor the other way around.
+    """
+
+    def __init__(self):
+        super(AsyncSingleFlight, self).__init__()
+        # futures are bound to an event loop, so they are kept per loop
+        self._futures = weakref.WeakKeyDictionary()
+
+    async def ado(self, key, function, *args):
+        """Awaits `function(*args)`, unless an identical call is already in flight, in which case its result is awaited.
+
+        Parameters
+        ----------
+        key : :py:class:`tuple`
+            identifies identical calls
+        function : coroutine function
+            the function to call
+        args :
+            the function's arguments
+
+        Returns
+        -------
+        :
+            the function's result. Exceptions are raised in every caller.
+        """
+        futures = self._futures.setdefault(asyncio.get_event_loop(), {})
+        future = futures.get(key)
+        if future is not None:
+            self.shared += 1
+            return await asyncio.shield(future)
+        self.executions += 1
+        future = futures[key] = asyncio.ensure_future(function(*args))
+        try:
+            return await asyncio.shield(future)
+        finally:
+            if futures.get(key) is future:
+                del futures[key]
+
+
+async def invoke(command, *args):
+    """Awaitable counterpart of :py:meth:`~pybsd.commands.BaseCommand.invoke`
+
+    The command is executed through its environment's `aexecute`, and shares its environment's `command_cache` with
+    :py:meth:`~pybsd.commands.BaseCommand.invoke`. Concurrent identical read-only invocations are coalesced if the
+    environment's `single_flight` is an :py:class:`~pybsd.aio.AsyncSingleFlight`.
+
+    Parameters
+    ----------
+    command : :py:class:`~pybsd.commands.BaseCommand`
+        The command to invoke
+    args : arguments that are passed to the command at execution time
+
+    Raises
+    ------
+    CommandNotImplementedError
+        raised when the command's binary does not exist in the host filesystem
+    CommandConnectionError
+        raised when connection to a remote host fails
+    CommandTimeoutError
+        raised when the command did not complete within its timeout
+    """
+    if not getattr(command, 'binary', None):
+        raise CommandNotImplementedError(command, command.env)
+    key = command._read_only_key(args)
+    cache = getattr(command.env, 'command_cache', None)
+    if key is not None and cache is not None:
+        found, result = cache.get(key)
+        if found:
+            return result
+    generation = cache.generation(command.env) if key is not None and cache is not None else None
+    flights = getattr(command.env, 'single_flight', None)
+    if key is not None and isinstance(flights, AsyncSingleFlight):
+        return await flights.ado(command._flight_key(key, generation), _execute, command, args, key, cache, generation)
+    return await _execute(command, args, key, cache, generation)
+
+
+async def _execute(command, args, key, cache, generation=None):
+    try:
+        result = await command.env.aexecute(command.binary, *args, **command._execute_kwargs(command.env.aexecute, args))
+    except ExecutionTimeoutError as e:
+        raise CommandTimeoutError(command, command.env, e.timeout)
+    except socket.error:
+        raise CommandConnectionError(command, command.env)
+    finally:
+        command._invalidate_cache(args)
+    command._cache_result(cache, key, args, result, generation)
+    return result
+
+
+async def ezjail_admin_list(command):
+    """Awaitable counterpart of :py:meth:`~pybsd.commands.EzjailAdmin.list`"""
+    rc, out, err = await invoke(command, 'list')
+    return command._parse_list(rc, out, err)
+
+
+async def ezjail_admin_console(command, cmd, jail_name):
+    """Awaitable counterpart of :py:meth:`~pybsd.commands.EzjailAdmin.console`"""
+    command.check_kwargs('console', cmd=cmd, jail_name=jail_name)
+    rc, out, err = await invoke(command, 'console', '-e', cmd, jail_name)
+    return out
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, print_function, unicode_literals
+
+import logging
+import sys
+import threading
+import time
+
+import six
+
+__logger__ = logging.getLogger('pybsd')
+
+
+class CommandCache(object):
+    """Caches the results of read-only commands for a limited time
+
+    Entries are keyed on (system, binary, arguments). :py:meth:`~pybsd.commands.BaseCommand.invoke` uses the cache
+    attached to a system as its `command_cache` for the subcommands a command declares as read-only, and invalidates a
+    system's entries whenever one of the subcommands it declares as mutating runs on it. Each invalidation starts a new
+    :py:meth:`generation` of the system, so that the result of a read-only command that was already running is not stored.
+
+    Example
+    -------
+    >>> from pybsd.cache import CommandCache
+    >>> cache = CommandCache()
+    >>> cache.set(('box01', 'ezjail-admin', ('list',)), (0, '', ''), ttl=10)
+    >>> cache.get(('box01', 'ezjail-admin', ('list',)))
+    (True, (0, '', ''))
+    >>> cache.invalidate('box01')
+    >>> cache.get(('box01', 'ezjail-admin', ('list',)))
+    (False, None)
+    >>> cache.hits, cache.misses
+    (1, 1)
+
+    Parameters
+    ----------
+    clock : Optional[:py:class:`function`]
+        a function returning the current time in seconds. Defaults to :py:func:`time.time`.
+    """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self._entries = {}
+        # Bumped by invalidate, for a system or for all of them
+        self._generations = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+        #: :py:class:`int`: the number of lookups that found a fresh entry
+        self.hits = 0
+        #: :py:class:`int`: the number of lookups that did not find a fresh entry
+        self.misses = 0
+
+    def get(self, key):
+        """Looks up a fresh entry
+
+        Parameters
+        ----------
+        key : :py:class:`tuple`
+            (system, binary, arguments)
+
+        Returns
+        -------
+        : :py:class:`tuple` (:py:class:`bool`, `any`)
+            whether a fresh entry was found, and its value
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > self.clock():
+                self.hits += 1
+                return True, entry[1]
+            self._entries.pop(key, None)
+            self.misses += 1
+            return False, None
+
+    def generation(self, system):
+        """Returns a system's generation, which changes whenever its entries are invalidated
+
+        Parameters
+        ----------
+        system : `any`
+
+        Returns
+        -------
+        : :py:class:`tuple`
+        """
+        with self._lock:
+            return self._generation(system)
+
+    def _generation(self, system):
+        return (self._epoch, self._generations.get(system, 0))
+
+    def set(self, key, value, ttl, generation=None):
+        """Stores an entry
+
+        Parameters
+        ----------
+        key : :py:class:`tuple`
+            (system, binary, arguments)
+        value : `any`
+            the command's result
+        ttl : :py:class:`float`
+            how long, in seconds, the entry stays fresh. Entries with a ttl <= 0 are not stored.
+        generation : Optional[:py:class:`tuple`]
+            the system's :py:meth:`generation` when the command started. The entry is not stored if the system's entries
+            were invalidated since, as the result may predate the change.
+        """
+        if ttl <= 0:
+            return
+        with self._lock:
+            if generation is not None and generation != self._generation(key[0]):
+                return
+            self._entries[key] = (self.clock() + ttl, value)
+
+    def discard(self, key):
+        """Drops an entry, if there is one. As opposed to :py:meth:`invalidate`, the system's other entries are kept and
+        its :py:meth:`generation` does not change.
+
+        Parameters
+        ----------
+        key : :py:class:`tuple`
+            (system, binary, arguments)
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate(self, system=None):
+        """Drops all the entries of a system, or all entries
+
+        Parameters
+        ----------
+        system : Optional[`any`]
+            the system whose entries are dropped. All entries are dropped if None.
+        """
+        with self._lock:
+            if system is None:
+                self._entries.clear()
+                self._epoch += 1
+            else:
+                for key in [k for k in six.iterkeys(self._entries) if k[0] == system]:
+                    del self._entries[key]
+                self._generations[system] = self._generations.get(system, 0) + 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def stats(self):
+        """:py:class:`dict`: the cache's hit and miss counters and its current number of entries"""
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self)}
+
+
+class SingleFlight(object):
+    """Coalesces concurrent identical calls into one execution whose result is shared by every caller
+
+    :py:meth:`~pybsd.commands.BaseCommand.invoke` uses the object attached to a system as its `single_flight` for the
+    subcommands a command declares as read-only, so that bursty readers cost one process per system instead of one per
+    caller. When the system also has a `command_cache`, its :py:meth:`~pybsd.cache.CommandCache.generation` is part of
+    the key, so that a call never joins a flight that started before the system was invalidated.
+
+    Example
+    -------
+    >>> from pybsd.cache import SingleFlight
+    >>> flights = SingleFlight()
+    >>> flights.do(('box01', 'ezjail-admin', ('list',)), lambda: 'result')
+    'result'
+    >>> flights.executions, flights.shared
+    (1, 0)
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        #: :py:class:`int`: the number of calls that were actually executed
+        self.executions = 0
+        #: :py:class:`int`: the number of calls that were served the result of an identical call in flight
+        self.shared = 0
+
+    def do(self, key, function, *args):
+        """Calls `function`, unless an identical call is already in flight, in which case its result is waited for.
+
+        Parameters
+        ----------
+        key : :py:class:`tuple`
+            identifies identical calls
+        function : :py:class:`function`
+            the function to call
+        args :
+            the function's arguments
+
+        Returns
+        -------
+        :
+            the function's result. Exceptions are raised in every caller.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+                leader = True
+            else:
+                self.shared += 1
+                leader = False
+        if not leader:
+            call.done.wait()
+            if call.exc_info is not None:
+                six.reraise(*call.exc_info)
+            return call.result
+        try:
+            call.result = function(*args)
+            return call.result
+        except BaseException:
+            call.exc_info = sys.exc_info()
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class _Call(object):
+    # A call in flight
+    __slots__ = ('done', 'result', 'exc_info')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.exc_info = None
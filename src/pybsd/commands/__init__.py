@@ -5,5 +5,8 @@ import logging
 
 from .base import BaseCommand  # noqa
 from .ezjail_admin import EzjailAdmin  # noqa
+from .ezjail_config import EzjailConfig  # noqa
+from .jexec import Jexec  # noqa
+from .jls import Jls  # noqa
 
 __logger__ = logging.getLogger('pybsd')
@@ -4,7 +4,9 @@ from __future__ import absolute_import, print_function, unicode_literals
 import logging
 import socket
 
-from ..exceptions import CommandConnectionError, CommandNotImplementedError, InvalidCommandExecutorError, InvalidCommandNameError
+from .. import utils
+from ..exceptions import (CommandConnectionError, CommandNotImplementedError, CommandTimeoutError, ExecutionTimeoutError,
+                          InvalidCommandExecutorError, InvalidCommandNameError)
 
 __logger__ = logging.getLogger('pybsd')
 
@@ -23,6 +25,19 @@ class BaseCommand(object):
         a name that identifies the command.
     binary : :py:class:`str`
         The path of the command binary on the host filesystem.
+    read_only_subcommands : :py:class:`tuple`
+        The subcommands whose results can be cached by the system's `command_cache`, as they do not change its state.
+    mutating_subcommands : :py:class:`tuple`
+        The subcommands that change the system's state. Running one of them drops the system's cached results.
+    cache_ttls : :py:class:`dict`
+        How long, in seconds, the results of each read-only subcommand stay fresh. Defaults to `default_cache_ttl`.
+    default_cache_ttl : :py:class:`float`
+        How long, in seconds, the results of read-only subcommands absent from `cache_ttls` stay fresh.
+    timeouts : :py:class:`dict`
+        How long, in seconds, each subcommand may run. Defaults to `default_timeout`.
+    default_timeout : :py:class:`float`
+        How long, in seconds, subcommands absent from `timeouts` may run. None, the default, defers to the executor's
+        `timeout`.
 
     Raises
     ------
@@ -34,9 +49,17 @@ class BaseCommand(object):
         raised when the command's binary does not exist in the host filesystem
     CommandConnectionError
         raised when connection to a remote host fails
+    CommandTimeoutError
+        raised when the command did not complete within its timeout
     """
     name = None
     binary = None
+    read_only_subcommands = ()
+    mutating_subcommands = ()
+    cache_ttls = {}
+    default_cache_ttl = 10
+    timeouts = {}
+    default_timeout = None
 
     def __init__(self, env):
         if not getattr(self, 'name', None):
@@ -49,6 +72,12 @@ class BaseCommand(object):
     def invoke(self, *args):
         """Executes the command, passing it arguments.
 
+        If the system has a `command_cache`, the results of read-only subcommands are served from it while they are fresh,
+        and mutating subcommands invalidate the system's cached results. If the system has a `single_flight`, concurrent
+        identical invocations of read-only subcommands share one execution. If the system's executor has an
+        `instrumentation`, the invocation is accounted under (system name, command name, subcommand). Overdue invocations
+        are terminated, see `timeouts`.
+
         Parameters
         ----------
         args : arguments that are passed to the command at execution time
@@ -59,15 +88,158 @@ class BaseCommand(object):
             raised when the command's binary does not exist in the host filesystem
         CommandConnectionError
             raised when connection to a remote host fails
+        CommandTimeoutError
+            raised when the command did not complete within its timeout
+        """
+        if not getattr(self, 'binary', None):
+            raise CommandNotImplementedError(self, self.env)
+        key = self._read_only_key(args)
+        cache = getattr(self.env, 'command_cache', None)
+        if key is not None and cache is not None:
+            found, result = cache.get(key)
+            if found:
+                return result
+        generation = cache.generation(self.env) if key is not None and cache is not None else None
+        flights = getattr(self.env, 'single_flight', None)
+        if key is not None and flights is not None:
+            # Calls made after an invalidation do not join a flight that started before it
+            return flights.do(self._flight_key(key, generation), self._execute, args, key, cache, generation)
+        return self._execute(args, key, cache, generation)
+
+    def uncache(self, *args):
+        """Drops the cached result of an invocation of a read-only subcommand from the system's `command_cache`, if it has
+        one, so that the next identical invocation executes the command. The system's other cached results are kept.
+
+        Parameters
+        ----------
+        args : the invocation's arguments
+        """
+        key = self._read_only_key(args)
+        cache = getattr(self.env, 'command_cache', None)
+        if key is not None and cache is not None:
+            cache.discard(key)
+
+    def _execute(self, args, key, cache, generation=None):
+        try:
+            result = self._call(self.binary, args)
+        finally:
+            self._invalidate_cache(args)
+        self._cache_result(cache, key, args, result, generation)
+        return result
+
+    def _call(self, binary, args):
+        # Runs a binary on the system, turning the executor's errors into the command's
+        try:
+            return self.env.execute(binary, *args, **self._execute_kwargs(self.env.execute, args))
+        except ExecutionTimeoutError as e:
+            raise CommandTimeoutError(self, self.env, e.timeout)
+        except socket.error:
+            raise CommandConnectionError(self, self.env)
+
+    def _call_batch(self, invocations):
+        # Runs many invocations of the command as a single batch, with the error, timeout, instrumentation and
+        # invalidation handling of `_execute`. The invocations share a subcommand, whose timeout applies to each of them
+        args = invocations[0]
+        kwargs = self._execute_kwargs(self.env.execute, args)
+        if 'timeout' in kwargs:
+            kwargs['timeout'] *= len(invocations)
+        batch = self.env.execute.batch(**kwargs)
+        for args in invocations:
+            batch.add(self.binary, *args)
+        try:
+            results = batch.run()
+        except socket.error:
+            raise CommandConnectionError(self, self.env)
+        finally:
+            self._invalidate_cache(args)
+        if batch.timed_out:
+            __logger__.warning('%s %s timed out after %s invocations', self.name, self._subcommand(args),
+                               sum(result is not None for result in results))
+        return results
+
+    def _subcommand(self, args):
+        return args[0] if args else None
+
+    def _execute_kwargs(self, executor, args):
+        # Instrumented executors account invocations under (system, command, subcommand), and timeouts are passed along
+        kwargs = {}
+        if getattr(executor, 'instrumentation', None) is not None:
+            kwargs['tag'] = (self.env.name, self.name, self._subcommand(args))
+        timeout = self.timeouts.get(self._subcommand(args), self.default_timeout)
+        if timeout is not None:
+            kwargs['timeout'] = timeout
+        return kwargs
+
+    def _read_only_key(self, args):
+        # Identifies invocations of read-only subcommands, whose results can be cached and shared
+        if self._subcommand(args) not in self.read_only_subcommands:
+            return None
+        return (self.env, self.binary, tuple(args))
 
+    def _flight_key(self, key, generation):
+        # Flights are keyed by the system's mutation count, so that they are never joined across a mutation, whether the
+        # system has a cache or not
+        return key + (getattr(self.env, 'mutations', 0), generation)
+
+    def _cache_result(self, cache, key, args, result, generation=None):
+        # Failed invocations are not cached, nor are those that overlapped an invalidation of the system
+        if cache is None or key is None or (isinstance(result, tuple) and result and result[0]):
+            return
+        cache.set(key, result, self.cache_ttls.get(self._subcommand(args), self.default_cache_ttl), generation)
+
+    def _invalidate_cache(self, args):
+        # Systems that cache more than command results, such as masters and their jail snapshot, invalidate it all
+        if self._subcommand(args) not in self.mutating_subcommands:
+            return
+        invalidate = getattr(self.env, 'invalidate', None)
+        cache = getattr(self.env, 'command_cache', None)
+        if invalidate is not None:
+            invalidate()
+            return
+        self.env.mutations = getattr(self.env, 'mutations', 0) + 1
+        if cache is not None:
+            cache.invalidate(self.env)
+
+    def invoke_stream(self, *args):
+        """Executes the command, passing it arguments, and returns an iterator over its stdout lines as they are produced.
+
+        Parameters
+        ----------
+        args : arguments that are passed to the command at execution time
+
+        Returns
+        -------
+        : :py:class:`~pybsd.executors.StreamResult`
+            see :py:meth:`~pybsd.executors.Executor.stream`
+
+        Raises
+        ------
+        CommandNotImplementedError
+            raised when the command's binary does not exist in the host filesystem
+        CommandConnectionError
+            raised when connection to a remote host fails
         """
         if not getattr(self, 'binary', None):
             raise CommandNotImplementedError(self, self.env)
         try:
-            return self.env.execute(self.binary, *args)
+            return self.env.execute.stream(self.binary, *args)
         except socket.error:
             raise CommandConnectionError(self, self.env)
 
+    def ainvoke(self, *args):
+        """Awaitable counterpart of :py:meth:`invoke`, executed through the environment's `aexecute`. Requires python >= 3.5
+
+        Parameters
+        ----------
+        args : arguments that are passed to the command at execution time
+
+        Returns
+        -------
+        : coroutine
+            resolves to the same value as :py:meth:`invoke`
+        """
+        return utils.import_aio().invoke(self, *args)
+
     def __repr__(self):
         # Maps the command's string representation to its name
         #
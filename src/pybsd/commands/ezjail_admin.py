@@ -1,10 +1,19 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, print_function, unicode_literals
 
+import hashlib
+import itertools
 import logging
 
 import lazy
+import six
 
+try:
+    from collections.abc import ItemsView, KeysView, Mapping, ValuesView
+except ImportError:  # pragma: no cover
+    from collections import ItemsView, KeysView, Mapping, ValuesView
+
+from .. import utils
 from ..exceptions import InvalidOutputError, SubprocessError, WhitespaceError
 from .base import BaseCommand
 
@@ -15,6 +24,13 @@ class EzjailAdmin(BaseCommand):
     """Provides an interface to the ezjail-admin command"""
 
     name = 'ezjail-admin'
+    read_only_subcommands = ('list',)
+    mutating_subcommands = ('archive', 'config', 'create', 'delete', 'install', 'restart', 'restore', 'start', 'stop', 'update')
+    cache_ttls = {'list': 10}
+    # The `-c` arguments of `create`, by jail type. Directory tree based jails (`D`) take none.
+    image_types = {'Z': 'zfs', 'E': 'eli', 'B': 'bde'}
+    #: :py:class:`int`: the largest number of jails passed to a single invocation by the bulk methods
+    bulk_size = 256
 
     @property
     def binary(self):
@@ -40,7 +56,10 @@ class EzjailAdmin(BaseCommand):
         rc, out, err = self.invoke('list')
         if rc:
             raise SubprocessError(self, self.env, err.strip(), 'list_headers')
-        lines = out.splitlines()
+        return self._parse_headers(out.splitlines())
+
+    def _parse_headers(self, lines):
+        # Checks the header lines and returns the fields of the rows following them, in order
         if len(lines) < 2:
             raise InvalidOutputError(self, self.env, u'output too short', 'list')
         headers = []
@@ -57,31 +76,112 @@ class EzjailAdmin(BaseCommand):
             raise InvalidOutputError(self, self.env, u"output has unknown headers\n['{}']".format(u"', '".join(headers)), 'list')
         return ('status', 'jid', 'ip', 'name', 'root')
 
-    def list(self):
-        headers = self.list_headers
-        rc, out, err = self.invoke('list')
-        if rc:
-            raise SubprocessError(self, self.env, err.strip(), 'list')
-        lines = out.splitlines()
-        jails = {}
-        current_jail = None
-        for line in lines[2:]:
+    def _iter_rows(self, lines, headers):
+        # Yields (name, entry) tuples from the rows following the headers. A jail is only yielded once
+        # the next one starts, as its additional ips come on the following lines. Rows are split on whitespace rather
+        # than sliced at the columns' offsets, as ips and hostnames longer than their column push the following ones
+        maxsplit = len(headers) - 1
+        current = None
+        for line in lines:
             if line[0:4] != '    ':
-                line = line.strip()
-                if not line:
+                fields = line.split(None, maxsplit)
+                if not fields:
                     continue
-                entry = dict(zip(headers, line.split()))
-                entry['ips'] = [entry['ip']]
-                current_jail = jails[entry.pop('name')] = entry
+                if len(fields) <= maxsplit:
+                    raise InvalidOutputError(self, self.env, u'malformed row\n{}'.format(line), 'list')
+                fields[maxsplit] = fields[maxsplit].rstrip()
+                if current is not None:
+                    yield current.name, current
+                current = JailEntry(*fields)
             else:
-                line = line.strip()
-                if not line:
-                    continue
-                if_ip = line.split()[1]
-                ip = if_ip.split('|')[1]
-                current_jail['ips'].append(ip)
+                fields = line.split(None, 2)
+                if len(fields) > 1 and current is not None:
+                    current.ips.append(fields[1].rpartition('|')[2])
+        if current is not None:
+            yield current.name, current
+
+    def _parse_list(self, rc, out, err, previous=None):
+        # Parses headers and rows out of a single `list` invocation, unless its output is the one `previous` was parsed from
+        if rc:
+            raise SubprocessError(self, self.env, err.strip(), 'list')
+        digest = _digest(out)
+        if previous is not None and previous.digest == digest:
+            return previous
+        lines = out.splitlines()
+        jails = JailList()
+        jails.update(self._iter_rows(itertools.islice(lines, 2, None), self._parse_headers(lines)))
+        jails.digest = digest
         return jails
 
+    def list(self, previous=None):
+        """Lists the host's jails, out of a single invocation of `ezjail-admin list`
+
+        Parameters
+        ----------
+        previous : Optional[:py:class:`~pybsd.commands.ezjail_admin.JailList`]
+            a listing returned by an earlier call. If ezjail-admin's output did not change since, it is returned as is
+            instead of parsing the output again.
+
+        Returns
+        -------
+        : :py:class:`~pybsd.commands.ezjail_admin.JailList`
+            the jails' :py:class:`~pybsd.commands.ezjail_admin.JailEntry`, indexed by name, jid and ip
+
+        Raises
+        ------
+        SubprocessError
+            raised if ezjail-admin returned an error
+        InvalidOutputError
+            raised if the output does not start with the expected headers
+        """
+        return self._parse_list(*self.invoke('list'), previous=previous)
+
+    def iter_list(self):
+        """Streaming counterpart of :py:meth:`list`. Jails are parsed as ezjail-admin's output arrives, so memory usage
+        does not grow with the number of jails on the host.
+
+        Headers and rows are parsed from a single invocation.
+
+        Returns
+        -------
+        : generator
+            yields a (name, :py:class:`~pybsd.commands.ezjail_admin.JailEntry`) :py:class:`tuple` per jail
+
+        Raises
+        ------
+        SubprocessError
+            raised once the output is exhausted if ezjail-admin returned an error
+        InvalidOutputError
+            raised if the output does not start with the expected headers
+        """
+        lines = self.invoke_stream('list')
+        try:
+            try:
+                headers = self._parse_headers(list(itertools.islice(lines, 2)))
+            except InvalidOutputError:
+                lines.close()
+                if lines.rc:
+                    raise SubprocessError(self, self.env, lines.err.strip(), 'list')
+                raise
+            for jail in self._iter_rows(lines, headers):
+                yield jail
+        finally:
+            lines.close()
+        if lines.rc:
+            raise SubprocessError(self, self.env, lines.err.strip(), 'list')
+
+    def alist(self):
+        """Awaitable counterpart of :py:meth:`list`, executed through the environment's `aexecute`. Requires python >= 3.5
+
+        Headers and rows are parsed from a single invocation.
+
+        Returns
+        -------
+        : coroutine
+            resolves to the same value as :py:meth:`list`
+        """
+        return utils.import_aio().ezjail_admin_list(self)
+
     def console(self, cmd, jail_name):
         self.check_kwargs('console', cmd=cmd, jail_name=jail_name)
         rc, out, err = self.invoke('console',
@@ -90,54 +190,408 @@ class EzjailAdmin(BaseCommand):
                                    jail_name)
         return out
 
-    # subcommands to be implemented:
-    # def __ezjail_admin(self, subcommand, **kwargs):
-    #     # make sure there is no whitespace in the arguments
-    #     for key, value in kwargs.items():
-    #         if value is None:
-    #             continue
-    #         if subcommand == 'console' and key == 'cmd':
-    #             continue
-    #         if len(value.split()) != 1:
-    #             __logger__.error('The value `%s` of kwarg `%s` contains whitespace', value, key)
-    #             sys.exit(1)
-    #     if subcommand == 'console':
-    #         return self._ezjail_admin(
-    #             'console',
-    #             '-e',
-    #             kwargs['cmd'],
-    #             kwargs['name'])
-    #     elif subcommand == 'create':
-    #         args = [
-    #             'create',
-    #             '-c', 'zfs']
-    #         flavour = kwargs.get('flavour')
-    #         if flavour is not None:
-    #             args.extend(['-f', flavour])
-    #         args.extend([
-    #             kwargs['name'],
-    #             kwargs['ip']])
-    #         rc, out, err = self._ezjail_admin(*args)
-    #         if rc:
-    #             raise SubprocessError(self, self.env, err.strip(), 'create')
-    #     elif subcommand == 'delete':
-    #         rc, out, err = self._ezjail_admin(
-    #             'delete',
-    #             '-fw',
-    #             kwargs['name'])
-    #         if rc:
-    #             raise SubprocessError(self, self.env, err.strip(), 'delete')
-    #     elif subcommand == 'start':
-    #         rc, out, err = self._ezjail_admin(
-    #             'start',
-    #             kwargs['name'])
-    #         if rc:
-    #             raise SubprocessError(self, self.env, err.strip(), 'start')
-    #     elif subcommand == 'stop':
-    #         rc, out, err = self._ezjail_admin(
-    #             'stop',
-    #             kwargs['name'])
-    #         if rc:
-    #             raise SubprocessError(self, self.env, err.strip(), 'stop')
-    #     else:
-    #         raise ValueError('Unknown subcommand `%s`' % subcommand)
+    def aconsole(self, cmd, jail_name):
+        """Awaitable counterpart of :py:meth:`console`, executed through the environment's `aexecute`. Requires python >= 3.5
+
+        Returns
+        -------
+        : coroutine
+            resolves to the same value as :py:meth:`console`
+        """
+        return utils.import_aio().ezjail_admin_console(self, cmd, jail_name)
+
+    def _mutate(self, subcommand, *args):
+        # Runs a subcommand that changes the host's state, failing if ezjail-admin does
+        rc, out, err = self.invoke(subcommand, *args)
+        if rc:
+            raise SubprocessError(self, self.env, utils.safe_text(err), subcommand)
+        return out
+
+    def create(self, jail_name, ips, flavour=None, jail_type=None):
+        """Creates a jail
+
+        Parameters
+        ----------
+        jail_name : :py:class:`str`
+            the jail's name, usually its hostname
+        ips : :py:class:`str` or :py:class:`list` [:py:class:`str`]
+            the jail's ips, as a list or as ezjail's comma separated string, where each ip can be prefixed with an
+            interface, as in `lo1|127.0.1.41`
+        flavour : Optional[:py:class:`str`]
+            the flavour the jail is created from
+        jail_type : Optional[:py:class:`str`]
+            the jail's type, see :py:attr:`~pybsd.systems.jails.Jail.jail_type`. Defaults to the master's
+            `default_jail_type`.
+
+        Raises
+        ------
+        WhitespaceError
+            raised if an argument contains whitespace
+        SubprocessError
+            raised if ezjail-admin returned an error
+        """
+        if not isinstance(ips, six.string_types):
+            ips = ','.join(ips)
+        self.check_kwargs('create', jail_name=jail_name, ips=ips, flavour=flavour, jail_type=jail_type)
+        args = []
+        image_type = self.image_types.get(jail_type or getattr(self.env, 'default_jail_type', None))
+        if image_type is not None:
+            args.extend(['-c', image_type])
+        if flavour is not None:
+            args.extend(['-f', flavour])
+        self._mutate('create', *(args + [jail_name, ips]))
+
+    def delete(self, jail_name, wipe=True):
+        """Stops a jail if it is running, and deletes it
+
+        Parameters
+        ----------
+        jail_name : :py:class:`str`
+        wipe : Optional[:py:class:`bool`]
+            whether the jail's root directory is deleted too
+
+        Raises
+        ------
+        WhitespaceError
+            raised if the jail's name contains whitespace
+        SubprocessError
+            raised if ezjail-admin returned an error
+        """
+        self.check_kwargs('delete', jail_name=jail_name)
+        self._mutate('delete', '-fw' if wipe else '-f', jail_name)
+
+    def start(self, jail_name):
+        """Starts a jail
+
+        Parameters
+        ----------
+        jail_name : :py:class:`str`
+
+        Raises
+        ------
+        WhitespaceError
+            raised if the jail's name contains whitespace
+        SubprocessError
+            raised if ezjail-admin returned an error
+        """
+        self.check_kwargs('start', jail_name=jail_name)
+        self._mutate('start', jail_name)
+
+    def stop(self, jail_name):
+        """Stops a jail
+
+        Parameters
+        ----------
+        jail_name : :py:class:`str`
+
+        Raises
+        ------
+        WhitespaceError
+            raised if the jail's name contains whitespace
+        SubprocessError
+            raised if ezjail-admin returned an error
+        """
+        self.check_kwargs('stop', jail_name=jail_name)
+        self._mutate('stop', jail_name)
+
+    def restart(self, jail_name):
+        """Restarts a jail
+
+        Parameters
+        ----------
+        jail_name : :py:class:`str`
+
+        Raises
+        ------
+        WhitespaceError
+            raised if the jail's name contains whitespace
+        SubprocessError
+            raised if ezjail-admin returned an error
+        """
+        self.check_kwargs('restart', jail_name=jail_name)
+        self._mutate('restart', jail_name)
+
+    def _many(self, subcommand, jail_names, running):
+        # start, stop and restart take any number of jails: they are passed to as few invocations as `bulk_size` allows,
+        # then whether each jail reached the expected state is read from a single listing
+        jail_names = list(jail_names)
+        for jail_name in jail_names:
+            self.check_kwargs(subcommand, jail_name=jail_name)
+        if not jail_names:
+            return {}
+        for offset in range(0, len(jail_names), self.bulk_size):
+            rc, out, err = self.invoke(subcommand, *jail_names[offset:offset + self.bulk_size])
+            if rc:
+                __logger__.warning('ezjail-admin %s returned %s: %s', subcommand, rc, utils.safe_text(err))
+        jails = self.list()
+        return dict((jail_name, jail_name in jails and (jails[jail_name].status[1:2] == 'R') == running)
+                    for jail_name in jail_names)
+
+    def start_many(self, jail_names):
+        """Starts many jails, with as few invocations of ezjail-admin as `bulk_size` allows
+
+        Parameters
+        ----------
+        jail_names : iterable of :py:class:`str`
+
+        Returns
+        -------
+        : :py:class:`dict`
+            whether each jail is running afterwards, indexed by name
+
+        Raises
+        ------
+        WhitespaceError
+            raised if a jail's name contains whitespace, before any jail is started
+        """
+        return self._many('start', jail_names, running=True)
+
+    def stop_many(self, jail_names):
+        """Stops many jails, with as few invocations of ezjail-admin as `bulk_size` allows
+
+        Parameters
+        ----------
+        jail_names : iterable of :py:class:`str`
+
+        Returns
+        -------
+        : :py:class:`dict`
+            whether each jail is stopped afterwards, indexed by name. Jails that do not exist are not stopped.
+
+        Raises
+        ------
+        WhitespaceError
+            raised if a jail's name contains whitespace, before any jail is stopped
+        """
+        return self._many('stop', jail_names, running=False)
+
+    def restart_many(self, jail_names):
+        """Restarts many jails, with as few invocations of ezjail-admin as `bulk_size` allows
+
+        Parameters
+        ----------
+        jail_names : iterable of :py:class:`str`
+
+        Returns
+        -------
+        : :py:class:`dict`
+            whether each jail is running afterwards, indexed by name
+
+        Raises
+        ------
+        WhitespaceError
+            raised if a jail's name contains whitespace, before any jail is restarted
+        """
+        return self._many('restart', jail_names, running=True)
+
+    def delete_many(self, jail_names, wipe=True):
+        """Deletes many jails. ezjail-admin deletes one jail per invocation, so the invocations are run as a single
+        :py:class:`~pybsd.executors.Batch`, at the cost of one process spawn or remote round-trip. The `delete` timeout
+        applies to each invocation.
+
+        Parameters
+        ----------
+        jail_names : iterable of :py:class:`str`
+        wipe : Optional[:py:class:`bool`]
+            whether the jails' root directories are deleted too
+
+        Returns
+        -------
+        : :py:class:`dict`
+            whether each jail was deleted, indexed by name
+
+        Raises
+        ------
+        WhitespaceError
+            raised if a jail's name contains whitespace, before any jail is deleted
+        CommandConnectionError
+            raised when connection to a remote host fails
+        """
+        jail_names = list(jail_names)
+        for jail_name in jail_names:
+            self.check_kwargs('delete', jail_name=jail_name)
+        if not jail_names:
+            return {}
+        results = self._call_batch([('delete', '-fw' if wipe else '-f', jail_name) for jail_name in jail_names])
+        deleted = {}
+        for jail_name, result in zip(jail_names, results):
+            deleted[jail_name] = result is not None and result[0] == 0
+            if not deleted[jail_name]:
+                __logger__.warning('ezjail-admin delete %s failed: %s', jail_name,
+                                   'skipped' if result is None else utils.safe_text(result[2]))
+        return deleted
+
+
+def _digest(out):
+    # Fingerprints a command's output, whether text or undecoded
+    view = getattr(out, 'view', None)
+    return hashlib.sha1(view if view is not None else out.encode('utf-8')).hexdigest()
+
+
+class JailEntry(object):
+    """A jail, as listed by ezjail-admin. It can be read as a :py:class:`dict` of its fields, minus its name. It is
+    registered as a :py:class:`~collections.abc.Mapping` rather than extending it, as the python 2 abstract base classes
+    are not slotted.
+
+    Parameters
+    ----------
+    status : :py:class:`str`
+        The jail's status, such as `ZR`
+    jid : :py:class:`str`
+        The jail's id, `N/A` if it is not running
+    ip : :py:class:`str`
+        The jail's main ip
+    name : :py:class:`str`
+        The jail's hostname
+    root : :py:class:`str`
+        The jail's root directory
+    """
+    __slots__ = ('status', 'jid', 'ip', 'name', 'root', 'ips')
+    fields = ('status', 'jid', 'ip', 'ips', 'root')
+
+    def __init__(self, status, jid, ip, name, root):
+        self.status = status
+        self.jid = jid
+        self.ip = ip
+        self.name = name
+        self.root = root
+        #: :py:class:`list` [:py:class:`str`]: all the jail's ips, starting with the main one
+        self.ips = [ip]
+
+    def __getitem__(self, key):
+        if key not in self.fields:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self):
+        return iter(self.fields)
+
+    def __len__(self):
+        return len(self.fields)
+
+    def __contains__(self, key):
+        return key in self.fields
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.fields else default
+
+    def keys(self):
+        return KeysView(self)
+
+    def items(self):
+        return ItemsView(self)
+
+    def values(self):
+        return ValuesView(self)
+
+    def __eq__(self, other):
+        if not isinstance(other, Mapping):
+            return NotImplemented
+        return dict(self.items()) == dict(other.items())
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '{}({!r}, jid={!r}, ips={!r})'.format(self.__class__.__name__, self.name, self.jid, self.ips)
+
+
+Mapping.register(JailEntry)
+
+
+class JailList(dict):
+    """The jails listed by ezjail-admin, as a :py:class:`dict` of :py:class:`~pybsd.commands.ezjail_admin.JailEntry`
+    indexed by name. They can also be looked up by jid and ip, through indexes that are built on first lookup, and
+    dropped whenever the listing is changed.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(JailList, self).__init__(*args, **kwargs)
+        self._jids = self._ips = None
+        #: Optional[:py:class:`str`]: the digest of the output the listing was parsed from
+        self.digest = None
+
+    def __setitem__(self, name, entry):
+        super(JailList, self).__setitem__(name, entry)
+        self._jids = self._ips = None
+
+    def __delitem__(self, name):
+        super(JailList, self).__delitem__(name)
+        self._jids = self._ips = None
+
+    def update(self, *args, **kwargs):
+        super(JailList, self).update(*args, **kwargs)
+        self._jids = self._ips = None
+
+    def setdefault(self, name, entry=None):
+        self._jids = self._ips = None
+        return super(JailList, self).setdefault(name, entry)
+
+    def pop(self, *args):
+        self._jids = self._ips = None
+        return super(JailList, self).pop(*args)
+
+    def popitem(self):
+        self._jids = self._ips = None
+        return super(JailList, self).popitem()
+
+    def clear(self):
+        super(JailList, self).clear()
+        self._jids = self._ips = None
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def _index(self):
+        self._jids = {}
+        self._ips = {}
+        for entry in self.values():
+            if entry.jid.isdigit():
+                self._jids[entry.jid] = entry
+            for ip in entry.ips:
+                self._ips[ip.split('/', 1)[0]] = entry
+
+    def by_jid(self, jid):
+        """Returns the running jail that has a given jid
+
+        Parameters
+        ----------
+        jid : :py:class:`int` or :py:class:`str`
+
+        Returns
+        -------
+        : :py:class:`~pybsd.commands.ezjail_admin.JailEntry`
+
+        Raises
+        ------
+        KeyError
+            raised if no running jail has that jid
+        """
+        if self._jids is None:
+            self._index()
+        return self._jids['{}'.format(jid)]
+
+    def by_ip(self, ip):
+        """Returns the jail that has a given ip
+
+        Parameters
+        ----------
+        ip : :py:class:`str`
+            the ip, with or without its prefix length
+
+        Returns
+        -------
+        : :py:class:`~pybsd.commands.ezjail_admin.JailEntry`
+
+        Raises
+        ------
+        KeyError
+            raised if no jail has that ip
+        """
+        if self._ips is None:
+            self._index()
+        return self._ips[ip.split('/', 1)[0]]
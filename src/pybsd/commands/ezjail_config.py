@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, print_function, unicode_literals
+
+import hashlib
+import io
+import logging
+import os
+
+from ..exceptions import InvalidOutputError
+from .ezjail_admin import JailEntry, JailList
+
+__logger__ = logging.getLogger('pybsd')
+
+
+class EzjailConfig(object):
+    """Reads ezjail's jail inventory straight from its configuration files, without running ezjail-admin
+
+    ezjail keeps a shell file of `export jail_<name>_<key>="<value>"` lines per jail in its configuration directory,
+    suffixed with `.norun` for the jails that are not started at boot, and the jid of each running jail in
+    `/var/run/jail_<name>.id`. Both are read under `root`, which makes it possible to read a host's filesystem mounted
+    elsewhere, or a fixture tree. As opposed to `ezjail-admin list`, mounted but stopped image jails are reported
+    as stopped.
+
+    It can be set as a master's :py:attr:`~pybsd.systems.masters.Master.state_source`.
+
+    Parameters
+    ----------
+    env : :py:class:`~pybsd.systems.masters.Master`
+        The master whose jails are read
+    root : Optional[:py:class:`str`]
+        The path the host's filesystem is read under
+
+    Attributes
+    ----------
+    config_dir : :py:class:`str`
+        ezjail's configuration directory, relative to `root`
+    run_dir : :py:class:`str`
+        The directory of the jails' jid files, relative to `root`
+    """
+    name = 'ezjail-config'
+    config_dir = 'usr/local/etc/ezjail'
+    run_dir = 'var/run'
+    # The image types ezjail-admin list reports, by their status letter. Jails without an image are directory based.
+    image_types = {'simple': 'I', 'eli': 'E', 'bde': 'B', 'zfs': 'Z'}
+
+    def __init__(self, env, root='/'):
+        self.env = env
+        self.root = root
+
+    def _read(self, *path):
+        with io.open(os.path.join(self.root, *path), 'rb') as f:
+            return f.read()
+
+    def _parse_config(self, safename, data):
+        # Parses the `export jail_<safename>_<key>="<value>"` lines of a jail's configuration file
+        prefix = 'export jail_{}_'.format(safename)
+        config = {}
+        for line in data.decode('utf-8').splitlines():
+            line = line.strip()
+            if not line.startswith(prefix):
+                continue
+            key, sep, value = line[len(prefix):].partition('=')
+            if not sep:
+                raise InvalidOutputError(self, self.env, u'malformed line\n{}'.format(line), 'list')
+            if len(value) > 1 and value[0] == value[-1] and value[0] in '"\'':
+                value = value[1:-1]
+            config[key] = value
+        return config
+
+    def _entry(self, config, jid, norun):
+        ips = [ip.strip().rpartition('|')[2] for ip in config.get('ip', '').split(',') if ip.strip()]
+        status = self.image_types.get(config.get('imagetype'), 'D') + ('R' if jid else 'S') + ('N' if norun else '')
+        entry = JailEntry(status, jid or 'N/A', ips[0] if ips else '', config['hostname'], config.get('rootdir', ''))
+        entry.ips.extend(ips[1:])
+        return entry
+
+    def list(self, previous=None):
+        """Lists the host's jails, as :py:meth:`~pybsd.commands.EzjailAdmin.list` does, out of ezjail's files
+
+        Parameters
+        ----------
+        previous : Optional[:py:class:`~pybsd.commands.ezjail_admin.JailList`]
+            a listing returned by an earlier call. If none of the files changed since, it is returned as is instead of
+            parsing them again.
+
+        Returns
+        -------
+        : :py:class:`~pybsd.commands.ezjail_admin.JailList`
+            the jails' :py:class:`~pybsd.commands.ezjail_admin.JailEntry`, indexed by name, jid and ip
+
+        Raises
+        ------
+        InvalidOutputError
+            raised if a configuration file is malformed, or does not define the jail's hostname
+        """
+        try:
+            filenames = sorted(os.listdir(os.path.join(self.root, self.config_dir)))
+        except OSError as e:
+            raise InvalidOutputError(self, self.env, u'no configuration directory: {}'.format(e), 'list')
+        digest = hashlib.sha1()
+        files = []
+        for filename in filenames:
+            safename, norun = filename, False
+            if filename.endswith('.norun'):
+                safename, norun = filename[:-len('.norun')], True
+            if safename.startswith('.') or not os.path.isfile(os.path.join(self.root, self.config_dir, filename)):
+                continue
+            data = self._read(self.config_dir, filename)
+            try:
+                jid = self._read(self.run_dir, 'jail_{}.id'.format(safename)).strip().decode('utf-8')
+            except (IOError, OSError):
+                jid = ''
+            digest.update('{}\0{}\0'.format(filename, jid).encode('utf-8'))
+            digest.update(data)
+            files.append((safename, data, jid, norun))
+        digest = digest.hexdigest()
+        if previous is not None and previous.digest == digest:
+            return previous
+        jails = JailList()
+        for safename, data, jid, norun in files:
+            config = self._parse_config(safename, data)
+            if 'hostname' not in config:
+                raise InvalidOutputError(self, self.env, u'no hostname for `{}`'.format(safename), 'list')
+            entry = self._entry(config, jid, norun)
+            jails[entry.name] = entry
+        jails.digest = digest
+        return jails
+
+    def __repr__(self):
+        # Maps the reader's string representation to its name
+        #
+        # Returns
+        # -------
+        # : :py:class:`str`
+        #     the reader's name
+        return self.name
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, print_function, unicode_literals
+
+import hashlib
+import logging
+
+from six.moves import shlex_quote
+
+from ..exceptions import InvalidOutputError, SubprocessError
+from .base import BaseCommand
+
+__logger__ = logging.getLogger('pybsd')
+
+# Runs a command in each jail whose jid is passed after it, framing each jail's output on stdout and stderr between
+# boundary lines. The end line on stdout carries the command's return code.
+FAN_OUT_SCRIPT = '''cmd=$1
+shift
+for jid; do
+    printf '{boundary} start %s\\n' "$jid"
+    printf '{boundary} start %s\\n' "$jid" >&2
+    {jexec} "$jid" {shell} -c "$cmd" </dev/null
+    rc=$?
+    printf '\\n{boundary} end %s %s\\n' "$jid" "$rc"
+    printf '\\n{boundary} end %s\\n' "$jid" >&2
+done
+'''
+
+
+class Jexec(BaseCommand):
+    """Provides an interface to the jexec command, which runs commands in jails by jid
+
+    As opposed to :py:meth:`~pybsd.commands.EzjailAdmin.console`, commands are not run through ezjail-admin's shell
+    script, and :py:meth:`fan_out` runs a command in many jails with a single invocation on the host.
+
+    Attributes
+    ----------
+    shell : :py:class:`str`
+        The shell commands are run with, in the jails and, for :py:meth:`fan_out`, on the host
+    """
+
+    name = 'jexec'
+    shell = '/bin/sh'
+
+    @property
+    def binary(self):
+        return self.env.jexec_binary
+
+    def _subcommand(self, args):
+        # jexec has no subcommands: fan-outs run the host's shell, anything else a single jail's
+        return 'fan_out' if args[:1] == ('-c',) else 'run'
+
+    def run(self, jid, cmd):
+        """Runs a command in a jail
+
+        Parameters
+        ----------
+        jid : :py:class:`int`
+            the jail's jid
+        cmd : :py:class:`str`
+            the command, interpreted by `shell`
+
+        Returns
+        -------
+        : :py:class:`str`
+            the command's output
+
+        Raises
+        ------
+        SubprocessError
+            raised if the command returned an error
+        """
+        rc, out, err = self.invoke(str(int(jid)), self.shell, '-c', cmd)
+        if rc:
+            raise SubprocessError(self, self.env, err.strip(), 'run')
+        return out
+
+    def fan_out(self, cmd, jids):
+        """Runs a command in many jails through a single invocation of the host's shell, which runs jexec for each jail
+        in turn. Each jail's output is framed between boundary lines. The boundary is derived from the command and the
+        jids, so that identical fan-outs are identical invocations, which transcripts can record and replay, and an
+        output containing it is rejected.
+
+        Parameters
+        ----------
+        cmd : :py:class:`str`
+            the command, interpreted by `shell`
+        jids : iterable of :py:class:`int`
+            the jails' jids
+
+        Returns
+        -------
+        : :py:class:`dict`
+            the command's (rc, out, err) :py:class:`tuple` in each jail, indexed by jid
+
+        Raises
+        ------
+        SubprocessError
+            raised if the host's shell failed before running the command in every jail
+        InvalidOutputError
+            raised if a jail's output is missing, its framing is broken or it contains the boundary
+        """
+        jids = [int(jid) for jid in jids]
+        if not jids:
+            return {}
+        digest = hashlib.sha1('\0'.join([cmd] + [str(jid) for jid in jids]).encode('utf-8')).hexdigest()
+        boundary = 'pybsd-{}'.format(digest)
+        script = FAN_OUT_SCRIPT.format(boundary=boundary, jexec=shlex_quote(self.binary), shell=shlex_quote(self.shell))
+        rc, out, err = self._call(self.shell, ('-c', script, self.shell, cmd) + tuple(str(jid) for jid in jids))
+        outs = self._parse_frames(out, boundary)
+        errs = self._parse_frames(err, boundary)
+        missing = [jid for jid in jids if jid not in outs]
+        if missing:
+            if rc:
+                raise SubprocessError(self, self.env, _unframed(err, boundary), 'fan_out')
+            raise InvalidOutputError(self, self.env, u'no output for jids {}'.format(missing), 'fan_out')
+        return dict((jid, (outs[jid][1], outs[jid][0], errs.get(jid, ('', None))[0])) for jid in jids)
+
+    def _parse_frames(self, text, boundary):
+        # Returns the (content, rc) tuple of every framed jail in a stream, indexed by jid. The newline printed before
+        # each end line is not part of the content. The rc is None on stderr. An unterminated last frame is left out.
+        start, end = '{} start '.format(boundary), '{} end '.format(boundary)
+        frames = {}
+        current, lines = None, []
+        for line in text.split('\n'):
+            if current is None:
+                if line.startswith(start):
+                    current, lines = line[len(start):], []
+                elif line.startswith(boundary):
+                    raise InvalidOutputError(self, self.env, u'the output contains the framing boundary', 'fan_out')
+                continue
+            if line.startswith(start):
+                raise InvalidOutputError(self, self.env, u'the output contains the framing boundary', 'fan_out')
+            if line.startswith(end):
+                fields = line[len(end):].split()
+                if not fields or fields[0] != current:
+                    raise InvalidOutputError(self, self.env, u'broken framing for jid {}'.format(current), 'fan_out')
+                frames[int(current)] = ('\n'.join(lines), int(fields[1]) if len(fields) > 1 else None)
+                current = None
+            else:
+                lines.append(line)
+        return frames
+
+
+def _unframed(text, boundary):
+    # The lines of a stream that are not framing lines, such as the host shell's own errors
+    return '\n'.join(line for line in text.split('\n') if line and not line.startswith(boundary)).strip()
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, print_function, unicode_literals
+
+import json
+import logging
+
+from ..exceptions import InvalidOutputError, SubprocessError
+from .base import BaseCommand
+
+__logger__ = logging.getLogger('pybsd')
+
+
+class Jls(BaseCommand):
+    """Provides an interface to the jls command, through its libxo JSON output
+
+    Only running jails are listed, and only the requested parameters are retrieved, which makes it a cheap source for
+    the state of every jail on a host.
+
+    Attributes
+    ----------
+    default_parameters : :py:class:`tuple`
+        The parameters retrieved when none are requested
+    """
+
+    name = 'jls'
+    read_only_subcommands = ('list',)
+    default_parameters = ('jid', 'name', 'host.hostname', 'path', 'ip4.addr', 'ip6.addr')
+    # Parameters whose values are lists, which jls may also join with commas
+    list_parameters = ('ip4.addr', 'ip6.addr')
+
+    @property
+    def binary(self):
+        return self.env.jls_binary
+
+    def _subcommand(self, args):
+        # jls has no subcommands: every invocation lists jails
+        return 'list'
+
+    def _args(self, parameters):
+        parameters = tuple(parameters) or self.default_parameters
+        if 'name' not in parameters:
+            parameters = ('name',) + parameters
+        return ('--libxo', 'json') + parameters
+
+    def list(self, *parameters):
+        """Lists the running jails
+
+        Parameters
+        ----------
+        parameters : :py:class:`str`
+            the jail parameters to retrieve, such as `jid` or `ip4.addr`. Defaults to `default_parameters`. `name` is
+            always retrieved.
+
+        Returns
+        -------
+        : :py:class:`dict`
+            the parameters of each jail, as a :py:class:`dict`, indexed by jail name. `jid` is an :py:class:`int` and ip
+            addresses are lists.
+
+        Raises
+        ------
+        SubprocessError
+            raised if jls returned an error
+        InvalidOutputError
+            raised if the output is not the expected JSON document
+        """
+        rc, out, err = self.invoke(*self._args(parameters))
+        if rc:
+            raise SubprocessError(self, self.env, err.strip(), 'list')
+        return dict(self._iter_jails([out]))
+
+    def iter_list(self, *parameters):
+        """Streaming counterpart of :py:meth:`list`. Jails are decoded one by one as jls' output arrives.
+
+        Returns
+        -------
+        : generator
+            yields a (name, parameters) :py:class:`tuple` per jail
+
+        Raises
+        ------
+        SubprocessError
+            raised once the output is exhausted if jls returned an error
+        InvalidOutputError
+            raised if the output is not the expected JSON document
+        """
+        lines = self.invoke_stream(*self._args(parameters))
+        try:
+            for jail in self._iter_jails(line + '\n' for line in lines):
+                yield jail
+        except InvalidOutputError:
+            lines.close()
+            if lines.rc:
+                raise SubprocessError(self, self.env, lines.err.strip(), 'list')
+            raise
+        finally:
+            lines.close()
+        if lines.rc:
+            raise SubprocessError(self, self.env, lines.err.strip(), 'list')
+
+    def _iter_jails(self, chunks):
+        # Yields (name, parameters) tuples from jls' JSON output: {"jail-information": {"jail": [{...}, ...]}}
+        try:
+            for jail in _iter_json_array(chunks, 'jail'):
+                for key in self.list_parameters:
+                    value = jail.get(key)
+                    if value is not None and not isinstance(value, list):
+                        jail[key] = [ip for ip in value.split(',') if ip]
+                if 'jid' in jail:
+                    jail['jid'] = int(jail['jid'])
+                yield jail['name'], jail
+        except (ValueError, KeyError, AttributeError) as e:
+            raise InvalidOutputError(self, self.env, u'invalid JSON output: {}'.format(e), 'list')
+
+
+def _iter_json_array(chunks, key):
+    # Decodes the elements of the first array that is the value of `key` in a JSON document, one at a time as the
+    # document's chunks arrive, so that the whole document is never held in memory. The elements must be objects.
+    decoder = json.JSONDecoder()
+    marker = '"{}"'.format(key)
+    chunks = iter(chunks)
+    buffer = ''
+    search = 0
+    pos = None
+    while True:
+        while pos is None:
+            found = buffer.find(marker, search)
+            if found == -1:
+                # The marker may be split over two chunks
+                buffer = buffer[-len(marker):]
+                search = 0
+                break
+            search = found
+            rest = buffer[found + len(marker):].lstrip()
+            if rest[:1] == ':':
+                rest = rest[1:].lstrip()
+                if rest[:1] == '[':
+                    pos = len(buffer) - len(rest) + 1
+                    break
+            if not rest:
+                # The value has not arrived yet
+                break
+            search = found + 1
+        if pos is not None:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if buffer[pos:pos + 1] == ']':
+                return
+            if pos < len(buffer):
+                try:
+                    element, pos = decoder.raw_decode(buffer, pos)
+                except ValueError:
+                    # The element is incomplete
+                    pass
+                else:
+                    yield element
+                    continue
+            buffer, pos = buffer[pos:], 0
+        try:
+            buffer += next(chunks)
+        except StopIteration:
+            if pos is None:
+                raise ValueError('no `{}` array'.format(key))
+            raise ValueError('truncated `{}` array'.format(key))
@@ -160,6 +160,25 @@ class CommandConnectionError(BaseCommandError):
     msg = "Can't execute command: `{command}`- can't connect to `{environment}`."
 
 
+class CommandTimeoutError(BaseCommandError):
+    """Error when a command did not complete before its deadline
+
+    Parameters
+    ----------
+    command : :py:class:`~pybsd.commands.BaseCommand`
+        The command
+    environment : :py:class:`~pybsd.systems.base.BaseSystem`
+        The environment on which the command is deployed. Any subclass of :py:class:`~pybsd.systems.base.BaseSystem`
+    timeout : :py:class:`float`
+        The command's timeout, in seconds
+    """
+    msg = "`{command}` on `{environment}` did not complete within {timeout}s."
+
+    def __init__(self, command, environment, timeout):
+        super(CommandTimeoutError, self).__init__(command, environment)
+        self.parameters = {'command': command, 'environment': environment, 'timeout': timeout}
+
+
 class CommandError(BaseCommandError):
     """Base exception for errors involving a validated command. It is never raised
 
@@ -240,6 +259,66 @@ class SubprocessError(CommandError):
         self.parameters = {'command': command, 'environment': environment, 'err': err}
 
 
+class ExecutionTimeoutError(PyBSDError):
+    """Error when an executor's command did not complete before its deadline. The command was terminated.
+
+    Parameters
+    ----------
+    args : :py:class:`tuple`
+        The command's arguments
+    timeout : :py:class:`float`
+        The command's timeout, in seconds
+    out : Optional[:py:class:`bytes` or :py:class:`~pybsd.executors.SpilledOutput`]
+        The raw stdout the command produced before it was terminated
+    err : Optional[:py:class:`bytes`]
+        The raw stderr the command produced before it was terminated
+    """
+    msg = "`{args}` did not complete within {timeout}s."
+
+    def __init__(self, args, timeout, out=None, err=None):
+        super(ExecutionTimeoutError, self).__init__()
+        self.parameters = {'args': ' '.join(args), 'timeout': timeout}
+        #: :py:class:`float`: the command's timeout, in seconds
+        self.timeout = timeout
+        #: :py:class:`bytes` or :py:class:`~pybsd.executors.SpilledOutput`: the raw stdout the command produced before it was
+        #: terminated
+        self.out = out
+        #: :py:class:`bytes`: the raw stderr the command produced before it was terminated
+        self.err = err
+
+
+class TranscriptMissError(PyBSDError):
+    """Error when a replayed command is absent from the transcript
+
+    Parameters
+    ----------
+    host : :py:class:`str`
+        The host the command was executed on
+    args : :py:class:`tuple`
+        The command's arguments
+    """
+    msg = "`{args}` on `{host}` was not recorded in the transcript."
+
+    def __init__(self, host, args):
+        super(TranscriptMissError, self).__init__()
+        self.parameters = {'host': host, 'args': ' '.join(args)}
+
+
+class DependencyCycleError(PyBSDError):
+    """Error when jail classes depend on each other, so that they can't be ordered
+
+    Parameters
+    ----------
+    classes : iterable of :py:class:`str`
+        The jail classes of the cycle
+    """
+    msg = "Jail classes `[{classes}]` depend on each other."
+
+    def __init__(self, classes):
+        super(DependencyCycleError, self).__init__()
+        self.parameters = {'classes': ', '.join(sorted(classes))}
+
+
 class MasterJailError(PyBSDError):
     """Base exception for errors involving a master and a jail. It is never raised
 
@@ -1,43 +1,762 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, print_function, unicode_literals
 
+import contextlib
+import errno
+import fcntl
+import itertools
 import logging
+import mmap
+import os
+import re
+import select
+import signal
 import subprocess
+import string
+import sys
+import tempfile
+import threading
+import time
+import uuid
 
-from . import utils
+import six
+from six.moves import shlex_quote
+
+try:
+    import selectors
+except ImportError:  # pragma: no cover
+    import selectors34 as selectors
+
+from . import instrumentation as _instrumentation, processes, transports, utils
+from .exceptions import ExecutionTimeoutError
 
 __logger__ = logging.getLogger('pybsd')
 
+# Holds the instrumentation sample of the command being run by the current thread, so that its spawn time is recorded
+_current = threading.local()
+
+# Python 2's subprocess can neither start a process in a new session nor wait for it with a timeout. There, the child
+# starts its session itself before running the command, and timeouts are enforced by reading the process' pipes until a
+# deadline
+_HAS_NEW_SESSION = not six.PY2
+_HAS_COMMUNICATE_TIMEOUT = not six.PY2
+
+
+def _session_kwargs(new_session=True):
+    # The Popen keyword arguments starting a process in a new session, whose group can then be signalled as a whole
+    if not new_session:
+        return {}
+    return {'start_new_session': True} if _HAS_NEW_SESSION else {'preexec_fn': os.setsid}
+
+
+def frame(args, marker, stdin=None):
+    """Returns the shell snippet that runs a command and frames its output, so that it can be told apart from that of
+    other commands run by the same shell.
+
+    Once the command exits, `marker`, a colon and the return code are written on stdout and `marker` is written on
+    stderr, each followed by a newline.
+
+    Parameters
+    ----------
+    args : :py:class:`tuple`
+        The command's arguments
+    marker : :py:class:`str`
+        A string unique to this command
+    stdin : Optional[:py:class:`bytes`]
+        The data fed to the command's stdin. It is embedded in the snippet, so that it reaches the shell running it
+        wherever it runs. Defaults to nothing, the command reading from /dev/null.
+
+    Returns
+    -------
+    : :py:class:`str`
+    """
+    cmd = ' '.join(shlex_quote(utils.safe_unicode(arg)) for arg in args)
+    if stdin is None:
+        cmd = '{} </dev/null'.format(cmd)
+    else:
+        # printf's octal escapes carry any byte, and printf is a builtin of every sh, so the data is not subject to the
+        # size limit of a process' arguments
+        data = ''.join(six.unichr(byte) if byte in _PRINTF_SAFE else '\\{:03o}'.format(byte) for byte in bytearray(stdin))
+        cmd = "printf '{}' | {}".format(data, cmd)
+    return ('{cmd}; __pybsd_rc=$?; printf \'%s:%d\\n\' {marker} $__pybsd_rc; printf \'%s\\n\' {marker} >&2\n'
+            .format(cmd=cmd, marker=marker))
+
+
+# The bytes printf's format is given as is, the others are escaped
+_PRINTF_SAFE = frozenset(bytearray((string.ascii_letters + string.digits + ' ,.:/=_').encode('ascii')))
+
+
+def unframe(out, err, markers):
+    """Splits the output of commands framed with :py:func:`frame`
+
+    Parameters
+    ----------
+    out : :py:class:`bytes`
+        The shell's stdout
+    err : :py:class:`bytes`
+        The shell's stderr
+    markers : :py:class:`list` [:py:class:`str`]
+        The commands' markers, in order
+
+    Returns
+    -------
+    : :py:class:`list`
+        a raw (rc, out, err) :py:class:`tuple` per marker, or None for commands whose frame is missing because they
+        did not run
+    """
+    results = []
+    out_pos = err_pos = 0
+    for marker in markers:
+        marker = marker.encode('utf8')
+        out_end = out.find(marker + b':', out_pos)
+        err_end = err.find(marker + b'\n', err_pos)
+        if out_end == -1 or err_end == -1:
+            results.append(None)
+            continue
+        rc_start = out_end + len(marker) + 1
+        rc_end = out.find(b'\n', rc_start)
+        results.append((int(out[rc_start:rc_end]), out[out_pos:out_end], err[err_pos:err_end]))
+        out_pos = rc_end + 1
+        err_pos = err_end + len(marker) + 1
+    return results
+
 
 class Executor(object):
-    """Executes a command Adapted from https://github.com/ployground/ploy"""
+    """Executes a command Adapted from https://github.com/ployground/ploy
+
+    Commands run locally unless `instance` is specified, in which case they run on that instance through a transport.
+    By default transports are taken from :py:data:`pybsd.transports.pool`, so that all executors targeting the same host
+    share its connection and its cap on open channels.
 
-    def __init__(self, instance=None, prefix_args=(), splitlines=False):
+    Example
+    -------
+    >>> from pybsd import Executor
+    >>> from pybsd.transports import LocalTransport
+    >>> execute = Executor(instance='box01', transport=LocalTransport('box01'))
+    >>> execute('echo', 'foo')
+    (0, 'foo\\n', '')
+
+    Parameters
+    ----------
+    instance : Optional[`any`]
+        The remote instance the commands are executed on: a hostname or an object with a `hostname` attribute, such as
+        a :py:class:`~pybsd.systems.base.BaseSystem`. Local execution if None.
+    prefix_args : Optional[:py:class:`tuple`]
+        Arguments prepended to every command.
+    splitlines : Optional[:py:class:`bool`]
+        Whether out and err should be returned as lists of lines.
+    transport : Optional[:py:class:`~pybsd.transports.BaseTransport`]
+        The transport to `instance`. If not specified, it is taken from :py:data:`pybsd.transports.pool`.
+
+    Attributes
+    ----------
+    TransportClass : :py:class:`class`
+        the class of the transports created for remote instances. It must be or extend
+        :py:class:`~pybsd.transports.BaseTransport`
+    process_limit : :py:class:`threading.BoundedSemaphore`
+        caps the number of child processes :py:meth:`map` runs simultaneously. By default it is shared by all executors,
+        so the cap applies to the whole controller host.
+    use_posix_spawn : :py:class:`bool`
+        whether processes are launched through :py:class:`~pybsd.processes.SpawnedProcess`, whose cost does not grow with
+        the controller's heap, rather than :py:class:`subprocess.Popen`. Enabled wherever it is available.
+    instrumentation : :py:class:`~pybsd.instrumentation.Instrumentation`
+        records a sample for each command run by :py:meth:`__call__` and :py:meth:`map`. None by default, it can be set
+        on the class to instrument every executor, or on an instance.
+    timeout : :py:class:`float`
+        the default timeout of :py:meth:`__call__`, in seconds. None, the default, means no timeout.
+    kill_grace : :py:class:`float`
+        how long, in seconds, overdue commands are given to exit after SIGTERM before they are sent SIGKILL
+    spill_threshold : :py:class:`int`
+        the default `spill_threshold` of :py:meth:`__call__`, in bytes. None, the default, keeps outputs in memory.
+    """
+    TransportClass = transports.SSHTransport
+    process_limit = threading.BoundedSemaphore(64)
+    use_posix_spawn = processes.HAS_POSIX_SPAWN
+    instrumentation = None
+    timeout = None
+    kill_grace = 2
+    spill_threshold = None
+
+    def __init__(self, instance=None, prefix_args=(), splitlines=False, transport=None):
         self.instance = instance
         self.prefix_args = tuple(prefix_args)
         self.splitlines = splitlines
+        self._transport = transport
+
+    @property
+    def host(self):
+        """:py:class:`str`: the name of the host commands are executed on"""
+        if self.instance is None:
+            return 'localhost'
+        return getattr(self.instance, 'hostname', None) or str(self.instance)
+
+    @property
+    def transport(self):
+        """:py:class:`~pybsd.transports.BaseTransport`: the transport to `instance`, None for local execution"""
+        if self._transport is None and self.instance is not None:
+            self._transport = transports.pool.get(self.host, self.TransportClass)
+        return self._transport
 
     def __call__(self, *cmd_args, **kwargs):
+        """Executes a command
+
+        Parameters
+        ----------
+        cmd_args : the command's arguments
+        rc : Optional[:py:class:`int` or :py:class:`list` [:py:class:`int`]]
+            the expected return code. If specified, it is checked and left out of the result.
+        out : Optional[:py:class:`str` or :py:class:`bytes`]
+            the expected stdout. If specified, it is checked and left out of the result.
+        err : Optional[:py:class:`str` or :py:class:`bytes`]
+            the expected stderr. If specified, it is checked and left out of the result.
+        stdin : Optional[:py:class:`bytes`]
+            data fed to the command's stdin
+        raw : Optional[:py:class:`bool`]
+            if True, stdout and stderr are not decoded: they are returned as :py:class:`~pybsd.executors.RawOutput`, which
+            only decodes them when their text is accessed, and expected values are compared to them byte for byte.
+            `splitlines` does not apply.
+        tag : Optional[:py:class:`tuple`]
+            the (system, command, subcommand) the command is accounted under by `instrumentation`. Defaults to the host,
+            the basename of the binary and the first argument.
+        timeout : Optional[:py:class:`float`]
+            how long, in seconds, the command may run. Overdue commands are terminated along with their process group.
+            Defaults to the executor's `timeout`.
+        spill_threshold : Optional[:py:class:`int`]
+            how many bytes of stdout are kept in memory. Past that, stdout is moved to a temporary file and returned as a
+            :py:class:`~pybsd.executors.SpilledOutput`, which is neither decoded nor split into lines. Defaults to the
+            executor's `spill_threshold`.
+
+        Returns
+        -------
+        : :py:class:`tuple`
+            (rc, out, err), minus the values that were checked. A single value is returned unwrapped.
+
+        Raises
+        ------
+        subprocess.CalledProcessError
+            raised when the result does not match the expected `rc`, `out` or `err`
+        ExecutionTimeoutError
+            raised when the command did not complete within `timeout`
+        """
         args = self.prefix_args + cmd_args
         rc = kwargs.pop('rc', None)
         out = kwargs.pop('out', None)
         err = kwargs.pop('err', None)
         stdin = kwargs.pop('stdin', None)
+        raw = kwargs.pop('raw', False)
+        tag = kwargs.pop('tag', None)
+        timeout = kwargs.pop('timeout', self.timeout)
+        spill_threshold = kwargs.pop('spill_threshold', self.spill_threshold)
+        run_kwargs = {} if spill_threshold is None else {'spill_threshold': spill_threshold}
+        if self.instrumentation is None:
+            _rc, _out, _err = self._run(args, stdin, timeout, **run_kwargs)
+        else:
+            _rc, _out, _err = self._instrumented_run(args, stdin, tag, timeout, **run_kwargs)
+        return self._result(args, _rc, _out, _err, rc=rc, out=out, err=err, raw=raw)
+
+    def stream(self, *cmd_args, **kwargs):
+        """Executes a command and returns an iterator over the decoded lines of its stdout, as they are produced.
+
+        The output is never held in memory as a whole, stderr is spooled to a temporary file until the command exits.
+
+        Example
+        -------
+        >>> from pybsd import Executor
+        >>> lines = Executor().stream('printf', 'foo\\nbar\\n')
+        >>> list(lines)
+        ['foo', 'bar']
+        >>> lines.rc, lines.err
+        (0, '')
+
+        Parameters
+        ----------
+        cmd_args : the command's arguments
+        stdin : Optional[:py:class:`bytes`]
+            data fed to the command's stdin
+
+        Returns
+        -------
+        : :py:class:`~pybsd.executors.StreamResult`
+            an iterator over stdout's lines, stripped of their line ending. Its `rc` and `err` are available once exhausted.
+        """
+        args = self.prefix_args + cmd_args
+        stdin = kwargs.pop('stdin', None)
+        popen_kwargs = dict(stdout=subprocess.PIPE, stderr=tempfile.TemporaryFile())
+        if stdin is not None:
+            # Spooling stdin avoids having to feed it while stdout is being consumed
+            popen_kwargs['stdin'] = tempfile.TemporaryFile()
+            popen_kwargs['stdin'].write(stdin)
+            popen_kwargs['stdin'].seek(0)
+        channel = self._channel()
+        channel.__enter__()
+        try:
+            proc = self._popen(args, **popen_kwargs)
+        except BaseException:
+            popen_kwargs['stderr'].close()
+            channel.__exit__(None, None, None)
+            raise
+        finally:
+            if stdin is not None:
+                popen_kwargs['stdin'].close()
+        return StreamResult(proc, popen_kwargs['stderr'], args, transport=self.transport, channel=channel)
+
+    def batch(self, stop_on_error=False, timeout=None, tag=None):
+        """Returns a :py:class:`~pybsd.executors.Batch` collecting commands that are then run by a single shell, at the
+        cost of one process spawn or remote round-trip.
+
+        Example
+        -------
+        >>> from pybsd import Executor
+        >>> with Executor().batch() as batch:
+        ...     batch.add('echo', 'foo')
+        ...     batch.add('sh', '-c', 'echo bar >&2; exit 3')
+        0
+        1
+        >>> batch.results
+        [(0, 'foo\\n', ''), (3, '', 'bar\\n')]
+
+        Parameters
+        ----------
+        stop_on_error : Optional[:py:class:`bool`]
+            Whether commands following the first one that fails are skipped
+        timeout : Optional[:py:class:`float`]
+            How long, in seconds, the whole batch may run. See :py:class:`~pybsd.executors.Batch`
+        tag : Optional[:py:class:`tuple`]
+            the (system, command, subcommand) the batch is accounted under by `instrumentation`. See
+            :py:class:`~pybsd.executors.Batch`
+
+        Returns
+        -------
+        : :py:class:`~pybsd.executors.Batch`
+        """
+        return Batch(self, stop_on_error=stop_on_error, timeout=timeout, tag=tag)
+
+    def map(self, commands, max_workers=8, ordered=True, timeout=None):
+        """Runs many commands concurrently, without a thread per process
+
+        Commands are spawned as slots free up and their output is read through non-blocking pipes by a single selector
+        loop. At most `max_workers` commands of this call, and at most `process_limit` commands over all calls, run at the
+        same time.
+
+        Example
+        -------
+        >>> from pybsd import Executor
+        >>> list(Executor().map([('echo', 'foo'), ('sh', '-c', 'sleep 0.1; exit 3'), ('echo', 'bar')]))
+        [(0, 'foo\\n', ''), (3, '', ''), (0, 'bar\\n', '')]
+
+        Parameters
+        ----------
+        commands : iterable of :py:class:`tuple`
+            The arguments of each command
+        max_workers : Optional[:py:class:`int`]
+            The maximum number of commands of this call running at the same time
+        ordered : Optional[:py:class:`bool`]
+            Whether results are yielded in submission order. If False, they are yielded as commands complete.
+        timeout : Optional[:py:class:`float`]
+            How long, in seconds, the whole call may run. Once it expires, commands still running are terminated along
+            with their process group and no more commands are started. The results that arrived in time are still
+            yielded: when `ordered` is True, None is yielded for each command that did not complete.
+
+        Returns
+        -------
+        : generator
+            yields a (rc, out, err) :py:class:`tuple` per command, or an (index, (rc, out, err)) :py:class:`tuple` if
+            `ordered` is False. Commands still running when the generator is closed are killed.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        popen_kwargs = dict(stdout=subprocess.PIPE, stderr=subprocess.PIPE, **_session_kwargs(timeout is not None))
+        pending = enumerate(commands)
+        selector = selectors.DefaultSelector()
+        running = {}
+        completed = {}
+        next_index = submitted = 0
+        exhausted = False
+        try:
+            while True:
+                expired = deadline is not None and time.time() >= deadline
+                while (not expired and not exhausted and len(running) < max_workers and
+                       self._acquire_process(blocking=not running)):
+                    try:
+                        index, args = next(pending)
+                    except StopIteration:
+                        self._release_process()
+                        exhausted = True
+                        break
+                    submitted = index + 1
+                    args = self.prefix_args + tuple(args)
+                    sample = None if self.instrumentation is None else self.instrumentation.start(self._tag(args), args)
+                    try:
+                        started = _instrumentation.timer()
+                        child = _Child(index, args, self._popen(args, **popen_kwargs))
+                    except BaseException as e:
+                        self._release_process()
+                        if sample is not None:
+                            self.instrumentation.finish(sample, error=e)
+                        raise
+                    if sample is not None:
+                        sample.spawn_time = _instrumentation.timer() - started
+                        child.sample = sample
+                    running[child.proc.pid] = child
+                    for pipe in (child.proc.stdout, child.proc.stderr):
+                        _set_nonblocking(pipe.fileno())
+                        selector.register(pipe, selectors.EVENT_READ, child)
+                if not running or expired:
+                    break
+                for key, _ in selector.select(None if deadline is None else max(0, deadline - time.time())):
+                    child = key.data
+                    if not child.read(key.fileobj):
+                        continue
+                    selector.unregister(key.fileobj)
+                    key.fileobj.close()
+                    if not child.finished:
+                        continue
+                    del running[child.proc.pid]
+                    rc = child.proc.wait()
+                    self._release_process()
+                    if child.sample is not None:
+                        self.instrumentation.finish(child.sample, rc, child.out, child.err)
+                    if self.instance is not None:
+                        self.transport.check(rc, child.err)
+                    result = self._result(child.args, rc, child.out, child.err)
+                    if not ordered:
+                        yield child.index, result
+                        continue
+                    completed[child.index] = result
+                    while next_index in completed:
+                        yield completed.pop(next_index)
+                        next_index += 1
+            if expired:
+                self._terminate_children(list(running.values()), selector, timeout)
+                running.clear()
+                if ordered:
+                    for index in range(next_index, submitted):
+                        yield completed.pop(index, None)
+                    for _ in pending:
+                        yield None
+        finally:
+            for child in running.values():
+                for pipe in (child.proc.stdout, child.proc.stderr):
+                    if not pipe.closed:
+                        selector.unregister(pipe)
+                        pipe.close()
+                child.proc.kill()
+                child.proc.wait()
+                self._release_process()
+            selector.close()
+
+    def pipe(self, *commands, **kwargs):
+        """Runs commands as a pipeline, each one's stdout feeding the next one's stdin
+
+        Stages are wired to each other with :py:func:`os.pipe`, so the data they exchange never goes through python. Only
+        the last stage's stdout, unless it is redirected to `stdout`, and every stage's stderr are read.
+
+        Example
+        -------
+        >>> from pybsd import Executor
+        >>> result = Executor().pipe(('printf', 'foo\\nbar\\n'), ('grep', 'bar'), count=True)
+        >>> result.returncodes, result.out, result.byte_counts
+        ([0, 0], 'bar\\n', [8, 4])
+
+        Parameters
+        ----------
+        commands : :py:class:`tuple`
+            the stages' arguments, in order
+        stdin : Optional[file object or descriptor]
+            what the first stage reads from. Inherited if None.
+        stdout : Optional[file object or descriptor]
+            what the last stage writes to. If None, its output is captured.
+        count : Optional[:py:class:`bool`]
+            whether the bytes each stage writes to its stdout are counted. The stages are then connected through relay
+            threads, which use :py:func:`os.splice` where it is available so that the data still stays in the kernel.
+        timeout : Optional[:py:class:`float`]
+            how long, in seconds, the pipeline may run. Overdue stages are terminated along with their process group.
+            Defaults to the executor's `timeout`.
+        raw : Optional[:py:class:`bool`]
+            whether the captured output is returned undecoded. See :py:meth:`__call__`
+
+        Returns
+        -------
+        : :py:class:`~pybsd.executors.PipelineResult`
+
+        Raises
+        ------
+        ExecutionTimeoutError
+            raised when the pipeline did not complete within `timeout`
+        """
+        stdin = kwargs.pop('stdin', None)
+        stdout = kwargs.pop('stdout', None)
+        count = kwargs.pop('count', False)
+        timeout = kwargs.pop('timeout', self.timeout)
+        raw = kwargs.pop('raw', False)
+        commands = [self.prefix_args + tuple(args) for args in commands]
+        returncodes, _out, _errs, byte_counts = self._run_pipe(commands, stdin, stdout, count, timeout)
+        return PipelineResult(self, _pipeline_args(commands), returncodes, _out, _errs, byte_counts, raw=raw)
+
+    def _run_pipe(self, commands, stdin=None, stdout=None, count=False, timeout=None):
+        # Spawns the pipeline's stages and returns their raw (returncodes, last stdout, stderrs, byte counts)
+        args = _pipeline_args(commands)
+        deadline = None if timeout is None else time.time() + timeout
+        byte_counts = [None] * len(commands)
+        procs = []
+        relays = []
+        parent_fds = []
+        # The remote host's channels held by the stages, released once the pipeline exited
+        channels = []
+        try:
+            try:
+                upstream = stdin
+                for index, stage_args in enumerate(commands):
+                    last = index == len(commands) - 1
+                    relay_out = count and not (last and stdout is None)
+                    if relay_out:
+                        relay_in, downstream = os.pipe()
+                        parent_fds.extend((relay_in, downstream))
+                    elif last:
+                        downstream = subprocess.PIPE if stdout is None else stdout
+                    else:
+                        next_upstream, downstream = os.pipe()
+                        parent_fds.extend((next_upstream, downstream))
+                    channel = self._channel()
+                    channel.__enter__()
+                    channels.append(channel)
+                    # The pipes' ends held for other stages and relays are inheritable on python 2, where Popen does not
+                    # close them by default: a stage holding a write end would keep its reader from ever seeing EOF
+                    procs.append(self._popen(stage_args, stdin=upstream, stdout=downstream, stderr=subprocess.PIPE,
+                                             close_fds=True, **_session_kwargs(timeout is not None)))
+                    # The children hold their own copies of the pipes' ends
+                    for fd in (upstream, downstream):
+                        if isinstance(fd, int) and fd in parent_fds:
+                            parent_fds.remove(fd)
+                            os.close(fd)
+                    if relay_out:
+                        if not last:
+                            next_upstream, relay_to = os.pipe()
+                            parent_fds.append(next_upstream)
+                        elif _is_devnull(stdout):
+                            relay_to = os.open(os.devnull, os.O_WRONLY)
+                        else:
+                            relay_to = stdout if isinstance(stdout, int) else stdout.fileno()
+                        parent_fds.remove(relay_in)
+                        relays.append(_Relay(relay_in, relay_to, byte_counts, index,
+                                             close_dst=not last or _is_devnull(stdout)))
+                    if not last:
+                        upstream = next_upstream
+            except BaseException:
+                for fd in parent_fds:
+                    os.close(fd)
+                for relay in relays:
+                    relay.close()
+                for proc in procs:
+                    proc.kill()
+                    proc.wait()
+                raise
+            for relay in relays:
+                relay.start()
+            pipes = [proc.stderr for proc in procs]
+            if stdout is None:
+                pipes.append(procs[-1].stdout)
+            chunks, expired = self._read_pipes(pipes, deadline)
+            if expired:
+                self._terminate_processes(procs)
+            for relay in relays:
+                relay.join()
+            for pipe in pipes:
+                pipe.close()
+            returncodes = [proc.wait() for proc in procs]
+        finally:
+            for channel in reversed(channels):
+                channel.__exit__(None, None, None)
+        _out = b''.join(chunks[procs[-1].stdout]) if stdout is None else None
+        _errs = [b''.join(chunks[proc.stderr]) for proc in procs]
+        if expired:
+            raise ExecutionTimeoutError(args, timeout, _out, b''.join(_errs))
+        if self.instance is not None:
+            for rc, _err in zip(returncodes, _errs):
+                self.transport.check(rc, _err)
+        if stdout is None and count:
+            byte_counts[-1] = len(_out)
+        return returncodes, _out, _errs, byte_counts if count else None
+
+    def _acquire_process(self, blocking=True):
+        # Acquires a slot under `process_limit` and, for remote instances, one of the host's channels
+        if not self.process_limit.acquire(blocking):
+            return False
+        if self.instance is not None and not self.transport.channel().acquire(blocking):
+            self.process_limit.release()
+            return False
+        return True
+
+    def _release_process(self):
+        if self.instance is not None:
+            self.transport.channel().release()
+        self.process_limit.release()
+
+    @contextlib.contextmanager
+    def _channel(self):
+        # Holds one of the remote host's channels, if any
+        if self.instance is None:
+            yield
+        else:
+            with self.transport.channel():
+                yield
+
+    def _popen(self, args, **popen_kwargs):
+        # Launches the process and returns a :py:class:`subprocess.Popen`-like object
         if self.instance is None:
             __logger__.debug('Executing locally:\n%s', args)
-            popen_kwargs = dict(stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            if stdin is not None:
-                popen_kwargs['stdin'] = subprocess.PIPE
-            proc = subprocess.Popen(args, **popen_kwargs)
-            _out, _err = proc.communicate(input=stdin)
-            _rc = proc.returncode
         else:
+            __logger__.debug('Executing on `%s`:\n%s', self.host, args)
+            args = self.transport.wrap(args)
+        started = _instrumentation.timer()
+        try:
+            if self.use_posix_spawn:
+                return processes.SpawnedProcess(args, **popen_kwargs)
+            return subprocess.Popen(args, **popen_kwargs)
+        finally:
+            sample = getattr(_current, 'sample', None)
+            if sample is not None:
+                sample.spawn_time += _instrumentation.timer() - started
+
+    def _tag(self, args):
+        # The default (system, command, subcommand) of a command
+        return (self.host, os.path.basename(args[0]) if args else None, args[1] if len(args) > 1 else None)
+
+    def _communicate(self, proc, args, stdin, timeout):
+        # Waits for the process' output, terminating it if it outlives `timeout`. Timeouts require python 3, see `_run`
+        if timeout is None:
+            return proc.communicate(input=stdin)
+        try:
+            return proc.communicate(input=stdin, timeout=timeout)
+        except subprocess.TimeoutExpired:
             pass
-            # not supported yet
-        _out = utils.safe_unicode(_out)
-        _err = utils.safe_unicode(_err)
-        out = utils.safe_unicode(out)
-        err = utils.safe_unicode(err)
+        _signal_group(proc, signal.SIGTERM)
+        try:
+            _out, _err = proc.communicate(timeout=self.kill_grace)
+        except subprocess.TimeoutExpired:
+            _signal_group(proc, signal.SIGKILL)
+            _out, _err = proc.communicate()
+        raise ExecutionTimeoutError(args, timeout, _out, _err)
+
+    def _terminate_children(self, children, selector, timeout):
+        # Terminates the overdue children of :py:meth:`map`: SIGTERM first, then SIGKILL once `kill_grace` expired
+        for child in children:
+            for pipe in (child.proc.stdout, child.proc.stderr):
+                if not pipe.closed:
+                    selector.unregister(pipe)
+                    pipe.close()
+            _signal_group(child.proc, signal.SIGTERM)
+        grace_deadline = time.time() + self.kill_grace
+        for child in children:
+            while child.proc.poll() is None and time.time() < grace_deadline:
+                time.sleep(0.01)
+            if child.proc.poll() is None:
+                _signal_group(child.proc, signal.SIGKILL)
+                child.proc.wait()
+            self._release_process()
+            if child.sample is not None:
+                self.instrumentation.finish(child.sample, error=ExecutionTimeoutError(child.args, timeout))
+
+    def _read_pipes(self, pipes, deadline, chunks=None):
+        # Reads `pipes` until EOF or until `deadline` expires. Returns the chunks read from each pipe and whether the
+        # deadline expired. The chunks are appended to the lists, or list-like sinks, of `chunks` if it is specified
+        selector = selectors.DefaultSelector()
+        chunks = {pipe: [] for pipe in pipes} if chunks is None else chunks
+        for pipe in pipes:
+            selector.register(pipe, selectors.EVENT_READ)
+        try:
+            while selector.get_map():
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return chunks, True
+                for key, _ in selector.select(remaining):
+                    chunk = os.read(key.fileobj.fileno(), 65536)
+                    if chunk:
+                        chunks[key.fileobj].append(chunk)
+                    else:
+                        selector.unregister(key.fileobj)
+        finally:
+            selector.close()
+        return chunks, False
+
+    def _terminate_processes(self, procs):
+        # Terminates overdue processes started in a new session: SIGTERM first, then SIGKILL once `kill_grace` expired
+        for proc in procs:
+            _signal_group(proc, signal.SIGTERM)
+        grace_deadline = time.time() + self.kill_grace
+        for proc in procs:
+            while proc.poll() is None and time.time() < grace_deadline:
+                time.sleep(0.01)
+            if proc.poll() is None:
+                _signal_group(proc, signal.SIGKILL)
+
+    def _instrumented_run(self, args, stdin, tag, timeout=None, **run_kwargs):
+        # Runs the command through `_run` while recording its sample
+        sample = self.instrumentation.start(tag or self._tag(args), args, stdin)
+        _current.sample = sample
+        try:
+            _rc, _out, _err = self._run(args, stdin, timeout, **run_kwargs)
+        except Exception as e:
+            self.instrumentation.finish(sample, error=e)
+            raise
+        finally:
+            _current.sample = None
+        self.instrumentation.finish(sample, _rc, _out, _err)
+        return _rc, _out, _err
+
+    def _run(self, args, stdin=None, timeout=None, spill_threshold=None):
+        # Spawns the process and returns its raw (rc, stdout, stderr)
+        if spill_threshold is not None or (timeout is not None and not _HAS_COMMUNICATE_TIMEOUT):
+            return self._run_spilling(args, stdin, timeout, spill_threshold)
+        # With a timeout, the process gets its own group, so that its own children can be terminated with it
+        popen_kwargs = dict(stdout=subprocess.PIPE, stderr=subprocess.PIPE, **_session_kwargs(timeout is not None))
+        if stdin is not None:
+            popen_kwargs['stdin'] = subprocess.PIPE
+        with self._channel():
+            proc = self._popen(args, **popen_kwargs)
+            _out, _err = self._communicate(proc, args, stdin, timeout)
+        if self.instance is not None:
+            self.transport.check(proc.returncode, _err)
+        return proc.returncode, _out, _err
+
+    def _run_spilling(self, args, stdin, timeout, spill_threshold):
+        # Same as `_run`, except that stdout is moved to a temporary file once it outgrows `spill_threshold`, if it is set
+        popen_kwargs = dict(stdout=subprocess.PIPE, stderr=subprocess.PIPE, **_session_kwargs(timeout is not None))
+        if stdin is not None:
+            # Spooling stdin avoids having to feed it while the output is being read
+            popen_kwargs['stdin'] = tempfile.TemporaryFile()
+            popen_kwargs['stdin'].write(stdin)
+            popen_kwargs['stdin'].seek(0)
+        with self._channel():
+            try:
+                proc = self._popen(args, **popen_kwargs)
+            finally:
+                if stdin is not None:
+                    popen_kwargs['stdin'].close()
+            sinks = {proc.stdout: _SpillSink(spill_threshold), proc.stderr: []}
+            _, expired = self._read_pipes(list(sinks), None if timeout is None else time.time() + timeout, sinks)
+            if expired:
+                self._terminate_processes([proc])
+            for pipe in sinks:
+                pipe.close()
+            proc.wait()
+        _out, _err = sinks[proc.stdout].value(), b''.join(sinks[proc.stderr])
+        if expired:
+            raise ExecutionTimeoutError(args, timeout, _out, _err)
+        if self.instance is not None:
+            self.transport.check(proc.returncode, _err)
+        return proc.returncode, _out, _err
+
+    def _result(self, args, _rc, _out, _err, rc=None, out=None, err=None, raw=False):
+        # Decodes the raw output and checks it against the expected `rc`, `out` and `err`. Spilled output is left as is
+        spilled = isinstance(_out, SpilledOutput)
+        if raw:
+            out = utils.safe_bytes(out)
+            err = utils.safe_bytes(err)
+        else:
+            _out = _out if spilled else utils.safe_unicode(_out)
+            _err = utils.safe_unicode(_err)
+            out = utils.safe_unicode(out)
+            err = utils.safe_unicode(err)
         result = []
         if rc is None:
             result.append(_rc)
@@ -50,7 +769,11 @@ class Executor(object):
             if rc != _rc:
                 raise subprocess.CalledProcessError(_rc, ' '.join(args), _err)
         if out is None:
-            if self.splitlines:
+            if spilled:
+                pass
+            elif raw:
+                _out = RawOutput(_out)
+            elif self.splitlines:
                 _out = _out.splitlines()
             result.append(_out)
         else:
@@ -59,7 +782,9 @@ class Executor(object):
                     __logger__.error(_out)
                 raise subprocess.CalledProcessError(_rc, ' '.join(args), _err)
         if err is None:
-            if self.splitlines:
+            if raw:
+                _err = RawOutput(_err)
+            elif self.splitlines:
                 _err = _err.splitlines()
             result.append(_err)
         else:
@@ -72,3 +797,687 @@ class Executor(object):
         elif len(result) == 1:
             return result[0]
         return tuple(result)
+
+
+# Whether pipes can be joined without copying their data to user space. os.splice only exists on Linux, with
+# python >= 3.10: elsewhere, such as on FreeBSD, relays copy the data through a buffer
+_HAS_SPLICE = hasattr(os, 'splice') and sys.platform.startswith('linux')
+# subprocess.DEVNULL only exists with python 3
+_DEVNULL = getattr(subprocess, 'DEVNULL', None)
+
+
+def _is_devnull(stdout):
+    return _DEVNULL is not None and stdout == _DEVNULL
+
+
+def _pipeline_args(commands):
+    # The stages' arguments, separated by '|'
+    return tuple(itertools.chain.from_iterable(args + ('|',) for args in commands))[:-1]
+
+
+def _signal_group(proc, sig):
+    # Sends a signal to the group of a process started in a new session, which it leads
+    try:
+        os.killpg(proc.pid, sig)
+    except OSError:
+        pass
+
+
+def _set_nonblocking(fd):
+    fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+
+
+class _Relay(threading.Thread):
+    # Moves the bytes written by a stage of :py:meth:`Executor.pipe` to the next one, counting them
+    def __init__(self, src, dst, counts, index, close_dst=True):
+        super(_Relay, self).__init__()
+        self.daemon = True
+        self.src = src
+        self.dst = dst
+        self.counts = counts
+        self.index = index
+        self.close_dst = close_dst
+
+    def run(self):
+        total = 0
+        splice = _HAS_SPLICE
+        try:
+            while True:
+                if splice:
+                    try:
+                        moved = os.splice(self.src, self.dst, 65536)
+                    except OSError as e:
+                        # The descriptors can not be spliced, e.g. a file opened for appending
+                        if e.errno not in (errno.EINVAL, errno.ENOSYS):
+                            raise
+                        splice = False
+                        continue
+                else:
+                    chunk = os.read(self.src, 65536)
+                    view = memoryview(chunk)
+                    while view:
+                        view = view[os.write(self.dst, view):]
+                    moved = len(chunk)
+                if not moved:
+                    break
+                total += moved
+        except OSError as e:
+            # The next stage exited: the upstream one gets SIGPIPE once the relay stops reading
+            if e.errno != errno.EPIPE:
+                raise
+        finally:
+            self.counts[self.index] = total
+            self.close()
+
+    def close(self):
+        os.close(self.src)
+        if self.close_dst:
+            os.close(self.dst)
+
+
+class _Child(object):
+    # A process run by :py:meth:`Executor.map`, and the output read from it so far
+    __slots__ = ('index', 'args', 'proc', 'chunks', 'open_pipes', 'sample')
+
+    def __init__(self, index, args, proc):
+        self.index = index
+        self.args = args
+        self.proc = proc
+        self.sample = None
+        self.chunks = {proc.stdout: [], proc.stderr: []}
+        self.open_pipes = 2
+
+    def read(self, pipe):
+        # Reads what is available from `pipe`. Returns True on EOF
+        try:
+            chunk = os.read(pipe.fileno(), 65536)
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return False
+            raise
+        if chunk:
+            self.chunks[pipe].append(chunk)
+            return False
+        self.open_pipes -= 1
+        return True
+
+    @property
+    def finished(self):
+        return self.open_pipes == 0
+
+    @property
+    def out(self):
+        return b''.join(self.chunks[self.proc.stdout])
+
+    @property
+    def err(self):
+        return b''.join(self.chunks[self.proc.stderr])
+
+
+class RawOutput(object):
+    """Wraps a command's undecoded output, which is only decoded when its text is first accessed
+
+    Example
+    -------
+    >>> from pybsd.executors import RawOutput
+    >>> output = RawOutput(b'foo\\nbar\\n')
+    >>> output == b'foo\\nbar\\n', len(output), output.view[:3].tobytes()
+    (True, 8, b'foo')
+    >>> output.splitlines()
+    ['foo', 'bar']
+
+    Parameters
+    ----------
+    data : :py:class:`bytes`
+        The undecoded output
+    """
+    __slots__ = ('_data', '_text')
+
+    def __init__(self, data):
+        self._data = data
+        self._text = None
+
+    @property
+    def data(self):
+        """:py:class:`bytes`: the undecoded output"""
+        return self._data
+
+    @property
+    def view(self):
+        """:py:class:`memoryview`: a view over the undecoded output, which can be sliced without copying it"""
+        return memoryview(self._data)
+
+    @property
+    def text(self):
+        """:py:class:`str`: the decoded output. It is decoded on first access"""
+        if self._text is None:
+            self._text = utils.safe_unicode(self._data)
+        return self._text
+
+    def splitlines(self):
+        """Returns the decoded output's lines
+
+        Returns
+        -------
+        : :py:class:`list` [:py:class:`str`]
+        """
+        return self.text.splitlines()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __bytes__(self):
+        return self._data
+
+    def __eq__(self, other):
+        if isinstance(other, RawOutput):
+            other = other.data
+        return self._data == utils.safe_bytes(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self._data)
+
+    def __repr__(self):
+        return '{}({!r})'.format(self.__class__.__name__, self._data)
+
+
+class SpilledOutput(RawOutput):
+    """A command's undecoded output that outgrew the executor's `spill_threshold`, as returned by
+    :py:meth:`Executor.__call__`
+
+    The output is kept in a temporary file and accessed through :py:mod:`mmap`, so that it can be sliced, searched and
+    iterated over without being read in memory as a whole. The file is deleted once the output is closed or collected.
+
+    Example
+    -------
+    >>> from pybsd import Executor
+    >>> out = Executor()('seq', '100000', spill_threshold=1024)[1]
+    >>> len(out), out[:6], next(iter(out))
+    (588895, b'1\\n2\\n3\\n', '1')
+    >>> out.search(br'^9999.$').group()
+    b'99990'
+    >>> out.close()
+
+    Parameters
+    ----------
+    file : file object
+        The temporary file holding the output
+    """
+    __slots__ = ('_file',)
+
+    def __init__(self, file):
+        file.flush()
+        self._file = file
+        size = os.fstat(file.fileno()).st_size
+        super(SpilledOutput, self).__init__(mmap.mmap(file.fileno(), size, access=mmap.ACCESS_READ) if size else b'')
+
+    @property
+    def data(self):
+        """:py:class:`bytes`: the undecoded output, read in memory as a whole"""
+        return self._data[:]
+
+    @property
+    def view(self):
+        """:py:class:`memoryview`: a view over the undecoded output, which can be sliced without copying it. On python 2,
+        whose mmaps do not support memory views, the output is read in memory as a whole"""
+        if six.PY2 and isinstance(self._data, mmap.mmap):
+            return memoryview(self._data[:])
+        return memoryview(self._data)
+
+    @property
+    def text(self):
+        """:py:class:`str`: the decoded output, read in memory as a whole. It is decoded on first access"""
+        if self._text is None:
+            self._text = utils.safe_unicode(self._data[:])
+        return self._text
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __iter__(self):
+        # Decodes one line at a time, stripped of its line ending
+        start = 0
+        end = len(self._data)
+        while start < end:
+            stop = self._data.find(b'\n', start)
+            if stop == -1:
+                stop = end
+            line = self._data[start:stop]
+            yield utils.safe_unicode(line[:-1] if line.endswith(b'\r') else line)
+            start = stop + 1
+
+    def splitlines(self):
+        """Returns the decoded output's lines. Iterate over the output instead to keep them from being held in memory
+
+        Returns
+        -------
+        : :py:class:`list` [:py:class:`str`]
+        """
+        return list(self)
+
+    def search(self, pattern, flags=re.MULTILINE):
+        """Scans the output for the first match of a regular expression
+
+        Parameters
+        ----------
+        pattern : :py:class:`bytes` or compiled bytes pattern
+            The regular expression
+        flags : Optional[:py:class:`int`]
+            The flags `pattern` is compiled with, if it is not compiled yet. :py:data:`re.MULTILINE` by default, so that
+            `^` and `$` match at line boundaries.
+
+        Returns
+        -------
+        : Optional[:py:class:`re.Match`]
+            the match, None if there is none
+        """
+        return self._compile(pattern, flags).search(self._data)
+
+    def finditer(self, pattern, flags=re.MULTILINE):
+        """Returns an iterator over the matches of a regular expression in the output. See :py:meth:`search`
+
+        Returns
+        -------
+        : iterator over :py:class:`re.Match`
+        """
+        return self._compile(pattern, flags).finditer(self._data)
+
+    def _compile(self, pattern, flags):
+        if hasattr(pattern, 'search'):
+            return pattern
+        return re.compile(utils.safe_bytes(pattern), flags)
+
+    def close(self):
+        """Releases the mapping and deletes the temporary file"""
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+    def __eq__(self, other):
+        if isinstance(other, RawOutput):
+            other = other.data
+        other = utils.safe_bytes(other)
+        return len(self._data) == len(other) and self._data[:] == other
+
+    def __hash__(self):
+        return hash(self._data[:])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __repr__(self):
+        return '{}(<{} bytes>)'.format(self.__class__.__name__, len(self._data))
+
+
+class _SpillSink(object):
+    # Collects a pipe's chunks in memory until they outgrow `threshold`, then in a temporary file. Never spills if
+    # `threshold` is None
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.chunks = []
+        self.size = 0
+        self.file = None
+
+    def append(self, chunk):
+        if self.file is not None:
+            self.file.write(chunk)
+            return
+        self.chunks.append(chunk)
+        self.size += len(chunk)
+        if self.threshold is not None and self.size > self.threshold:
+            self.file = tempfile.TemporaryFile()
+            self.file.writelines(self.chunks)
+            self.chunks = None
+
+    def value(self):
+        # The raw bytes, or a :py:class:`SpilledOutput` if they were spilled
+        if self.file is None:
+            return b''.join(self.chunks)
+        return SpilledOutput(self.file)
+
+
+class SessionExecutor(Executor):
+    """Executes commands through one long-lived shell instead of spawning a process per command
+
+    The shell is started on first use. Each command is written to its stdin followed by delimiters carrying a per-command
+    token and the return code, which allows stdout, stderr and return codes to be told apart for every command. As every
+    :py:class:`~pybsd.systems.base.BaseSystem` instantiates its own executor, it can be used as a system's `ExecutorClass`
+    to get one shell per system.
+
+    Commands are run as simple commands by the shell, so they must not read from the shell's stdin (it is redirected to
+    /dev/null unless `stdin` is passed) and a missing binary yields a return code of 127 instead of an :py:exc:`OSError`.
+    The shell's output is framed in memory, so `spill_threshold` does not apply.
+
+    Example
+    -------
+    >>> from pybsd.executors import SessionExecutor
+    >>> with SessionExecutor() as execute:
+    ...     execute('echo', 'foo')
+    ...     execute('sh', '-c', 'exit 3', out='', err='')
+    (0, 'foo\\n', '')
+    3
+
+    Attributes
+    ----------
+    shell : :py:class:`tuple`
+        the command line that starts the session's shell
+    """
+    shell = ('/bin/sh',)
+
+    def __init__(self, instance=None, prefix_args=(), splitlines=False, transport=None):
+        super(SessionExecutor, self).__init__(instance=instance, prefix_args=prefix_args, splitlines=splitlines,
+                                              transport=transport)
+        self._session = None
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+        self._token = 'pybsd_{}'.format(uuid.uuid4().hex)
+
+    @property
+    def is_open(self):
+        """:py:class:`bool`: Whether the session's shell is currently running."""
+        return self._session is not None and self._session.poll() is None
+
+    def open(self):
+        """Starts the session's shell, if it is not running yet. It is called automatically by the first command."""
+        if not self.is_open:
+            # The shell gets its own group, where supported, so that overdue commands can be terminated with it
+            self._session = self._popen(self.shell, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                        **_session_kwargs())
+
+    def close(self):
+        """Terminates the session's shell. A new one will be started if another command is executed."""
+        session, self._session = self._session, None
+        if session is not None:
+            for pipe in (session.stdin, session.stdout, session.stderr):
+                pipe.close()
+            session.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _run(self, args, stdin=None, timeout=None, spill_threshold=None):
+        # The shell's output is framed in memory, so `spill_threshold` does not apply
+        with self._lock:
+            self.open()
+            marker = '{}_{}'.format(self._token, next(self._counter))
+            try:
+                __logger__.debug('Executing in session:\n%s', args)
+                return self._exchange(frame(args, marker, stdin).encode('utf8'), marker.encode('utf8'), args, timeout)
+            except ExecutionTimeoutError:
+                self._terminate()
+                raise
+            except (IOError, OSError):
+                self.close()
+                raise
+
+    def _terminate(self):
+        # Terminates the shell and the commands it runs: SIGTERM first, then SIGKILL once `kill_grace` expired
+        session = self._session
+        _signal_group(session, signal.SIGTERM)
+        grace_deadline = time.time() + self.kill_grace
+        while session.poll() is None and time.time() < grace_deadline:
+            time.sleep(0.01)
+        _signal_group(session, signal.SIGKILL)
+        self.close()
+
+    def _exchange(self, script, marker, args=(), timeout=None):
+        # Sends `script` to the shell and reads both its stdout and stderr until their delimiters show up
+        deadline = None if timeout is None else time.time() + timeout
+        session = self._session
+        session.stdin.write(script)
+        session.stdin.flush()
+        out_fd, err_fd = session.stdout.fileno(), session.stderr.fileno()
+        buffers = {out_fd: bytearray(), err_fd: bytearray()}
+        delimiters = {out_fd: marker + b':', err_fd: marker + b'\n'}
+        positions = {}
+        pending = [out_fd, err_fd]
+        while pending:
+            remaining = None if deadline is None else deadline - time.time()
+            if remaining is not None and remaining <= 0:
+                raise ExecutionTimeoutError(args, timeout, bytes(buffers[out_fd]), bytes(buffers[err_fd]))
+            for fd in select.select(pending, [], [], remaining)[0]:
+                chunk = os.read(fd, 65536)
+                if not chunk:
+                    if self.instance is not None:
+                        self.transport.check(session.wait(), bytes(buffers[err_fd]))
+                    raise IOError('The session shell exited unexpectedly')
+                buf = buffers[fd]
+                start = max(0, len(buf) - len(delimiters[fd]))
+                buf += chunk
+                if fd not in positions:
+                    pos = buf.find(delimiters[fd], start)
+                    if pos != -1:
+                        positions[fd] = pos
+                if fd in positions and buf.endswith(b'\n'):
+                    pending.remove(fd)
+        out = bytes(buffers[out_fd])
+        _rc = int(out[positions[out_fd] + len(delimiters[out_fd]):])
+        return _rc, out[:positions[out_fd]], bytes(buffers[err_fd][:positions[err_fd]])
+
+
+class Batch(object):
+    """Collects commands and runs them as a single shell script, with per-command framing of their output.
+
+    The batch is run when :py:meth:`run` is called or when its context exits without error. Commands do not read stdin.
+
+    Parameters
+    ----------
+    executor : :py:class:`~pybsd.executors.Executor`
+        The executor running the script
+    stop_on_error : Optional[:py:class:`bool`]
+        Whether commands following the first one that fails are skipped
+    timeout : Optional[:py:class:`float`]
+        How long, in seconds, the whole batch may run. Once it expires the script is terminated, commands that completed
+        keep their results and the others get None.
+    tag : Optional[:py:class:`tuple`]
+        The (system, command, subcommand) the batch is accounted under by the executor's `instrumentation`, if it has
+        one. Defaults to the host, `sh` and `-s`.
+
+    Attributes
+    ----------
+    shell : :py:class:`tuple`
+        the command line that runs the script, fed on its stdin
+    """
+    shell = ('/bin/sh', '-s')
+
+    def __init__(self, executor, stop_on_error=False, timeout=None, tag=None):
+        self.executor = executor
+        self.stop_on_error = stop_on_error
+        self.timeout = timeout
+        self.tag = tag
+        #: :py:class:`bool`: whether the batch was terminated because it did not complete within `timeout`
+        self.timed_out = False
+        #: :py:class:`list` [:py:class:`tuple`]: the commands' arguments, in order
+        self.commands = []
+        #: :py:class:`list`: a (rc, out, err) :py:class:`tuple` per command, in order, or None for skipped commands.
+        #: None until the batch is run
+        self.results = None
+
+    def add(self, *cmd_args):
+        """Adds a command to the batch
+
+        Parameters
+        ----------
+        cmd_args : the command's arguments, the executor's `prefix_args` are prepended to them
+
+        Returns
+        -------
+        : :py:class:`int`
+            the command's index in :py:attr:`results`
+        """
+        self.commands.append(self.executor.prefix_args + cmd_args)
+        return len(self.commands) - 1
+
+    def script(self, markers):
+        """Returns the script running every command of the batch
+
+        Parameters
+        ----------
+        markers : :py:class:`list` [:py:class:`str`]
+            The commands' markers, in order
+
+        Returns
+        -------
+        : :py:class:`str`
+        """
+        lines = []
+        for args, marker in zip(self.commands, markers):
+            lines.append(frame(args, marker))
+            if self.stop_on_error:
+                lines.append('[ $__pybsd_rc -eq 0 ] || exit 0\n')
+        return ''.join(lines)
+
+    def run(self):
+        """Runs the batch
+
+        Returns
+        -------
+        : :py:class:`list`
+            a (rc, out, err) :py:class:`tuple` per command, in order, or None for skipped and overdue commands.
+        """
+        token = 'pybsd_{}'.format(uuid.uuid4().hex)
+        markers = ['{}_{}'.format(token, index) for index in range(len(self.commands))]
+        __logger__.debug('Executing batch:\n%s', self.commands)
+        try:
+            _rc, _out, _err = self._run_script(self.shell, self.script(markers).encode('utf8'), self.timeout)
+        except ExecutionTimeoutError as e:
+            self.timed_out = True
+            _out, _err = e.out or b'', e.err or b''
+        self.results = [None if result is None else self.executor._result(args, *result)
+                        for args, result in zip(self.commands, unframe(_out, _err, markers))]
+        return self.results
+
+    def _run_script(self, args, stdin, timeout):
+        # Runs the script through the executor's instrumentation, if it has one
+        run_kwargs = {} if timeout is None else {'timeout': timeout}
+        if self.executor.instrumentation is None:
+            return self.executor._run(args, stdin=stdin, **run_kwargs)
+        return self.executor._instrumented_run(args, stdin, self.tag, **run_kwargs)
+
+    def __len__(self):
+        return len(self.commands)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.run()
+
+
+class StreamResult(object):
+    """An iterator over the decoded stdout lines of a running command, as returned by :py:meth:`Executor.stream`
+
+    Parameters
+    ----------
+    proc : :py:class:`subprocess.Popen`
+        The running process
+    errfile : :py:class:`file`
+        The temporary file the process' stderr is spooled to
+    args : :py:class:`tuple`
+        The command's arguments
+    transport : Optional[:py:class:`~pybsd.transports.BaseTransport`]
+        The transport the command runs through, if remote
+    channel : Optional[context manager]
+        The transport channel held by the command, released once it exits
+    """
+    def __init__(self, proc, errfile, args, transport=None, channel=None):
+        self.proc = proc
+        self.errfile = errfile
+        self.args = args
+        self.transport = transport
+        self.channel = channel
+        #: :py:class:`int`: the command's return code, None until the stream is exhausted or closed
+        self.rc = None
+        #: :py:class:`str`: the command's stderr, None until the stream is exhausted or closed
+        self.err = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self.proc.stdout.readline() if self.rc is None else b''
+        if not line:
+            self.close()
+            raise StopIteration
+        if line.endswith(b'\n'):
+            line = line[:-1]
+            if line.endswith(b'\r'):
+                line = line[:-1]
+        return utils.safe_unicode(line)
+
+    next = __next__
+
+    def close(self):
+        """Waits for the command to exit and collects its return code and stderr.
+
+        Any stdout that was not consumed is discarded.
+        """
+        if self.rc is not None:
+            return
+        self.proc.stdout.close()
+        self.rc = self.proc.wait()
+        if self.channel is not None:
+            self.channel.__exit__(None, None, None)
+        self.errfile.seek(0)
+        err = self.errfile.read()
+        self.errfile.close()
+        if self.transport is not None:
+            self.transport.check(self.rc, err)
+        self.err = utils.safe_unicode(err)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class PipelineResult(object):
+    """The outcome of the stages of a pipeline, as returned by :py:meth:`Executor.pipe`
+
+    Parameters
+    ----------
+    executor : :py:class:`~pybsd.executors.Executor`
+        The executor that ran the pipeline
+    args : :py:class:`tuple`
+        The stages' arguments, separated by '|'
+    returncodes : :py:class:`list` [:py:class:`int`]
+        The stages' return codes, in order
+    out : Optional[:py:class:`bytes`]
+        The last stage's raw stdout, None if it was redirected
+    errs : :py:class:`list` [:py:class:`bytes`]
+        The stages' raw stderr, in order
+    byte_counts : Optional[:py:class:`list` [:py:class:`int`]]
+        The number of bytes each stage wrote to its stdout, in order, or None if they were not counted
+    raw : Optional[:py:class:`bool`]
+        Whether `out` and `errs` are kept undecoded
+    """
+    def __init__(self, executor, args, returncodes, out, errs, byte_counts=None, raw=False):
+        self.args = args
+        #: :py:class:`list` [:py:class:`int`]: the stages' return codes, in order
+        self.returncodes = returncodes
+        #: :py:class:`list`: the number of bytes each stage wrote to its stdout, in order. None if they were not counted
+        self.byte_counts = byte_counts
+        #: the last stage's stdout, decoded as by :py:meth:`Executor.__call__`. None if it was redirected
+        self.out = None if out is None else executor._result(args, 0, out, b'', raw=raw)[1]
+        #: :py:class:`list`: the stages' stderr, in order, decoded as by :py:meth:`Executor.__call__`
+        self.errs = [executor._result(args, 0, b'', err, raw=raw)[2] for err in errs]
+
+    @property
+    def rc(self):
+        """:py:class:`int`: the return code of the last stage that failed, as with the shell's `pipefail` option, or 0"""
+        failed = [rc for rc in self.returncodes if rc]
+        return failed[-1] if failed else 0
+
+    def __repr__(self):
+        return '{}(returncodes={!r})'.format(self.__class__.__name__, self.returncodes)
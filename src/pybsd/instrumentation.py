@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+"""Measures where orchestration time goes.
+
+An :py:class:`~pybsd.instrumentation.Instrumentation` set as an executor's `instrumentation` records a
+:py:class:`~pybsd.instrumentation.Sample` per command, aggregates samples into per (system, command, subcommand)
+statistics, and passes them to hooks, to be shipped to a metrics pipeline.
+
+Example
+-------
+>>> from pybsd import Executor
+>>> from pybsd.instrumentation import Instrumentation
+>>> instrumentation = Instrumentation()
+>>> execute = Executor()
+>>> execute.instrumentation = instrumentation
+>>> execute('echo', 'foo', tag=('box01', 'echo', None))
+(0, 'foo\\n', '')
+>>> stats = instrumentation.stats()[('box01', 'echo', None)]
+>>> stats['calls'], stats['bytes_out'], stats['rcs']
+(1, 4, {0: 1})
+"""
+from __future__ import absolute_import, print_function, unicode_literals
+
+import logging
+import math
+import threading
+import time
+import timeit
+
+import six
+
+__logger__ = logging.getLogger('pybsd')
+
+#: :py:class:`function`: the clock durations are measured with
+timer = timeit.default_timer
+
+
+class Histogram(object):
+    """A histogram with logarithmic buckets, whose memory use does not depend on the number of values
+
+    Percentiles are approximated by the upper bound of their bucket, within a relative error of `2 ** (1 / precision) - 1`.
+
+    Example
+    -------
+    >>> from pybsd.instrumentation import Histogram
+    >>> histogram = Histogram()
+    >>> for value in range(1, 101):
+    ...     histogram.add(value / 1000.0)
+    >>> histogram.count, round(histogram.percentile(50), 3), histogram.percentile(100)
+    (100, 0.05, 0.1)
+
+    Parameters
+    ----------
+    precision : Optional[:py:class:`int`]
+        The number of buckets per power of two
+    """
+
+    def __init__(self, precision=16):
+        self.precision = precision
+        self._buckets = {}
+        #: :py:class:`int`: the number of values
+        self.count = 0
+        #: :py:class:`float`: the sum of the values
+        self.total = 0.0
+        #: :py:class:`float`: the smallest value, None if there are none
+        self.min = None
+        #: :py:class:`float`: the largest value, None if there are none
+        self.max = None
+
+    def add(self, value):
+        """Adds a value
+
+        Parameters
+        ----------
+        value : :py:class:`float`
+            The value, >= 0
+        """
+        index = int(math.floor(math.log(max(value, 1e-12), 2) * self.precision))
+        self._buckets[index] = self._buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    @property
+    def mean(self):
+        """:py:class:`float`: the mean of the values, None if there are none"""
+        return self.total / self.count if self.count else None
+
+    def percentile(self, q):
+        """Returns an approximation of a percentile of the values
+
+        Parameters
+        ----------
+        q : :py:class:`float`
+            The percentile, between 0 and 100
+
+        Returns
+        -------
+        : :py:class:`float`
+            None if there are no values
+        """
+        if not self.count:
+            return None
+        rank = max(1, int(math.ceil(q / 100.0 * self.count)))
+        seen = 0
+        for index in sorted(self._buckets):
+            seen += self._buckets[index]
+            if seen >= rank:
+                return min(max(2 ** ((index + 1) / float(self.precision)), self.min), self.max)
+
+    def summary(self):
+        """Returns the histogram's statistics
+
+        Returns
+        -------
+        : :py:class:`dict`
+            count, mean, min, max, p50, p90 and p99
+        """
+        return {'count': self.count, 'mean': self.mean, 'min': self.min, 'max': self.max,
+                'p50': self.percentile(50), 'p90': self.percentile(90), 'p99': self.percentile(99)}
+
+
+class Sample(object):
+    """The measures of one command's execution
+
+    Parameters
+    ----------
+    key : :py:class:`tuple`
+        (system, command, subcommand)
+    args : :py:class:`tuple`
+        The command's arguments
+    bytes_in : :py:class:`int`
+        The size of the data fed to the command's stdin
+    """
+    __slots__ = ('key', 'args', 'started', 'wall_time', 'spawn_time', 'bytes_in', 'bytes_out', 'rc', 'error', '_start')
+
+    def __init__(self, key, args, bytes_in=0):
+        self.key = key
+        self.args = args
+        #: :py:class:`float`: when the command started, as a timestamp
+        self.started = time.time()
+        #: :py:class:`float`: how long the command took, in seconds. None until it completes
+        self.wall_time = None
+        #: :py:class:`float`: how long launching the command's process took, in seconds
+        self.spawn_time = 0.0
+        self.bytes_in = bytes_in
+        #: :py:class:`int`: the size of the command's stdout and stderr
+        self.bytes_out = 0
+        #: :py:class:`int`: the command's return code. None until it completes or if it failed to run
+        self.rc = None
+        #: :py:class:`Exception`: the exception raised while running the command, if any
+        self.error = None
+        self._start = timer()
+
+    def __repr__(self):
+        return 'Sample({}, wall_time={}, rc={})'.format(self.key, self.wall_time, self.rc)
+
+
+class CommandStats(object):
+    """The aggregated measures of a (system, command, subcommand)"""
+
+    def __init__(self):
+        #: :py:class:`~pybsd.instrumentation.Histogram`: the commands' wall times
+        self.wall_time = Histogram()
+        #: :py:class:`~pybsd.instrumentation.Histogram`: the time spent launching the commands' processes
+        self.spawn_time = Histogram()
+        #: :py:class:`int`: the total size of the data fed to the commands
+        self.bytes_in = 0
+        #: :py:class:`int`: the total size of the commands' output
+        self.bytes_out = 0
+        #: :py:class:`dict`: the number of commands per return code. Commands that failed to run are counted under None
+        self.rcs = {}
+
+    def add(self, sample):
+        """Aggregates a sample
+
+        Parameters
+        ----------
+        sample : :py:class:`~pybsd.instrumentation.Sample`
+        """
+        self.wall_time.add(sample.wall_time)
+        self.spawn_time.add(sample.spawn_time)
+        self.bytes_in += sample.bytes_in
+        self.bytes_out += sample.bytes_out
+        self.rcs[sample.rc] = self.rcs.get(sample.rc, 0) + 1
+
+    def summary(self):
+        """Returns the statistics as plain python objects
+
+        Returns
+        -------
+        : :py:class:`dict`
+        """
+        return {'calls': self.wall_time.count, 'wall_time': self.wall_time.summary(),
+                'spawn_time': self.spawn_time.summary(), 'bytes_in': self.bytes_in, 'bytes_out': self.bytes_out,
+                'rcs': dict(self.rcs)}
+
+
+class Instrumentation(object):
+    """Collects the samples of the commands run by the executors it is attached to
+
+    Hooks are called with the :py:class:`~pybsd.instrumentation.Sample` of each command: pre hooks before it runs, with
+    only its key and arguments set, and post hooks once it completed, successfully or not. Exceptions raised by hooks
+    are logged and ignored, so that metrics shipping can never break orchestration.
+    """
+
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+        #: :py:class:`list` [:py:class:`function`]: the functions called before each command
+        self.pre_hooks = []
+        #: :py:class:`list` [:py:class:`function`]: the functions called after each command
+        self.post_hooks = []
+
+    def add_hooks(self, pre=None, post=None):
+        """Registers hooks
+
+        Parameters
+        ----------
+        pre : Optional[:py:class:`function`]
+            called with a :py:class:`~pybsd.instrumentation.Sample` before each command
+        post : Optional[:py:class:`function`]
+            called with a :py:class:`~pybsd.instrumentation.Sample` after each command
+        """
+        if pre is not None:
+            self.pre_hooks.append(pre)
+        if post is not None:
+            self.post_hooks.append(post)
+
+    def start(self, key, args, stdin=None):
+        """Starts measuring a command
+
+        Parameters
+        ----------
+        key : :py:class:`tuple`
+            (system, command, subcommand)
+        args : :py:class:`tuple`
+            The command's arguments
+        stdin : Optional[:py:class:`bytes`]
+            The data fed to the command's stdin
+
+        Returns
+        -------
+        : :py:class:`~pybsd.instrumentation.Sample`
+        """
+        sample = Sample(key, args, bytes_in=len(stdin or b''))
+        self._call(self.pre_hooks, sample)
+        return sample
+
+    def finish(self, sample, rc=None, out=None, err=None, error=None):
+        """Completes a sample, aggregates it and passes it to the post hooks
+
+        Parameters
+        ----------
+        sample : :py:class:`~pybsd.instrumentation.Sample`
+            The sample returned by :py:meth:`start`
+        rc : Optional[:py:class:`int`]
+            The command's return code
+        out : Optional[:py:class:`bytes`]
+            The command's raw stdout
+        err : Optional[:py:class:`bytes`]
+            The command's raw stderr
+        error : Optional[:py:class:`Exception`]
+            The exception raised while running the command, if any
+        """
+        sample.wall_time = timer() - sample._start
+        sample.rc = rc
+        sample.bytes_out = len(out or b'') + len(err or b'')
+        sample.error = error
+        with self._lock:
+            if sample.key not in self._stats:
+                self._stats[sample.key] = CommandStats()
+            self._stats[sample.key].add(sample)
+        self._call(self.post_hooks, sample)
+
+    def _call(self, hooks, sample):
+        for hook in hooks:
+            try:
+                hook(sample)
+            except Exception:
+                __logger__.exception('Instrumentation hook %r failed', hook)
+
+    def stats(self, key=None):
+        """Returns the aggregated statistics
+
+        Parameters
+        ----------
+        key : Optional[:py:class:`tuple`]
+            A (system, command, subcommand). All keys if None.
+
+        Returns
+        -------
+        : :py:class:`dict`
+            the summary of `key`'s :py:class:`~pybsd.instrumentation.CommandStats`, or a summary per key if `key` is None
+        """
+        with self._lock:
+            if key is not None:
+                return self._stats[key].summary() if key in self._stats else CommandStats().summary()
+            return {k: stats.summary() for k, stats in six.iteritems(self._stats)}
+
+    def reset(self):
+        """Drops the aggregated statistics"""
+        with self._lock:
+            self._stats.clear()
@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+"""Starts, stops and restarts jails across many masters, in waves that follow the dependencies between jail classes.
+
+The jails of a wave are handled concurrently: each master gets at most `per_master` concurrent ezjail-admin invocations,
+each passing a share of the master's jails to :py:meth:`~pybsd.commands.EzjailAdmin.start_many` and its siblings, and at
+most `max_workers` invocations run at a time over all masters. A wave only starts once the previous one completed.
+
+Example
+-------
+>>> from pybsd.orchestrator import Orchestrator
+>>> orchestrator = Orchestrator(dependencies={'web': ['db'], 'db': ['dns']}, max_workers=16, per_master=2)
+>>> report = orchestrator.start(jails)             # doctest: +SKIP
+>>> report.succeeded, report.critical_path         # doctest: +SKIP
+(True, 12.7)
+"""
+from __future__ import absolute_import, print_function, unicode_literals
+
+import logging
+import threading
+
+import six
+from six.moves import queue
+
+from .exceptions import DependencyCycleError
+from .instrumentation import timer
+
+__logger__ = logging.getLogger('pybsd')
+
+
+class WaveReport(object):
+    """The outcome of a wave
+
+    Parameters
+    ----------
+    classes : :py:class:`list` [:py:class:`str`]
+        The jail classes of the wave
+    """
+    __slots__ = ('classes', 'results', 'durations', 'errors', 'elapsed')
+
+    def __init__(self, classes):
+        self.classes = classes
+        #: :py:class:`dict`: whether the action succeeded, per :py:class:`~pybsd.systems.jails.Jail`
+        self.results = {}
+        #: :py:class:`dict`: how long, in seconds, the slowest invocation took, per master
+        self.durations = {}
+        #: :py:class:`dict`: the exception raised by a failed invocation, per master
+        self.errors = {}
+        #: :py:class:`float`: how long, in seconds, the wave took
+        self.elapsed = None
+
+    @property
+    def succeeded(self):
+        """:py:class:`bool`: whether the action succeeded for every jail of the wave"""
+        return all(six.itervalues(self.results))
+
+    @property
+    def critical_path(self):
+        """:py:class:`tuple` (:py:class:`~pybsd.systems.masters.Master`, :py:class:`float`): the master the wave waited
+        for the longest, and how long, in seconds. None if the wave had no invocations."""
+        if not self.durations:
+            return None
+        return max(six.iteritems(self.durations), key=lambda item: item[1])
+
+    def __repr__(self):
+        return 'WaveReport({}, jails={}, elapsed={})'.format(self.classes, len(self.results), self.elapsed)
+
+
+class OrchestrationReport(object):
+    """The outcome of an action run over jails
+
+    Parameters
+    ----------
+    action : :py:class:`str`
+        `start`, `stop` or `restart`
+    """
+
+    def __init__(self, action):
+        self.action = action
+        #: :py:class:`list` [:py:class:`~pybsd.orchestrator.WaveReport`]: the waves that ran, in order
+        self.waves = []
+        #: :py:class:`list` [:py:class:`~pybsd.systems.jails.Jail`]: the jails of the waves skipped after a failure
+        self.skipped = []
+
+    @property
+    def results(self):
+        """:py:class:`dict`: whether the action succeeded, per :py:class:`~pybsd.systems.jails.Jail`. Skipped jails are
+        left out."""
+        results = {}
+        for wave in self.waves:
+            results.update(wave.results)
+        return results
+
+    @property
+    def succeeded(self):
+        """:py:class:`bool`: whether the action succeeded for every jail"""
+        return not self.skipped and all(wave.succeeded for wave in self.waves)
+
+    @property
+    def critical_path(self):
+        """:py:class:`float`: the sum of the waves' critical paths, in seconds, that is how long the action would take
+        without any overhead between invocations"""
+        return sum(wave.critical_path[1] for wave in self.waves if wave.critical_path is not None)
+
+    @property
+    def elapsed(self):
+        """:py:class:`float`: how long, in seconds, the waves took"""
+        return sum(wave.elapsed for wave in self.waves)
+
+
+class Orchestrator(object):
+    """Runs lifecycle actions over jails attached to many masters, in dependency order
+
+    Jails are grouped in waves by their :py:attr:`~pybsd.systems.jails.Jail.jail_class`: a class' jails are started
+    in a wave following the waves of all the classes it depends on, and stopped in a wave preceding them. Dependencies
+    are followed through classes that have no jail in the set: if `web` depends on `app`, which depends on `db`, `web`
+    jails are started after `db` jails even without any `app` jail.
+
+    Parameters
+    ----------
+    dependencies : Optional[:py:class:`dict`]
+        The classes each jail class depends on, as in `{'web': ['db']}`. Without dependencies, all jails form one wave.
+    max_workers : Optional[:py:class:`int`]
+        The number of concurrent ezjail-admin invocations over all masters
+    per_master : Optional[:py:class:`int`]
+        The number of concurrent ezjail-admin invocations on a master
+    stop_on_error : Optional[:py:class:`bool`]
+        Whether the waves following a wave in which the action failed for any jail are skipped
+    """
+
+    def __init__(self, dependencies=None, max_workers=8, per_master=2, stop_on_error=True):
+        self.dependencies = dict((jail_class, set(classes)) for jail_class, classes in six.iteritems(dependencies or {}))
+        self.max_workers = max_workers
+        self.per_master = per_master
+        self.stop_on_error = stop_on_error
+
+    def waves(self, jails, reverse=False):
+        """Groups jails in waves, in dependency order
+
+        Parameters
+        ----------
+        jails : iterable of :py:class:`~pybsd.systems.jails.Jail`
+        reverse : Optional[:py:class:`bool`]
+            whether the order is reversed, dependents first, as when stopping jails
+
+        Returns
+        -------
+        : :py:class:`list` [:py:class:`tuple`]
+            a (classes, jails) :py:class:`tuple` per wave
+
+        Raises
+        ------
+        DependencyCycleError
+            raised if jail classes depend on each other
+        """
+        by_class = {}
+        for jail in jails:
+            by_class.setdefault(jail.jail_class, []).append(jail)
+        cycle = self._cycle(by_class)
+        if cycle:
+            raise DependencyCycleError(cycle)
+        # Classes are ordered by all the classes they depend on, directly or through classes without jails in the set
+        remaining = dict((jail_class, self._depends_on(jail_class) & set(by_class)) for jail_class in by_class)
+        waves = []
+        while remaining:
+            ready = sorted(jail_class for jail_class, depends_on in six.iteritems(remaining) if not depends_on)
+            for jail_class in ready:
+                del remaining[jail_class]
+            for depends_on in six.itervalues(remaining):
+                depends_on.difference_update(ready)
+            wave_jails = [jail for jail_class in ready for jail in by_class[jail_class]]
+            waves.append((ready, sorted(wave_jails, key=lambda jail: (_master_name(jail), jail.name))))
+        return waves[::-1] if reverse else waves
+
+    def _edges(self, jail_class):
+        # The classes a class depends on directly. A class depending on itself is ignored.
+        return sorted(self.dependencies.get(jail_class, set()) - {jail_class})
+
+    def _depends_on(self, jail_class):
+        # Returns the classes a class depends on, directly or not
+        reached, stack = set(), self._edges(jail_class)
+        while stack:
+            other = stack.pop()
+            if other not in reached:
+                reached.add(other)
+                stack.extend(self._edges(other))
+        return reached
+
+    def _cycle(self, roots):
+        # Returns the classes of the first dependency cycle reachable from roots, in dependency order, None if there is none
+        visited, path = set(), []
+
+        def visit(jail_class):
+            visited.add(jail_class)
+            path.append(jail_class)
+            for other in self._edges(jail_class):
+                if other in path:
+                    return path[path.index(other):]
+                if other not in visited:
+                    cycle = visit(other)
+                    if cycle:
+                        return cycle
+            path.pop()
+            return None
+
+        for root in sorted(roots):
+            if root not in visited:
+                cycle = visit(root)
+                if cycle:
+                    return cycle
+        return None
+
+    def run(self, action, jails):
+        """Runs an action over jails, wave by wave
+
+        Parameters
+        ----------
+        action : :py:class:`str`
+            `start`, `stop` or `restart`. Jails are stopped in reverse dependency order.
+        jails : iterable of :py:class:`~pybsd.systems.jails.Jail`
+
+        Returns
+        -------
+        : :py:class:`~pybsd.orchestrator.OrchestrationReport`
+
+        Raises
+        ------
+        DependencyCycleError
+            raised if jail classes depend on each other, before any jail is handled
+        ValueError
+            raised if the action is unknown
+        """
+        if action not in ('start', 'stop', 'restart'):
+            raise ValueError('Unknown action `{}`'.format(action))
+        report = OrchestrationReport(action)
+        for classes, wave_jails in self.waves(jails, reverse=action == 'stop'):
+            if self.stop_on_error and report.waves and not report.waves[-1].succeeded:
+                report.skipped.extend(wave_jails)
+                continue
+            report.waves.append(self._run_wave(action, classes, wave_jails))
+        return report
+
+    def start(self, jails):
+        """Starts jails, dependencies first. See :py:meth:`run`"""
+        return self.run('start', jails)
+
+    def stop(self, jails):
+        """Stops jails, dependents first. See :py:meth:`run`"""
+        return self.run('stop', jails)
+
+    def restart(self, jails):
+        """Restarts jails, dependencies first. See :py:meth:`run`"""
+        return self.run('restart', jails)
+
+    def _run_wave(self, action, classes, jails):
+        wave = WaveReport(classes)
+        by_master = {}
+        for jail in jails:
+            if jail.master is None:
+                __logger__.warning('Can not %s `%s`, it is not attached to a master', action, jail.name)
+                wave.results[jail] = False
+            else:
+                by_master.setdefault(jail.master, []).append(jail)
+        # Each master's jails are shared out between at most `per_master` invocations
+        tasks = queue.Queue()
+        count = 0
+        for master, master_jails in six.iteritems(by_master):
+            shares = min(self.per_master, len(master_jails))
+            for index in range(shares):
+                tasks.put((master, master_jails[index::shares]))
+                count += 1
+        lock = threading.Lock()
+        started = timer()
+        workers = [threading.Thread(target=self._work, args=(action, tasks, wave, lock))
+                   for _ in range(min(self.max_workers, count))]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        wave.elapsed = timer() - started
+        return wave
+
+    def _work(self, action, tasks, wave, lock):
+        while True:
+            try:
+                master, jails = tasks.get_nowait()
+            except queue.Empty:
+                return
+            started = timer()
+            error = None
+            try:
+                outcome = getattr(master.ezjail_admin, action + '_many')([jail.hostname for jail in jails])
+            except Exception as e:
+                __logger__.exception('Can not %s jails on %s', action, master.name)
+                outcome, error = {}, e
+            duration = timer() - started
+            with lock:
+                for jail in jails:
+                    wave.results[jail] = outcome.get(jail.hostname, False)
+                wave.durations[master] = max(wave.durations.get(master, 0), duration)
+                if error is not None:
+                    wave.errors[master] = error
+
+
+def _master_name(jail):
+    return jail.master.name if jail.master is not None else ''
@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+"""Keeps the jail state of a fleet of masters up to date.
+
+A :py:class:`~pybsd.poller.Poller` periodically calls :py:meth:`~pybsd.systems.masters.Master.refresh` on every master
+registered with it, keeps the latest snapshot per master, and passes a :py:class:`~pybsd.poller.JailEvent` to its
+subscribers for every jail that started, stopped, appeared or disappeared between two snapshots.
+
+Example
+-------
+>>> from pybsd.poller import Poller
+>>> poller = Poller(interval=30, max_workers=4)
+>>> poller.subscribe(print)
+>>> poller.register(master01)                      # doctest: +SKIP
+>>> poller.register(master02, interval=5)          # doctest: +SKIP
+>>> poller.start()                                 # doctest: +SKIP
+"""
+from __future__ import absolute_import, print_function, unicode_literals
+
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+
+from six.moves import queue
+
+__logger__ = logging.getLogger('pybsd')
+
+#: :py:class:`str`: a jail that was not running is running
+STARTED = 'started'
+#: :py:class:`str`: a jail that was running is not running anymore
+STOPPED = 'stopped'
+#: :py:class:`str`: a jail is listed that was not
+APPEARED = 'appeared'
+#: :py:class:`str`: a jail that was listed is not anymore
+DISAPPEARED = 'disappeared'
+
+
+class JailEvent(object):
+    """A change of a jail's state between two snapshots of its master
+
+    Parameters
+    ----------
+    kind : :py:class:`str`
+        One of `started`, `stopped`, `appeared` or `disappeared`
+    master : :py:class:`~pybsd.systems.masters.Master`
+        The jail's master
+    name : :py:class:`str`
+        The jail's hostname, as listed by ezjail-admin
+    previous : Optional[:py:class:`~pybsd.commands.ezjail_admin.JailEntry`]
+        The jail's entry in the previous snapshot, None if it appeared
+    current : Optional[:py:class:`~pybsd.commands.ezjail_admin.JailEntry`]
+        The jail's entry in the current snapshot, None if it disappeared
+    """
+    __slots__ = ('kind', 'master', 'name', 'previous', 'current')
+
+    def __init__(self, kind, master, name, previous, current):
+        self.kind = kind
+        self.master = master
+        self.name = name
+        self.previous = previous
+        self.current = current
+
+    def __repr__(self):
+        return 'JailEvent({!r}, {!r}, {!r})'.format(self.kind, self.master.name, self.name)
+
+
+class _Registration(object):
+    # A master's polling settings and state
+    __slots__ = ('master', 'interval', 'concurrency', 'snapshot', 'in_flight', 'polled')
+
+    def __init__(self, master, interval, concurrency):
+        self.master = master
+        self.interval = interval
+        self.concurrency = concurrency
+        self.snapshot = None
+        self.in_flight = 0
+        self.polled = None
+
+
+class Poller(object):
+    """Refreshes the jail state of the registered masters in the background and notifies subscribers of changes
+
+    The first poll of each master happens at a random point of its interval, then every interval, so that the polls of
+    masters registered together are spread instead of happening in bursts. When a master is due while `concurrency` of
+    its polls are still running, that poll is skipped. The first snapshot of a master is a baseline: it produces no events.
+
+    Subscribers are called from the poller's worker threads. Exceptions raised by subscribers or while polling are
+    logged and ignored, so that one failing master or subscriber never stops the others.
+
+    Parameters
+    ----------
+    interval : Optional[:py:class:`float`]
+        The default time, in seconds, between two polls of a master
+    max_workers : Optional[:py:class:`int`]
+        The number of threads polling masters, which bounds the number of concurrent polls over all masters
+    concurrency : Optional[:py:class:`int`]
+        The default number of concurrent polls of a master
+    """
+
+    def __init__(self, interval=30, max_workers=4, concurrency=1):
+        self.interval = interval
+        self.max_workers = max_workers
+        self.concurrency = concurrency
+        #: :py:class:`list` [:py:class:`function`]: the functions called with each :py:class:`~pybsd.poller.JailEvent`
+        self.subscribers = []
+        self._registrations = {}
+        self._schedule = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._queue = queue.Queue()
+        self._threads = []
+        self._running = False
+
+    def register(self, master, interval=None, concurrency=None):
+        """Starts polling a master. Registering it again replaces its settings and drops its snapshot.
+
+        Parameters
+        ----------
+        master : :py:class:`~pybsd.systems.masters.Master`
+            the master to poll
+        interval : Optional[:py:class:`float`]
+            the time, in seconds, between two polls of this master. Defaults to the poller's `interval`.
+        concurrency : Optional[:py:class:`int`]
+            the number of concurrent polls of this master. Defaults to the poller's `concurrency`.
+        """
+        registration = _Registration(master, interval or self.interval, concurrency or self.concurrency)
+        with self._wakeup:
+            self._registrations[master] = registration
+            due = time.time() + random.uniform(0, registration.interval)
+            heapq.heappush(self._schedule, (due, next(self._sequence), registration))
+            self._wakeup.notify()
+
+    def unregister(self, master):
+        """Stops polling a master and drops its snapshot
+
+        Parameters
+        ----------
+        master : :py:class:`~pybsd.systems.masters.Master`
+        """
+        with self._lock:
+            self._registrations.pop(master, None)
+
+    @property
+    def masters(self):
+        """:py:class:`list` [:py:class:`~pybsd.systems.masters.Master`]: the registered masters"""
+        with self._lock:
+            return list(self._registrations)
+
+    def subscribe(self, subscriber):
+        """Registers a function called with each :py:class:`~pybsd.poller.JailEvent`
+
+        Parameters
+        ----------
+        subscriber : :py:class:`function`
+        """
+        self.subscribers.append(subscriber)
+
+    def unsubscribe(self, subscriber):
+        """Unregisters a function registered with :py:meth:`subscribe`
+
+        Parameters
+        ----------
+        subscriber : :py:class:`function`
+        """
+        self.subscribers.remove(subscriber)
+
+    def snapshot(self, master):
+        """Returns the latest snapshot of a registered master
+
+        Parameters
+        ----------
+        master : :py:class:`~pybsd.systems.masters.Master`
+
+        Returns
+        -------
+        : :py:class:`~pybsd.commands.ezjail_admin.JailList`
+            None if the master was not polled successfully yet
+
+        Raises
+        ------
+        KeyError
+            raised if the master is not registered
+        """
+        with self._lock:
+            return self._registrations[master].snapshot
+
+    def poll(self, master):
+        """Polls a registered master at once, in the calling thread, and notifies the subscribers of the changes
+
+        Parameters
+        ----------
+        master : :py:class:`~pybsd.systems.masters.Master`
+
+        Returns
+        -------
+        : :py:class:`list` [:py:class:`~pybsd.poller.JailEvent`]
+            the changes since the previous snapshot
+
+        Raises
+        ------
+        KeyError
+            raised if the master is not registered
+        SubprocessError
+            raised if ezjail-admin returned an error
+        InvalidOutputError
+            raised if ezjail-admin's output could not be parsed
+        """
+        with self._lock:
+            registration = self._registrations[master]
+        return self._poll(registration)
+
+    def _poll(self, registration):
+        started = time.time()
+        current = registration.master.refresh()
+        with self._lock:
+            if registration.polled is not None and registration.polled > started:
+                # A concurrent poll that started later already stored a fresher snapshot
+                return []
+            previous, registration.snapshot, registration.polled = registration.snapshot, current, started
+        # An unchanged listing is returned as the previous snapshot itself, see Master.refresh
+        events = [] if previous is None or current is previous else list(_diff(registration.master, previous, current))
+        for event in events:
+            for subscriber in list(self.subscribers):
+                try:
+                    subscriber(event)
+                except Exception:
+                    __logger__.exception('Poller subscriber %r failed', subscriber)
+        return events
+
+    def start(self):
+        """Starts the scheduler and worker threads. Does nothing if they are already running."""
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+        self._threads = [threading.Thread(target=self._schedule_polls, name='pybsd-poller')]
+        self._threads += [threading.Thread(target=self._work, name='pybsd-poller-{}'.format(i))
+                          for i in range(self.max_workers)]
+        for thread in self._threads:
+            thread.daemon = True
+            thread.start()
+
+    def stop(self, timeout=None):
+        """Stops the threads, once the polls in progress completed
+
+        Parameters
+        ----------
+        timeout : Optional[:py:class:`float`]
+            how long, in seconds, to wait for each thread. Waits as long as needed if None.
+        """
+        with self._wakeup:
+            if not self._running:
+                return
+            self._running = False
+            self._wakeup.notify()
+        for _ in range(self.max_workers):
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _schedule_polls(self):
+        with self._wakeup:
+            while self._running:
+                if not self._schedule:
+                    self._wakeup.wait()
+                    continue
+                due, _, registration = self._schedule[0]
+                now = time.time()
+                if due > now:
+                    self._wakeup.wait(due - now)
+                    continue
+                heapq.heappop(self._schedule)
+                if self._registrations.get(registration.master) is not registration:
+                    continue
+                # Keeps the master's phase in the interval, unless the poller fell more than an interval behind
+                due += registration.interval
+                heapq.heappush(self._schedule, (due if due > now else now + registration.interval,
+                                                next(self._sequence), registration))
+                if registration.in_flight < registration.concurrency:
+                    registration.in_flight += 1
+                    self._queue.put(registration)
+                else:
+                    __logger__.debug('Skipping a poll of %s, %s polls are in progress', registration.master.name,
+                                     registration.in_flight)
+
+    def _work(self):
+        while True:
+            registration = self._queue.get()
+            if registration is None:
+                return
+            try:
+                self._poll(registration)
+            except Exception:
+                __logger__.exception('Polling %s failed', registration.master.name)
+            finally:
+                with self._lock:
+                    registration.in_flight -= 1
+
+
+def _diff(master, previous, current):
+    # Yields the events that turn a snapshot into the next one
+    for name in sorted(set(previous) | set(current)):
+        before, after = previous.get(name), current.get(name)
+        if before is None:
+            yield JailEvent(APPEARED, master, name, None, after)
+        elif after is None:
+            yield JailEvent(DISAPPEARED, master, name, before, None)
+        else:
+            running, was_running = after.status[1:2] == 'R', before.status[1:2] == 'R'
+            if running and not was_running:
+                yield JailEvent(STARTED, master, name, before, after)
+            elif was_running and not running:
+                yield JailEvent(STOPPED, master, name, before, after)
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, print_function, unicode_literals
+
+import errno
+import logging
+import os
+import signal
+import subprocess
+import time
+
+try:
+    import selectors
+except ImportError:  # pragma: no cover
+    import selectors34 as selectors
+
+__logger__ = logging.getLogger('pybsd')
+
+#: :py:class:`bool`: whether :py:class:`~pybsd.processes.SpawnedProcess` can be used on this platform
+HAS_POSIX_SPAWN = hasattr(os, 'posix_spawnp') and hasattr(os, 'waitstatus_to_exitcode')
+
+_RESTORED_SIGNALS = tuple(getattr(signal, name) for name in ('SIGPIPE', 'SIGXFZ', 'SIGXFSZ') if hasattr(signal, name))
+
+
+class SpawnedProcess(object):
+    """A minimal :py:class:`subprocess.Popen` counterpart that launches its process through :py:func:`os.posix_spawnp`
+
+    Forking a controller process with a large heap means copying its page tables, which gets slower as the heap grows.
+    posix_spawn avoids that cost where the platform implements it with vfork semantics, which is the case of FreeBSD's libc
+    and of glibc, whereas :py:class:`subprocess.Popen` only uses it on some platforms and under restrictive conditions.
+
+    With `close_fds`, the default, only the standard streams are passed on to the child. Descriptors python creates are
+    non-inheritable, but those made inheritable on purpose, with :py:func:`os.set_inheritable` or by C extensions, are
+    closed explicitly in the child through posix_spawn's file actions. Requires python >= 3.9.
+
+    Example
+    -------
+    >>> import subprocess
+    >>> from pybsd.processes import SpawnedProcess
+    >>> proc = SpawnedProcess(['cat'], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    >>> proc.communicate(b'foo'), proc.returncode
+    ((b'foo', b''), 0)
+
+    Parameters
+    ----------
+    args : :py:class:`list`
+        The command's arguments. The executable is looked up in PATH.
+    stdin : Optional[:py:data:`subprocess.PIPE`, :py:data:`subprocess.DEVNULL`, file object or descriptor]
+        The process' stdin. Inherited if None.
+    stdout : Optional[:py:data:`subprocess.PIPE`, :py:data:`subprocess.DEVNULL`, file object or descriptor]
+        The process' stdout. Inherited if None.
+    stderr : Optional[:py:data:`subprocess.PIPE`, :py:data:`subprocess.DEVNULL`, file object or descriptor]
+        The process' stderr. Inherited if None.
+    start_new_session : Optional[:py:class:`bool`]
+        Whether the process runs in a new session, and therefore in its own process group
+    close_fds : Optional[:py:class:`bool`]
+        Whether the inheritable descriptors other than the standard streams are closed in the child
+    """
+
+    def __init__(self, args, stdin=None, stdout=None, stderr=None, start_new_session=False, close_fds=True):
+        self.args = args
+        self.stdin = self.stdout = self.stderr = None
+        #: :py:class:`int`: the process' return code, None while it is running
+        self.returncode = None
+        self._communication = None
+        file_actions = []
+        child_fds = []
+        try:
+            for target, spec in ((0, stdin), (1, stdout), (2, stderr)):
+                if spec is None:
+                    continue
+                if spec == subprocess.PIPE:
+                    read_fd, write_fd = os.pipe()
+                    child_fd, parent_fd = (read_fd, write_fd) if target == 0 else (write_fd, read_fd)
+                    child_fds.append(child_fd)
+                    setattr(self, ('stdin', 'stdout', 'stderr')[target], os.fdopen(parent_fd, 'wb' if target == 0 else 'rb'))
+                elif spec == subprocess.DEVNULL:
+                    child_fd = os.open(os.devnull, os.O_RDWR)
+                    child_fds.append(child_fd)
+                else:
+                    child_fd = spec if isinstance(spec, int) else spec.fileno()
+                file_actions.append((os.POSIX_SPAWN_DUP2, child_fd, target))
+            if close_fds:
+                # The standard streams are in place by then, so the descriptors they were duplicated from can go too
+                file_actions.extend((os.POSIX_SPAWN_CLOSE, fd) for fd in _inheritable_fds())
+            #: :py:class:`int`: the process' id
+            # As with :py:class:`subprocess.Popen`, the signals python ignores get their default disposition back, so
+            # that a process writing to a closed pipe gets SIGPIPE
+            self.pid = os.posix_spawnp(args[0], list(args), os.environ, file_actions=file_actions,
+                                       setsid=start_new_session, setsigdef=_RESTORED_SIGNALS)
+        except BaseException:
+            for pipe in (self.stdin, self.stdout, self.stderr):
+                if pipe is not None:
+                    pipe.close()
+            raise
+        finally:
+            for fd in child_fds:
+                os.close(fd)
+
+    def poll(self):
+        """Returns the process' return code, or None if it is still running"""
+        if self.returncode is None:
+            pid, status = os.waitpid(self.pid, os.WNOHANG)
+            if pid:
+                self.returncode = os.waitstatus_to_exitcode(status)
+        return self.returncode
+
+    def wait(self):
+        """Waits for the process to exit and returns its return code"""
+        if self.returncode is None:
+            while True:
+                try:
+                    pid, status = os.waitpid(self.pid, 0)
+                    break
+                except OSError as e:  # pragma: no cover
+                    if e.errno != errno.EINTR:
+                        raise
+            self.returncode = os.waitstatus_to_exitcode(status)
+        return self.returncode
+
+    def send_signal(self, sig):
+        """Sends a signal to the process, unless it already exited"""
+        if self.returncode is None:
+            os.kill(self.pid, sig)
+
+    def terminate(self):
+        """Sends SIGTERM to the process"""
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        """Sends SIGKILL to the process"""
+        self.send_signal(signal.SIGKILL)
+
+    def communicate(self, input=None, timeout=None):
+        """Feeds `input` to the process, reads its output until EOF and waits for it to exit
+
+        Parameters
+        ----------
+        input : Optional[:py:class:`bytes`]
+            data fed to the process' stdin, which is then closed
+        timeout : Optional[:py:class:`float`]
+            how long to wait, in seconds. Forever if None.
+
+        Returns
+        -------
+        : :py:class:`tuple`
+            (stdout, stderr), None for streams that are not pipes
+
+        Raises
+        ------
+        subprocess.TimeoutExpired
+            raised when the process' output did not end within `timeout`. As with :py:class:`subprocess.Popen`,
+            `communicate` can be called again, the output read so far is not lost.
+        """
+        if self._communication is None:
+            self._communication = _Communication(self, input)
+        communication = self._communication
+        deadline = None if timeout is None else time.time() + timeout
+        while communication.selector.get_map():
+            remaining = None if deadline is None else deadline - time.time()
+            if remaining is not None and remaining <= 0:
+                out, err = communication.output()
+                raise subprocess.TimeoutExpired(self.args, timeout, output=out, stderr=err)
+            for key, _ in communication.selector.select(remaining):
+                communication.transfer(key.fileobj)
+        communication.selector.close()
+        self.wait()
+        return communication.output()
+
+
+def _inheritable_fds():
+    # The descriptors above the standard streams a child would inherit. The open ones are listed from /proc on Linux and
+    # from /dev/fd on FreeBSD when fdescfs is mounted there, which lists all of them, otherwise every possible one is tried
+    fds = None
+    for directory in ('/proc/self/fd', '/dev/fd'):
+        try:
+            if directory == '/dev/fd' and os.stat(directory).st_dev == os.stat('/dev').st_dev:
+                continue
+            fds = [int(name) for name in os.listdir(directory)]
+            break
+        except OSError:
+            continue
+    if fds is None:
+        fds = range(3, os.sysconf('SC_OPEN_MAX'))
+    inheritable = []
+    for fd in fds:
+        if fd <= 2:
+            continue
+        try:
+            if os.get_inheritable(fd):
+                inheritable.append(fd)
+        except OSError:
+            # Closed since, such as the descriptor that listed the directory
+            continue
+    return inheritable
+
+
+class _Communication(object):
+    # The state of :py:meth:`SpawnedProcess.communicate`, kept across calls that time out
+    def __init__(self, proc, input):
+        self.proc = proc
+        self.selector = selectors.DefaultSelector()
+        self.chunks = {}
+        if proc.stdin is not None:
+            if input:
+                os.set_blocking(proc.stdin.fileno(), False)
+                self.selector.register(proc.stdin, selectors.EVENT_WRITE)
+            else:
+                proc.stdin.close()
+        for pipe in (proc.stdout, proc.stderr):
+            if pipe is not None:
+                self.chunks[pipe] = []
+                self.selector.register(pipe, selectors.EVENT_READ)
+        self.view = memoryview(input or b'')
+        self.offset = 0
+
+    def transfer(self, pipe):
+        # Feeds stdin or reads stdout or stderr, closing the pipe when done
+        if pipe is self.proc.stdin:
+            try:
+                self.offset += os.write(pipe.fileno(), self.view[self.offset:self.offset + 65536])
+            except BrokenPipeError:
+                self.offset = len(self.view)
+            done = self.offset >= len(self.view)
+        else:
+            chunk = os.read(pipe.fileno(), 65536)
+            self.chunks[pipe].append(chunk)
+            done = not chunk
+        if done:
+            self.selector.unregister(pipe)
+            pipe.close()
+
+    def output(self):
+        return tuple(None if pipe is None else b''.join(self.chunks[pipe]) for pipe in (self.proc.stdout, self.proc.stderr))
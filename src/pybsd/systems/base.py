@@ -6,7 +6,9 @@ import re
 
 import six
 import sortedcontainers
+from lazy import lazy
 
+from .. import utils
 from ..exceptions import DuplicateIPError
 from ..executors import Executor
 from ..network import Interface
@@ -32,8 +34,12 @@ class BaseSystem(object):
     ----------
     ExecutorClass : :py:class:`class`
         the class of the system's executor. It must be or extend :py:class:`~pybsd.executors.Executor`
+    AsyncExecutorClass : :py:class:`class`
+        the class of the system's awaitable executor. It must be or extend :py:class:`~pybsd.aio.AsyncExecutor`.
+        If None, :py:class:`~pybsd.aio.AsyncExecutor` is used.
     """
     ExecutorClass = Executor
+    AsyncExecutorClass = None
 
     def __init__(self, name, hostname=None):
         super(BaseSystem, self).__init__()
@@ -41,6 +47,23 @@ class BaseSystem(object):
         self._hostname = hostname
         #: :py:class:`~function`: a method that proxies binaries invocations
         self.execute = self.ExecutorClass()
+        #: Optional[:py:class:`~pybsd.cache.CommandCache`]: the cache of read-only commands results. Caching is disabled
+        #: if None
+        self.command_cache = None
+        #: Optional[:py:class:`~pybsd.cache.SingleFlight`]: coalesces concurrent identical read-only commands. Disabled if None
+        self.single_flight = None
+        #: :py:class:`int`: the number of mutating commands run on the system. Read-only commands started before one of
+        #: them are not shared with those started after it
+        self.mutations = 0
+
+    @lazy
+    def aexecute(self):
+        """:py:class:`~pybsd.aio.AsyncExecutor`: the awaitable counterpart of `execute`. It is only created on first access,
+        as it requires python >= 3.5"""
+        ExecutorClass = self.AsyncExecutorClass
+        if ExecutorClass is None:
+            ExecutorClass = utils.import_aio().AsyncExecutor
+        return ExecutorClass()
 
     @property
     def name(self):
@@ -163,34 +163,63 @@ class Jail(BaseSystem):
         """
         return self.handler.get_jail_type(self) if self.is_attached else None
 
+    @property
+    def state(self):
+        """:py:class:`dict` or :py:class:`NoneType`: This jail's jls parameters as per its master's last
+        :py:meth:`~pybsd.systems.masters.Master.refresh_jail_states`. None if the jail was not running then, if it is
+        not attached or if its master's jail states were never retrieved."""
+        if self.is_attached and self.master.jail_states is not None:
+            return self.master.jail_states.get(self.hostname)
+        else:
+            return None
+
+    @property
+    def entry(self):
+        """:py:class:`~pybsd.commands.ezjail_admin.JailEntry` or :py:class:`NoneType`: This jail's entry in its master's
+        :py:attr:`~pybsd.systems.masters.Master.jail_snapshot`. None if it is not attached or not known to ezjail-admin."""
+        if self.is_attached:
+            return self.master.jail_snapshot.get(self.hostname)
+        else:
+            return None
+
     @property
     def status(self):
-        """:py:class:`str`: Returns this jail's status as per ezjail_admin
+        """:py:class:`str`: Returns this jail's status as per its master's
+        :py:attr:`~pybsd.systems.masters.Master.jail_snapshot`. Reading it runs `ezjail-admin list` on the master if
+        the snapshot was not fetched yet or is older than the master's `state_max_age`.
 
         Possible status
             * **D**     The jail is detached (not attached to any master)
             * **S**     The jail is stopped.
             * **A**     The image of the jail is mounted, but the jail is not running.
             * **R**     The jail is running.
-
-        The `S` value is a stub for now. It must come from parsing master's ezjail-admin.list()'s output
+            * **None**  The jail is attached but does not exist on its master.
         """
-        if self.is_attached:
-            return 'S'
-        else:
+        if not self.is_attached:
             return 'D'
+        entry = self.entry
+        return entry.status[1:2] if entry is not None else None
 
     @property
     def jid(self):
-        """:py:class:`int`: Returns this jail's jid as per ezjail_admin
+        """:py:class:`int`: Returns this jail's jid as per its master's :py:attr:`~pybsd.systems.masters.Master.jail_snapshot`,
+        None if it is not running. Reading it runs `ezjail-admin list` on the master if the snapshot was not fetched yet
+        or is older than the master's `state_max_age`.
+        """
+        entry = self.entry
+        if entry is None or not entry.jid.isdigit():
+            return None
+        return int(entry.jid)
 
-        The `1` value returned when attached is a stub for now. It must come from parsing master's
-        ezjail-admin.list()'s output
+    @property
+    def discovered_ips(self):
+        """:py:class:`list` or :py:class:`NoneType`: The ipv4 then ipv6 addresses this jail is running with, as per its
+        master's jail states. None if they are unknown.
         """
-        if self.is_attached:
-            return 1
-        else:
+        state = self.state
+        if state is None:
             return None
+        return state.get('ip4.addr', []) + state.get('ip6.addr', [])
 
     @property
     def jail_class_id(self):
@@ -3,13 +3,14 @@ from __future__ import absolute_import, print_function, unicode_literals
 
 import copy
 import logging
+import time
 
 import six
 from lazy import lazy
 
-from ..commands import EzjailAdmin
+from ..commands import EzjailAdmin, EzjailConfig, Jexec, Jls
 from ..exceptions import (AttachNonJailError, DuplicateJailHostnameError, DuplicateJailNameError, DuplicateJailUidError,
-                          JailAlreadyAttachedError)
+                          JailAlreadyAttachedError, MasterJailMismatchError)
 from ..handlers import BaseJailHandler
 from .base import System
 from .jails import Jail
@@ -44,15 +45,36 @@ class Master(System):
     ----------
     JailHandlerClass : :py:class:`class`
         the class of the system's jail handler. It must be or extend :py:class:`~pybsd.BaseJailHandler`
+    state_max_age : Optional[:py:class:`float`]
+        How long, in seconds, the snapshot of the jails' states is used before being fetched again. If None it is only
+        fetched again by :py:meth:`refresh`.
     """
     JailHandlerClass = BaseJailHandler
     default_jail_type = 'Z'
+    state_max_age = 10
 
     def __init__(self, name, ext_if, int_if=None, lo_if=None, j_if=None, jlo_if=None, hostname=None):
         super(Master, self).__init__(name, ext_if, int_if, lo_if, hostname)
         self._j_if = self.make_if(j_if)
         self._jlo_if = self.make_if(jlo_if)
         self.ezjail_admin = EzjailAdmin(env=self)
+        self.ezjail_config = EzjailConfig(env=self)
+        #: :py:class:`~pybsd.commands.EzjailAdmin` or :py:class:`~pybsd.commands.EzjailConfig`: where
+        #: :py:meth:`refresh` lists the jails from. Defaults to `ezjail_admin`; `ezjail_config` reads ezjail's files
+        #: instead of running ezjail-admin.
+        self.state_source = self.ezjail_admin
+        self.jls = Jls(env=self)
+        self.jexec = Jexec(env=self)
+        #: Optional[:py:class:`dict`]: The state of the running jails as of the last call to :py:meth:`refresh_jail_states`,
+        #: indexed by hostname. None until then.
+        self.jail_states = None
+        self._jail_snapshot = None
+        self._jail_snapshot_time = None
+        #: :py:class:`int`: the number of snapshots fetched by :py:meth:`refresh`
+        self.refreshes = 0
+        #: :py:class:`int`: the number of snapshots fetched by :py:meth:`refresh` that were not parsed again, as the listing
+        #: did not change
+        self.skipped_refreshes = 0
         self.jail_handler = self.JailHandlerClass(master=self)
         self.jails = {}
 
@@ -184,6 +206,152 @@ class Master(System):
         _jail.master = None
         return self.attach_jail(_jail)
 
+    @property
+    def jail_snapshot(self):
+        """:py:class:`~pybsd.commands.ezjail_admin.JailList`: The jails known to ezjail-admin on this master, shared by
+        all its attached jails' :py:attr:`~pybsd.systems.jails.Jail.status` and :py:attr:`~pybsd.systems.jails.Jail.jid`.
+        It is fetched from `state_source`, with a single call to ezjail-admin by default, when first read, then again once
+        older than `state_max_age`.
+        """
+        if self._jail_snapshot_time is None or (self.state_max_age is not None and
+                                                time.time() - self._jail_snapshot_time >= self.state_max_age):
+            return self.refresh()
+        return self._jail_snapshot
+
+    @property
+    def last_jail_snapshot(self):
+        """Optional[:py:class:`~pybsd.commands.ezjail_admin.JailList`]: The snapshot last fetched by :py:meth:`refresh`,
+        however old or invalidated, without fetching it. None if no snapshot was fetched yet.
+        """
+        return self._jail_snapshot
+
+    def refresh(self):
+        """Fetches the snapshot of the jails' states again, whatever its age. The cached ezjail-admin listing of this
+        master, if any, is dropped first, but its other cached command results are kept. If the listing did not change
+        since the previous snapshot, it is not parsed again and the previous snapshot is kept, see :py:attr:`refresh_stats`.
+
+        Returns
+        -------
+        : :py:class:`~pybsd.commands.ezjail_admin.JailList`
+            the new snapshot, see :py:attr:`jail_snapshot`
+
+        Raises
+        ------
+        SubprocessError
+            raised if ezjail-admin returned an error
+        InvalidOutputError
+            raised if ezjail-admin's output, or ezjail's files, could not be parsed
+        """
+        self.ezjail_admin.uncache('list')
+        previous = self._jail_snapshot
+        snapshot = self.state_source.list(previous=previous)
+        self.refreshes += 1
+        if snapshot is previous:
+            self.skipped_refreshes += 1
+        self._jail_snapshot, self._jail_snapshot_time = snapshot, time.time()
+        return snapshot
+
+    def invalidate(self, hostnames=None):
+        """Marks this master's cached state as stale: its cached command results are dropped and its jail snapshot is
+        fetched again when next read. The snapshot is kept until then, so that an unchanged listing is not parsed again.
+
+        Parameters
+        ----------
+        hostnames : Optional[:py:class:`set` [:py:class:`str`]]
+            the hostnames of the jails whose state changed, whose jls states are dropped. All of them are dropped if None.
+        """
+        self.mutations += 1
+        if self.command_cache is not None:
+            self.command_cache.invalidate(self)
+        self._jail_snapshot_time = None
+        if hostnames is None:
+            self.jail_states = None
+        elif self.jail_states is not None:
+            for hostname in hostnames:
+                self.jail_states.pop(hostname, None)
+
+    @property
+    def refresh_stats(self):
+        """:py:class:`dict`: the number of snapshots fetched by :py:meth:`refresh`, and of those that were not parsed again
+        as the listing did not change"""
+        return {'refreshes': self.refreshes, 'skipped': self.skipped_refreshes}
+
+    def refresh_jail_states(self):
+        """Retrieves the state of every running jail from a single call to jls, so that the
+        :py:attr:`~pybsd.systems.jails.Jail.discovered_ips` of the attached jails reflect it.
+
+        Returns
+        -------
+        : :py:class:`dict`
+            the parameters of each running jail, as returned by :py:meth:`~pybsd.commands.Jls.list`, indexed by hostname
+
+        Raises
+        ------
+        SubprocessError
+            raised if jls returned an error
+        InvalidOutputError
+            raised if jls' output could not be parsed
+        """
+        states = {}
+        for name, jail in self.jls.iter_list('jid', 'host.hostname', 'ip4.addr', 'ip6.addr'):
+            states[jail.get('host.hostname') or name] = jail
+        self.jail_states = states
+        return states
+
+    def run_in_jails(self, cmd, jails=None):
+        """Runs a command in many of this master's running jails, with a single invocation on the host, through
+        :py:meth:`~pybsd.commands.Jexec.fan_out`. The jails' jids are read from :py:attr:`jail_snapshot`.
+
+        Parameters
+        ----------
+        cmd : :py:class:`str`
+            the command
+        jails : Optional[iterable of :py:class:`~pybsd.systems.jails.Jail`]
+            the jails the command is run in. Defaults to all the jails attached to this master.
+
+        Returns
+        -------
+        : :py:class:`dict`
+            the command's (rc, out, err) :py:class:`tuple` in each jail, indexed by :py:class:`~pybsd.systems.jails.Jail`.
+            It is None for the jails that are not running.
+
+        Raises
+        ------
+        MasterJailMismatchError
+            raised if a jail is not attached to this master
+        SubprocessError
+            raised if the host's shell failed before running the command in every jail
+        InvalidOutputError
+            raised if a jail's output is missing or its framing is broken
+        """
+        jails = list(six.itervalues(self.jails)) if jails is None else list(jails)
+        for jail in jails:
+            if jail.master is not self:
+                raise MasterJailMismatchError(self, jail)
+        jids = dict((jail, jail.jid) for jail in jails)
+        outputs = self.jexec.fan_out(cmd, [jid for jid in six.itervalues(jids) if jid is not None])
+        return dict((jail, outputs[jid] if jid is not None else None) for jail, jid in six.iteritems(jids))
+
+    @lazy
+    def jexec_binary(self):
+        """Returns the path of this environment's jexec binary.
+
+        Returns
+        -------
+        : :py:class:`str`
+        """
+        return u'/usr/sbin/jexec'
+
+    @lazy
+    def jls_binary(self):
+        """Returns the path of this environment's jls binary.
+
+        Returns
+        -------
+        : :py:class:`str`
+        """
+        return u'/usr/sbin/jls'
+
     @lazy
     def ezjail_admin_binary(self):
         """Returns the path of this environment's ezjail-admin binary.
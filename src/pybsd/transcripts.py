@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+"""Records the commands run against real hosts and replays them without spawning anything.
+
+A transcript is a JSON lines file holding one (host, args, stdin, rc, out, err) entry per executed command or pipeline.
+It lets models, capacity planning and benchmarks run against a captured fleet in milliseconds.
+
+Example
+-------
+>>> import os, tempfile
+>>> from pybsd.transcripts import RecordingExecutor, ReplayExecutor, Transcript
+>>> path = os.path.join(tempfile.mkdtemp(), 'fleet.jsonl')
+>>> with Transcript(path) as transcript:
+...     RecordingExecutor(transcript)('echo', 'foo')
+(0, 'foo\\n', '')
+>>> ReplayExecutor(Transcript(path))('echo', 'foo')
+(0, 'foo\\n', '')
+"""
+from __future__ import absolute_import, print_function, unicode_literals
+
+import base64
+import io
+import json
+import logging
+import os
+import threading
+import time
+
+from . import utils
+from .exceptions import ExecutionTimeoutError, TranscriptMissError
+from .executors import Batch, Executor, RawOutput, StreamResult, _pipeline_args
+
+__logger__ = logging.getLogger('pybsd')
+
+
+def _dump_bytes(data):
+    # Text is stored as is, anything else as base64. The stderrs of a pipeline's stages are stored as a list
+    if data is None:
+        return None
+    if isinstance(data, list):
+        return [_dump_bytes(item) for item in data]
+    try:
+        return data.decode('utf8')
+    except UnicodeDecodeError:
+        return {'base64': base64.b64encode(data).decode('ascii')}
+
+
+def _load_bytes(data):
+    if data is None:
+        return None
+    if isinstance(data, list):
+        return [_load_bytes(item) for item in data]
+    if isinstance(data, dict):
+        return base64.b64decode(data['base64'])
+    return data.encode('utf8')
+
+
+class Transcript(object):
+    """An indexed collection of command results, optionally backed by a JSON lines file
+
+    Entries are indexed on (host, args, stdin). Identical commands are served in the order they were recorded, and the
+    last of their results keeps being served once the others were. A pipeline's entry holds its stages' arguments
+    separated by '|', their return codes and stderrs as lists, and their byte counts if they were counted.
+
+    Parameters
+    ----------
+    path : Optional[:py:class:`str`]
+        The transcript file. Its entries are loaded if it exists, and recorded entries are appended to it.
+        In-memory transcript if None.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._results = {}
+        self._served = {}
+        self._file = None
+        self._lock = threading.Lock()
+        #: :py:class:`int`: the number of entries in the transcript
+        self.entries = 0
+        if path is not None and os.path.exists(path):
+            with io.open(path, encoding='utf8') as transcript:
+                for line in transcript:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._index(entry['host'], entry['args'], _load_bytes(entry['stdin']),
+                                    (entry['rc'], _load_bytes(entry['out']), _load_bytes(entry['err'])),
+                                    entry.get('byte_counts'))
+
+    @staticmethod
+    def _key(host, args, stdin):
+        return (host, tuple(utils.safe_unicode(arg) for arg in args), stdin)
+
+    def _index(self, host, args, stdin, result, byte_counts=None):
+        if byte_counts is not None:
+            result += (byte_counts,)
+        self._results.setdefault(self._key(host, args, stdin), []).append(result)
+        self.entries += 1
+
+    def append(self, host, args, stdin, rc, out, err, byte_counts=None):
+        """Adds an entry, writing it to the transcript file if there is one
+
+        Parameters
+        ----------
+        host : :py:class:`str`
+            The host the command was executed on
+        args : :py:class:`tuple`
+            The command's arguments
+        stdin : Optional[:py:class:`bytes`]
+            The data fed to the command's stdin
+        rc : :py:class:`int` or :py:class:`list` [:py:class:`int`]
+            The command's return code, or a pipeline's stages' ones
+        out : Optional[:py:class:`bytes`]
+            The command's raw stdout. None if a pipeline's stdout was redirected
+        err : :py:class:`bytes` or :py:class:`list` [:py:class:`bytes`]
+            The command's raw stderr, or a pipeline's stages' ones
+        byte_counts : Optional[:py:class:`list` [:py:class:`int`]]
+            The number of bytes a pipeline's stages wrote to their stdout, if they were counted
+        """
+        with self._lock:
+            self._index(host, args, stdin, (rc, out, err), byte_counts)
+            if self.path is None:
+                return
+            if self._file is None:
+                self._file = io.open(self.path, 'a', encoding='utf8')
+            entry = {'host': host, 'args': [utils.safe_unicode(arg) for arg in args], 'stdin': _dump_bytes(stdin),
+                     'rc': rc, 'out': _dump_bytes(out), 'err': _dump_bytes(err)}
+            if byte_counts is not None:
+                entry['byte_counts'] = byte_counts
+            self._file.write(utils.safe_unicode(json.dumps(entry, sort_keys=True, separators=(',', ':'))) + '\n')
+            self._file.flush()
+
+    def lookup(self, host, args, stdin=None):
+        """Returns the next recorded result of a command
+
+        Parameters
+        ----------
+        host : :py:class:`str`
+            The host the command is executed on
+        args : :py:class:`tuple`
+            The command's arguments
+        stdin : Optional[:py:class:`bytes`]
+            The data fed to the command's stdin
+
+        Returns
+        -------
+        : :py:class:`tuple`
+            the raw (rc, out, err), followed by the byte counts of a pipeline whose bytes were counted
+
+        Raises
+        ------
+        TranscriptMissError
+            raised when the command was not recorded
+        """
+        key = self._key(host, args, stdin)
+        with self._lock:
+            results = self._results.get(key)
+            if not results:
+                raise TranscriptMissError(host, key[1])
+            served = self._served.get(key, 0)
+            self._served[key] = served + 1
+            return results[min(served, len(results) - 1)]
+
+    def rewind(self):
+        """Serves every command's results from the first one again"""
+        with self._lock:
+            self._served.clear()
+
+    def close(self):
+        """Closes the transcript file, if it was opened for recording"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __len__(self):
+        return self.entries
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class _TranscriptExecutor(Executor):
+    # Runs streams, maps and batches command by command through `_run`, so every command goes through the transcript
+    transcript = None
+
+    def __init__(self, transcript=None, instance=None, prefix_args=(), splitlines=False, transport=None):
+        super(_TranscriptExecutor, self).__init__(instance=instance, prefix_args=prefix_args, splitlines=splitlines,
+                                                  transport=transport)
+        if transcript is not None:
+            self.transcript = transcript
+
+    def stream(self, *cmd_args, **kwargs):
+        args = self.prefix_args + cmd_args
+        rc, out, err = self._run(args, kwargs.pop('stdin', None))
+        return StreamResult(_BufferedProcess(rc, out), io.BytesIO(err), args)
+
+    def map(self, commands, max_workers=8, ordered=True, timeout=None):
+        deadline = None if timeout is None else time.time() + timeout
+        for index, args in enumerate(commands):
+            args = self.prefix_args + tuple(args)
+            result = None
+            if deadline is None or time.time() < deadline:
+                try:
+                    result = self._result(args, *self._run(args, None, _remaining(deadline)))
+                except ExecutionTimeoutError:
+                    pass
+            if result is not None or ordered:
+                yield result if ordered else (index, result)
+
+    def batch(self, stop_on_error=False, timeout=None, tag=None):
+        return _SequentialBatch(self, stop_on_error=stop_on_error, timeout=timeout, tag=tag)
+
+
+class RecordingExecutor(_TranscriptExecutor):
+    """An :py:class:`~pybsd.executors.Executor` that records every command it runs to a transcript
+
+    Streams, maps and batches are run command by command, so that each command gets its own entry. Pipelines get a
+    single entry, their stages being connected to each other.
+
+    Parameters
+    ----------
+    transcript : Optional[:py:class:`~pybsd.transcripts.Transcript`]
+        The transcript commands are recorded to. Defaults to the class-wide `transcript`
+    instance : Optional[`any`]
+        See :py:class:`~pybsd.executors.Executor`
+    prefix_args : Optional[:py:class:`tuple`]
+        See :py:class:`~pybsd.executors.Executor`
+    splitlines : Optional[:py:class:`bool`]
+        See :py:class:`~pybsd.executors.Executor`
+    transport : Optional[:py:class:`~pybsd.transports.BaseTransport`]
+        See :py:class:`~pybsd.executors.Executor`
+    """
+
+    def _run(self, args, stdin=None, timeout=None, spill_threshold=None):
+        rc, out, err = super(RecordingExecutor, self)._run(args, stdin, timeout, spill_threshold)
+        self.transcript.append(self.host, args, stdin, rc, out.data if isinstance(out, RawOutput) else out, err)
+        return rc, out, err
+
+    def _run_pipe(self, commands, stdin=None, stdout=None, count=False, timeout=None):
+        # The data fed to the first stage is not known, it is recorded as no stdin
+        returncodes, out, errs, byte_counts = super(RecordingExecutor, self)._run_pipe(commands, stdin, stdout, count,
+                                                                                       timeout)
+        self.transcript.append(self.host, _pipeline_args(commands), None, returncodes, out, errs, byte_counts)
+        return returncodes, out, errs, byte_counts
+
+
+class ReplayExecutor(_TranscriptExecutor):
+    """An :py:class:`~pybsd.executors.Executor` serving results from a transcript instead of running commands
+
+    Parameters
+    ----------
+    transcript : Optional[:py:class:`~pybsd.transcripts.Transcript`]
+        The transcript results are served from. Defaults to the class-wide `transcript`, so that a subclass setting it can
+        be used as a system's `ExecutorClass`
+    instance : Optional[`any`]
+        See :py:class:`~pybsd.executors.Executor`. Only its host is used, to look results up.
+    prefix_args : Optional[:py:class:`tuple`]
+        See :py:class:`~pybsd.executors.Executor`
+    splitlines : Optional[:py:class:`bool`]
+        See :py:class:`~pybsd.executors.Executor`
+    transport : Optional[:py:class:`~pybsd.transports.BaseTransport`]
+        Ignored
+
+    Raises
+    ------
+    TranscriptMissError
+        raised when a command was not recorded
+    """
+
+    def _run(self, args, stdin=None, timeout=None, spill_threshold=None):
+        __logger__.debug('Replaying on `%s`:\n%s', self.host, args)
+        return self.transcript.lookup(self.host, args, stdin)
+
+    def _run_pipe(self, commands, stdin=None, stdout=None, count=False, timeout=None):
+        # Nothing is written to a redirected stdout
+        args = _pipeline_args(commands)
+        __logger__.debug('Replaying on `%s`:\n%s', self.host, args)
+        result = self.transcript.lookup(self.host, args)
+        returncodes, out, errs = result[:3]
+        byte_counts = result[3] if count and len(result) > 3 else None
+        return returncodes, None if stdout is not None else out, errs, byte_counts
+
+
+class _BufferedProcess(object):
+    # Stands for an exited process whose stdout was buffered
+    def __init__(self, rc, out):
+        self.returncode = rc
+        self.stdout = io.BytesIO(out)
+
+    def wait(self):
+        return self.returncode
+
+
+class _SequentialBatch(Batch):
+    # A batch running its commands one by one, as the framing markers of a single script would differ at each run
+
+    def run(self):
+        deadline = None if self.timeout is None else time.time() + self.timeout
+        self.results = []
+        failed = False
+        for args in self.commands:
+            if failed or self.timed_out:
+                self.results.append(None)
+                continue
+            try:
+                rc, out, err = self._run_script(args, None, _remaining(deadline))
+            except ExecutionTimeoutError:
+                self.timed_out = True
+                self.results.append(None)
+                continue
+            self.results.append(self.executor._result(args, rc, out, err))
+            failed = self.stop_on_error and rc != 0
+        return self.results
+
+
+def _remaining(deadline):
+    # The timeout left before `deadline`. It is never 0, as a 0 timeout may be mistaken for no timeout
+    if deadline is None:
+        return None
+    return max(deadline - time.time(), 1e-6)
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, print_function, unicode_literals
+
+import logging
+import socket
+import subprocess
+import tempfile
+import threading
+
+from six.moves import shlex_quote
+
+from . import utils
+
+__logger__ = logging.getLogger('pybsd')
+
+
+class BaseTransport(object):
+    """Provides the interface through which an :py:class:`~pybsd.executors.Executor` reaches a remote host
+
+    A transport turns a command into the local command line that runs it on its host, and caps the number of channels
+    that can be open on that host at the same time.
+
+    Parameters
+    ----------
+    host : :py:class:`str`
+        The host the transport connects to.
+    max_channels : Optional[:py:class:`int`]
+        The maximum number of commands that can run on the host simultaneously. Defaults to `default_max_channels`.
+
+    Attributes
+    ----------
+    default_max_channels : :py:class:`int`
+        the default cap on simultaneously open channels.
+    """
+    default_max_channels = 10
+
+    def __init__(self, host, max_channels=None):
+        #: :py:class:`str`: The host the transport connects to.
+        self.host = host
+        #: :py:class:`int`: The maximum number of commands that can run on the host simultaneously.
+        self.max_channels = max_channels or self.default_max_channels
+        self._channels = threading.BoundedSemaphore(self.max_channels)
+
+    def channel(self):
+        """Returns a context manager holding one of the host's channels while it is entered, blocking until one is free.
+
+        Returns
+        -------
+        : :py:class:`threading.BoundedSemaphore`
+        """
+        return self._channels
+
+    def wrap(self, args):
+        """Returns the local command line that executes `args` on the host
+
+        Parameters
+        ----------
+        args : :py:class:`tuple`
+            The command's arguments
+
+        Returns
+        -------
+        : :py:class:`list`
+        """
+        raise NotImplementedError
+
+    def check(self, rc, err):
+        """Checks a command's result for transport-level failures
+
+        Parameters
+        ----------
+        rc : :py:class:`int`
+            The return code of the local command line
+        err : :py:class:`bytes`
+            Its stderr
+
+        Raises
+        ------
+        socket.error
+            raised when connection to the host failed
+        """
+
+    def connect(self):
+        """Establishes the connection to the host ahead of the first command. Does nothing by default."""
+
+    def close(self):
+        """Closes the connection to the host. Does nothing by default."""
+
+    def __repr__(self):
+        return '{}({})'.format(self.__class__.__name__, self.host)
+
+
+class LocalTransport(BaseTransport):
+    """A transport that runs commands on the local machine, through a shell as ssh would.
+
+    It is a stand-in for :py:class:`~pybsd.transports.SSHTransport` that needs no server, for tests and models.
+    """
+
+    def wrap(self, args):
+        return ['/bin/sh', '-c', ' '.join(shlex_quote(utils.safe_unicode(arg)) for arg in args)]
+
+
+class SSHTransport(BaseTransport):
+    """A transport that runs commands through OpenSSH, multiplexing them over one authenticated master connection.
+
+    The first command (or :py:meth:`connect`) opens a master connection whose control socket is reused by every subsequent
+    command, which saves a TCP and authentication handshake per command. The master outlives the last command by
+    `persist` seconds.
+
+    Example
+    -------
+    >>> from pybsd.transports import SSHTransport
+    >>> transport = SSHTransport('box01.foo.bar', user='root', control_dir='/tmp')
+    >>> transport.wrap(('ls', '/usr/jails'))  # doctest: +NORMALIZE_WHITESPACE
+    ['ssh', '-o', 'ControlMaster=auto', '-o', 'ControlPath=/tmp/pybsd-%C', '-o', 'ControlPersist=600',
+     '-o', 'BatchMode=yes', '-l', 'root', 'box01.foo.bar', '--', 'ls /usr/jails']
+
+    Parameters
+    ----------
+    host : :py:class:`str`
+        The host the transport connects to.
+    max_channels : Optional[:py:class:`int`]
+        The maximum number of commands that can run on the host simultaneously. It should not exceed the server's
+        `MaxSessions`, which is 10 by default.
+    user : Optional[:py:class:`str`]
+        The remote user.
+    port : Optional[:py:class:`int`]
+        The remote port.
+    control_dir : Optional[:py:class:`str`]
+        The directory holding control sockets. Defaults to the system's temporary directory.
+    persist : Optional[:py:class:`int`]
+        How long, in seconds, the master connection stays open after the last command.
+    options : Optional[:py:class:`tuple`]
+        Additional `-o` options, such as 'StrictHostKeyChecking=no'.
+
+    Attributes
+    ----------
+    binary : :py:class:`str`
+        the path of the ssh binary.
+    """
+    binary = 'ssh'
+
+    def __init__(self, host, max_channels=None, user=None, port=None, control_dir=None, persist=600, options=()):
+        super(SSHTransport, self).__init__(host, max_channels=max_channels)
+        self.user = user
+        self.port = port
+        self.control_dir = control_dir or tempfile.gettempdir()
+        self.persist = persist
+        self.options = tuple(options)
+
+    def ssh_args(self, master='auto'):
+        """Returns the ssh command line, up to and including the host
+
+        Parameters
+        ----------
+        master : :py:class:`str`
+            The value of the ControlMaster option
+
+        Returns
+        -------
+        : :py:class:`list`
+        """
+        args = [self.binary,
+                '-o', 'ControlMaster={}'.format(master),
+                '-o', 'ControlPath={}/pybsd-%C'.format(self.control_dir),
+                '-o', 'ControlPersist={}'.format(self.persist),
+                '-o', 'BatchMode=yes']
+        for option in self.options:
+            args.extend(['-o', option])
+        if self.user:
+            args.extend(['-l', self.user])
+        if self.port:
+            args.extend(['-p', str(self.port)])
+        args.append(self.host)
+        return args
+
+    def wrap(self, args):
+        # The remote command is parsed by the remote user's shell, so it is passed as one quoted string
+        return self.ssh_args() + ['--', ' '.join(shlex_quote(utils.safe_unicode(arg)) for arg in args)]
+
+    def check(self, rc, err):
+        # ssh exits with 255 when the connection fails
+        if rc == 255:
+            raise socket.error(utils.safe_unicode(err).strip())
+
+    def connect(self):
+        """Opens the master connection in the background, if it is not open yet.
+
+        Raises
+        ------
+        socket.error
+            raised when connection to the host fails
+        """
+        proc = subprocess.Popen(self.ssh_args() + ['-N', '-f'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        out, err = proc.communicate()
+        self.check(proc.returncode, err)
+
+    def close(self):
+        """Asks the master connection to exit."""
+        proc = subprocess.Popen(self.ssh_args() + ['-O', 'exit'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        proc.communicate()
+
+
+class TransportPool(object):
+    """Keeps one transport per host, so every executor targeting a host shares its connection and channel cap
+
+    Example
+    -------
+    >>> from pybsd.transports import LocalTransport, TransportPool
+    >>> pool = TransportPool()
+    >>> pool.get('box01', LocalTransport) is pool.get('box01', LocalTransport)
+    True
+    """
+
+    def __init__(self):
+        self._transports = {}
+        self._lock = threading.Lock()
+
+    def get(self, host, TransportClass=SSHTransport, **kwargs):
+        """Returns the pool's transport to `host`, creating it if needed
+
+        Parameters
+        ----------
+        host : :py:class:`str`
+            The host
+        TransportClass : :py:class:`class`
+            The class of the transport to create, if the pool does not have one for `host` yet. It must be or extend
+            :py:class:`~pybsd.transports.BaseTransport`
+        kwargs :
+            Passed to `TransportClass` when the transport is created
+
+        Returns
+        -------
+        : :py:class:`~pybsd.transports.BaseTransport`
+        """
+        with self._lock:
+            if host not in self._transports:
+                self._transports[host] = TransportClass(host, **kwargs)
+            return self._transports[host]
+
+    def add(self, transport):
+        """Adds a transport to the pool, replacing any existing transport to the same host
+
+        Parameters
+        ----------
+        transport : :py:class:`~pybsd.transports.BaseTransport`
+        """
+        with self._lock:
+            self._transports[transport.host] = transport
+
+    def close(self):
+        """Closes and forgets every transport in the pool"""
+        with self._lock:
+            transports, self._transports = self._transports, {}
+        for transport in transports.values():
+            transport.close()
+
+
+#: :py:class:`~pybsd.transports.TransportPool`: the pool shared by all executors by default
+pool = TransportPool()
@@ -2,10 +2,34 @@
 from __future__ import absolute_import, print_function, unicode_literals
 
 import logging
+import sys
+
 import six
 
 __logger__ = logging.getLogger('pybsd')
 
+#: :py:class:`bool`: whether :py:mod:`pybsd.aio` can be imported. Its coroutines need python >= 3.5 to even be parsed.
+HAS_AIO = sys.version_info >= (3, 5)
+
+
+def import_aio():
+    """Imports :py:mod:`pybsd.aio`, which is never imported implicitly, so that importing pybsd works on any python
+
+    Returns
+    -------
+    : module
+        :py:mod:`pybsd.aio`
+
+    Raises
+    ------
+    ImportError
+        raised on python < 3.5
+    """
+    if not HAS_AIO:
+        raise ImportError('pybsd.aio requires python >= 3.5')
+    from . import aio
+    return aio
+
 
 def safe_unicode(string):
     """Converts a string to unicode
@@ -26,6 +50,43 @@ def safe_unicode(string):
     return string
 
 
+def safe_bytes(string):
+    """Converts a string to bytes
+
+    Parameters
+    ----------
+    string : :py:class:`basestring` (python 2/3) or :py:class:`str` (python 2/3) or :py:class:`unicode` (python 2) \
+    or :py:class:`bytes` (python 3)
+        the string to be converted
+
+    Returns
+    -------
+    : :py:class:`str` (python 2) or :py:class:`bytes` (python 3)
+        a utf8-encoded byte string
+    """
+    if isinstance(string, six.text_type):
+        string = string.encode('utf8')
+    return string
+
+
+def safe_text(output):
+    """Converts a command's output to unicode, whether it was split into lines or not
+
+    Parameters
+    ----------
+    output : :py:class:`basestring` (python 2/3) or :py:class:`bytes` (python 3) or :py:class:`list`
+        the output, as returned by an executor. With `splitlines`, it is a list of lines.
+
+    Returns
+    -------
+    : :py:class:`unicode` (python 2) or :py:class:`str` (python 3)
+        the output, stripped of leading and trailing whitespace
+    """
+    if isinstance(output, list):
+        output = '\n'.join(safe_unicode(line) for line in output)
+    return safe_unicode(output).strip()
+
+
 def split_if(interface):
     """Returns a list-based description of an :py:class:`ipaddress.IPVxInterface`'s ip and prefixlen
 
@@ -0,0 +1,436 @@
+# -*- coding: utf-8 -*-
+"""Invalidates cached jail state when ezjail's files change.
+
+A :py:class:`~pybsd.watcher.Watcher` tracks the files :py:class:`~pybsd.commands.EzjailConfig` reads for every master
+registered with it: the jails' configuration files and their `jail_<name>.id` run files. When one of them is created,
+modified or deleted, for instance by someone running ezjail-admin by hand, the master's cached state is invalidated
+through :py:meth:`~pybsd.systems.masters.Master.invalidate`, so that it can be cached without a short time to live.
+
+Changes are detected by comparing the files' stat signatures. kqueue (on BSDs) or inotify (on Linux) wake the watcher as
+soon as a watched directory changes; on other platforms, and to catch files rewritten in place, the directories are
+also scanned every `interval`.
+
+Example
+-------
+>>> from pybsd.watcher import Watcher
+>>> watcher = Watcher(interval=5)
+>>> watcher.watch(master01)                        # doctest: +SKIP
+>>> watcher.start()                                # doctest: +SKIP
+"""
+from __future__ import absolute_import, print_function, unicode_literals
+
+import ctypes
+import ctypes.util
+import errno
+import fcntl
+import logging
+import os
+import re
+import select
+import stat
+import sys
+import threading
+
+import six
+
+__logger__ = logging.getLogger('pybsd')
+
+
+def safename(hostname):
+    """Returns the name ezjail gives the files of a jail
+
+    Parameters
+    ----------
+    hostname : :py:class:`str`
+        the jail's hostname
+
+    Returns
+    -------
+    : :py:class:`str`
+        the hostname, with anything but letters and digits replaced by underscores
+
+    Example
+    -------
+    >>> from pybsd.watcher import safename
+    >>> print(safename('web.foo-bar'))
+    web_foo_bar
+    """
+    return re.sub(r'[^A-Za-z0-9]', '_', hostname)
+
+
+def _self_pipe():
+    # A pipe whose reading end wakes a waiting backend once a byte is written to it. Neither end is inherited
+    fds = os.pipe()
+    for fd in fds:
+        fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+        fcntl.fcntl(fd, fcntl.F_SETFD, fcntl.fcntl(fd, fcntl.F_GETFD) | fcntl.FD_CLOEXEC)
+    return fds
+
+
+def _wake(fd):
+    try:
+        os.write(fd, b'\0')
+    except OSError as e:
+        # A full pipe already wakes its reader
+        if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+            raise
+
+
+class StatBackend(object):
+    """Waits for the next scan without being notified of changes. It works on every platform.
+
+    A backend is waited on by the watcher's thread, so :py:meth:`wakeup` may be called from any thread while
+    :py:meth:`close` is only called once the wait is over.
+    """
+    name = 'stat'
+
+    def __init__(self):
+        self._wakeup = threading.Event()
+
+    def add(self, path):
+        pass
+
+    def remove(self, path):
+        pass
+
+    def wait(self, timeout):
+        """Waits until a watched directory may have changed or `timeout` expired
+
+        Returns
+        -------
+        : :py:class:`bool`
+            whether a change was notified
+        """
+        self._wakeup.wait(timeout)
+        return False
+
+    def wakeup(self):
+        """Makes the pending and next waits return at once"""
+        self._wakeup.set()
+
+    def close(self):
+        """Releases the backend"""
+        self.wakeup()
+
+
+class KqueueBackend(StatBackend):
+    """Wakes the watcher as soon as a watched directory's entries change, through kqueue"""
+    name = 'kqueue'
+
+    def __init__(self):
+        super(KqueueBackend, self).__init__()
+        self._kqueue = select.kqueue()
+        self._fds = {}
+        self._wakeup_r, self._wakeup_w = _self_pipe()
+        self._kqueue.control([select.kevent(self._wakeup_r, filter=select.KQ_FILTER_READ, flags=select.KQ_EV_ADD)], 0, 0)
+
+    def add(self, path):
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            return
+        event = select.kevent(fd, filter=select.KQ_FILTER_VNODE, flags=select.KQ_EV_ADD | select.KQ_EV_CLEAR,
+                              fflags=select.KQ_NOTE_WRITE | select.KQ_NOTE_DELETE | select.KQ_NOTE_RENAME)
+        self._kqueue.control([event], 0, 0)
+        self._fds[path] = fd
+
+    def remove(self, path):
+        # Closing the descriptor deletes its events
+        fd = self._fds.pop(path, None)
+        if fd is not None:
+            os.close(fd)
+
+    def wait(self, timeout):
+        return any(event.ident != self._wakeup_r for event in self._kqueue.control(None, 16, timeout))
+
+    def wakeup(self):
+        _wake(self._wakeup_w)
+
+    def close(self):
+        if self._kqueue.closed:
+            return
+        for path in list(self._fds):
+            self.remove(path)
+        self._kqueue.close()
+        os.close(self._wakeup_r)
+        os.close(self._wakeup_w)
+
+
+class InotifyBackend(StatBackend):
+    """Wakes the watcher as soon as a file of a watched directory changes, through inotify"""
+    name = 'inotify'
+    # IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+    mask = 0x004 | 0x008 | 0x040 | 0x080 | 0x100 | 0x200 | 0x400 | 0x800
+
+    def __init__(self):
+        super(InotifyBackend, self).__init__()
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | getattr(os, 'O_CLOEXEC', 0))
+        if self._fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        self._watches = {}
+        self._wakeup_r, self._wakeup_w = _self_pipe()
+
+    def add(self, path):
+        watch = self._libc.inotify_add_watch(self._fd, path.encode(sys.getfilesystemencoding()), self.mask)
+        if watch >= 0:
+            self._watches[path] = watch
+
+    def remove(self, path):
+        watch = self._watches.pop(path, None)
+        if watch is not None:
+            self._libc.inotify_rm_watch(self._fd, watch)
+
+    def wait(self, timeout):
+        # Closing the descriptor would not wake a pending select, hence the self-pipe
+        if self._fd not in select.select([self._fd, self._wakeup_r], [], [], timeout)[0]:
+            return False
+        # The events are only drained: which files changed is found out by scanning
+        while True:
+            try:
+                if not os.read(self._fd, 65536):
+                    break
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                raise
+        return True
+
+    def wakeup(self):
+        _wake(self._wakeup_w)
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            os.close(self._wakeup_r)
+            os.close(self._wakeup_w)
+            self._fd = -1
+
+
+def default_backend():
+    """Returns the best backend available on the platform: kqueue, then inotify, then stat polling
+
+    Returns
+    -------
+    : :py:class:`~pybsd.watcher.StatBackend`
+    """
+    if hasattr(select, 'kqueue'):
+        return KqueueBackend()
+    if sys.platform.startswith('linux'):
+        try:
+            return InotifyBackend()
+        except (OSError, AttributeError):
+            __logger__.debug('inotify is not available, falling back to stat polling')
+    return StatBackend()
+
+
+class Watcher(object):
+    """Invalidates the cached state of the registered masters when ezjail's files change
+
+    The files are read under each master's :py:attr:`~pybsd.commands.EzjailConfig.root`, so they must be reachable on
+    the local filesystem. Subscribers are called with a master and the hostnames of its jails whose files changed. The
+    files of jails that are neither attached to the master nor in its snapshot are reported by their ezjail name.
+
+    Parameters
+    ----------
+    interval : Optional[:py:class:`float`]
+        The time, in seconds, between two scans of the watched directories
+    backend : Optional[:py:class:`~pybsd.watcher.StatBackend`]
+        Notifies the watcher of changes. Defaults to :py:func:`default_backend`. It is closed once the watcher's thread
+        stopped: restarting the watcher replaces it with a new instance of its class.
+    """
+
+    def __init__(self, interval=1.0, backend=None):
+        self.interval = interval
+        self.backend = backend if backend is not None else default_backend()
+        self._closed = False
+        #: :py:class:`list` [:py:class:`function`]: the functions called with a master and the hostnames of its jails
+        #: whose files changed
+        self.subscribers = []
+        self._masters = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._running = False
+
+    def _paths(self, master):
+        reader = master.ezjail_config
+        return (os.path.join(reader.root, reader.config_dir), os.path.join(reader.root, reader.run_dir))
+
+    def watch(self, master):
+        """Starts watching a master's files
+
+        Parameters
+        ----------
+        master : :py:class:`~pybsd.systems.masters.Master`
+        """
+        config_dir, run_dir = paths = self._paths(master)
+        signatures = _scan(config_dir, run_dir)
+        with self._lock:
+            watched = set(path for other, _ in six.itervalues(self._masters) for path in other)
+            self._masters[master] = (paths, signatures)
+            if self._closed:
+                return
+            for path in paths:
+                if path not in watched:
+                    self.backend.add(path)
+
+    def unwatch(self, master):
+        """Stops watching a master's files
+
+        Parameters
+        ----------
+        master : :py:class:`~pybsd.systems.masters.Master`
+        """
+        with self._lock:
+            paths, _ = self._masters.pop(master, (None, None))
+            if self._closed:
+                return
+            watched = set(path for other, _ in six.itervalues(self._masters) for path in other)
+            for path in paths or ():
+                if path not in watched:
+                    self.backend.remove(path)
+
+    @property
+    def masters(self):
+        """:py:class:`list` [:py:class:`~pybsd.systems.masters.Master`]: the watched masters"""
+        with self._lock:
+            return list(self._masters)
+
+    def subscribe(self, subscriber):
+        """Registers a function called with a master and the hostnames of its jails whose files changed
+
+        Parameters
+        ----------
+        subscriber : :py:class:`function`
+        """
+        self.subscribers.append(subscriber)
+
+    def check(self):
+        """Scans the watched files at once and invalidates the state of the masters whose files changed
+
+        Returns
+        -------
+        : :py:class:`dict`
+            the hostnames of the jails whose files changed, indexed by master. Masters without changes are left out.
+        """
+        with self._lock:
+            masters = list(six.iteritems(self._masters))
+        changes = {}
+        for master, ((config_dir, run_dir), signatures) in masters:
+            current = _scan(config_dir, run_dir)
+            changed = set(name for name in set(signatures) | set(current) if signatures.get(name) != current.get(name))
+            with self._lock:
+                if master in self._masters:
+                    self._masters[master] = ((config_dir, run_dir), current)
+            if changed:
+                changes[master] = self._hostnames(master, set(name for kind, name in changed))
+        for master, hostnames in six.iteritems(changes):
+            __logger__.debug('ezjail files of %s changed: %s', master.name, ', '.join(sorted(hostnames)))
+            master.invalidate(hostnames)
+            for subscriber in list(self.subscribers):
+                try:
+                    subscriber(master, hostnames)
+                except Exception:
+                    __logger__.exception('Watcher subscriber %r failed', subscriber)
+        return changes
+
+    def _hostnames(self, master, names):
+        # Maps ezjail's names to the hostnames of the master's jails, when they are known
+        known = set(jail.hostname for jail in six.itervalues(master.jails))
+        if master.last_jail_snapshot is not None:
+            known.update(master.last_jail_snapshot)
+        hostnames = dict((safename(hostname), hostname) for hostname in known)
+        return set(hostnames.get(name, name) for name in names)
+
+    def start(self):
+        """Starts watching in a background thread. Does nothing if it is already running. After :py:meth:`stop`, the
+        closed backend is replaced with a new one watching the same directories.
+
+        Raises
+        ------
+        RuntimeError
+            raised if the thread of a previous run did not exit yet, see :py:meth:`stop`
+        """
+        with self._lock:
+            if self._running:
+                return
+            if self._thread is not None and self._thread.is_alive():
+                raise RuntimeError('the watcher is still stopping')
+            self._running = True
+            if self._closed:
+                self.backend = type(self.backend)()
+                self._closed = False
+                for path in set(path for paths, _ in six.itervalues(self._masters) for path in paths):
+                    self.backend.add(path)
+        self._thread = threading.Thread(target=self._run, args=(self.backend,), name='pybsd-watcher')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stops the background thread, which releases the backend once it exits
+
+        Parameters
+        ----------
+        timeout : Optional[:py:class:`float`]
+            how long, in seconds, to wait for the thread. Waits as long as needed if None. If the thread is still running
+            a subscriber when it expires, the watcher cannot be started again until the thread exits.
+        """
+        with self._lock:
+            if not self._running:
+                return
+            self._running = False
+            self._closed = True
+            self.backend.wakeup()
+        self._thread.join(timeout)
+        if not self._thread.is_alive():
+            self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _run(self, backend):
+        # The thread owns the backend it was started with, and closes it once stopped. The lock keeps it from being
+        # closed before stop woke it up
+        try:
+            while self._running:
+                backend.wait(self.interval)
+                if self._running:
+                    try:
+                        self.check()
+                    except Exception:
+                        __logger__.exception('Checking ezjail files failed')
+        finally:
+            with self._lock:
+                backend.close()
+
+
+def _scan(config_dir, run_dir):
+    # Returns the stat signatures of the jails' configuration and run files, keyed by (kind, ezjail name)
+    signatures = {}
+    for kind, directory in (('config', config_dir), ('run', run_dir)):
+        try:
+            filenames = os.listdir(directory)
+        except OSError:
+            continue
+        for filename in filenames:
+            if kind == 'config':
+                if filename.startswith('.'):
+                    continue
+                name = filename[:-len('.norun')] if filename.endswith('.norun') else filename
+            else:
+                if not (filename.startswith('jail_') and filename.endswith('.id')):
+                    continue
+                name = filename[len('jail_'):-len('.id')]
+            try:
+                info = os.stat(os.path.join(directory, filename))
+            except OSError:
+                continue
+            if kind == 'config' and not stat.S_ISREG(info.st_mode):
+                continue
+            signatures[(kind, name)] = (filename, info.st_ino, info.st_size, getattr(info, 'st_mtime_ns', info.st_mtime))
+    return signatures
@@ -3,8 +3,8 @@ from __future__ import absolute_import, print_function, unicode_literals
 
 import unittest
 
-from pybsd import (BaseCommand, CommandConnectionError, CommandNotImplementedError, InvalidCommandExecutorError,
-                   InvalidCommandNameError, Master)
+from pybsd import (BaseCommand, CommandConnectionError, CommandNotImplementedError, CommandTimeoutError, Executor,
+                   InvalidCommandExecutorError, InvalidCommandNameError, Master)
 
 from ..test_executors import TestExecutor
 
@@ -17,6 +17,12 @@ class NoBinaryCommand(BaseCommand):
     name = 'some_command'
 
 
+class SleepCommand(BaseCommand):
+    name = 'sleep'
+    binary = 'sleep'
+    timeouts = {'10': 0.2}
+
+
 class BaseCommandTestCase(unittest.TestCase):
     executor_class = TestExecutor
     params = {
@@ -59,6 +65,19 @@ class BaseCommandTestCase(unittest.TestCase):
         self.assertEqual(context_manager.exception.message,
                          "Can't execute command: `some_command` is not implemented on `{system.name}`.".format(system=self.system))
 
+    def test_timeout(self):
+        self.system.execute = Executor()
+        with self.assertRaises(CommandTimeoutError) as context_manager:
+            SleepCommand(env=self.system).invoke('10')
+        self.assertEqual(context_manager.exception.message,
+                         "`sleep` on `{system.name}` did not complete within 0.2s.".format(system=self.system))
+
+    def test_default_timeout(self):
+        self.assertEqual(SleepCommand(env=self.system)._execute_kwargs(self.system.execute, ('1',)), {})
+        command = SleepCommand(env=self.system)
+        command.default_timeout = 5
+        self.assertEqual(command._execute_kwargs(self.system.execute, ('1',)), {'timeout': 5})
+
     @unittest.skip('Cannot be tested until BaseCommand is actually able to connect remotely')
     def test_socket_error(self):
         with self.assertRaises(CommandConnectionError) as context_manager:
@@ -1,10 +1,37 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, print_function, unicode_literals
 
-from pybsd import InvalidOutputError, WhitespaceError
+import os
+import shutil
+import socket
+import tempfile
+
+from pybsd import CommandConnectionError, Executor, InvalidOutputError, SubprocessError, WhitespaceError
+from pybsd.commands.ezjail_admin import JailEntry, JailList
+from pybsd.instrumentation import Instrumentation
 
 from .test_base import BaseCommandTestCase
-from ..test_executors import TestExecutorShortOutput, TestExecutorUnknownHeaders
+from ..test_executors import (CountingTestExecutor, TestExecutor, TestExecutorListError, TestExecutorShortOutput,
+                              TestExecutorUnknownHeaders)
+
+
+class TestExecutorManyJails(CountingTestExecutor):
+    ezjail_admin_list_output = (0,
+                    """STA JID  IP              Hostname                       Root Directory\n"""
+                    """--- ---- --------------- ------------------------------ ------------------------\n"""
+                    """ZR  1    10.0.1.41/24    web                            /usr/jails/web\n"""
+                    """    1    lo1|127.0.1.41/24\n"""
+                    """ZS  N/A  10.0.1.42/24    db                             /usr/jails/my db\n"""
+                    """ZR  3    10.0.1.43/24    mail                           /usr/jails/mail\n""",
+                    '')
+
+
+class TestExecutorMalformedRow(TestExecutor):
+    ezjail_admin_list_output = (0,
+                    """STA JID  IP              Hostname                       Root Directory\n"""
+                    """--- ---- --------------- ------------------------------ ------------------------\n"""
+                    """ZR  1    10.0.1.41/24\n""",
+                    '')
 
 
 class EzjailAdminTestCase(BaseCommandTestCase):
@@ -23,6 +50,20 @@ class EzjailAdminTestCase(BaseCommandTestCase):
                                 },
                         'incorrect ezjail-admin list output')
 
+    def test_list_entries(self):
+        jails = self.system.ezjail_admin.list()
+        self.assertIsInstance(jails, JailList)
+        entry = jails['system']
+        self.assertIsInstance(entry, JailEntry)
+        self.assertEqual((entry.name, entry.status, entry.jid, entry.root), ('system', 'ZR', '1', '/usr/jails/system'))
+        self.assertEqual(entry['ip'], '10.0.1.41/24')
+        self.assertFalse(hasattr(entry, '__dict__'), 'entries should be slotted')
+
+    def test_iter_list(self):
+        self.assertEqual(dict(self.system.ezjail_admin.iter_list()),
+                         self.system.ezjail_admin.list(),
+                         'incorrect ezjail-admin iter_list output')
+
     def test_console(self):
         cmd = 'service'
         jail_name = 'test_jail'
@@ -51,6 +92,21 @@ class ShortOutputTestCase(BaseCommandTestCase):
                          "`ezjail-admin` on `{system.name}` returned: 'output too short'".format(system=self.system))
 
 
+    def test_iter_list_too_short(self):
+        with self.assertRaises(InvalidOutputError):
+            list(self.system.ezjail_admin.iter_list())
+
+
+class ListErrorTestCase(BaseCommandTestCase):
+    executor_class = TestExecutorListError
+
+    def test_iter_list_error(self):
+        with self.assertRaises(SubprocessError) as context_manager:
+            list(self.system.ezjail_admin.iter_list())
+        self.assertEqual(context_manager.exception.message,
+                         "`ezjail-admin` on `{system.name}` returned: 'ezjail-admin: error'".format(system=self.system))
+
+
 class UnknownHeadersTestCase(BaseCommandTestCase):
     executor_class = TestExecutorUnknownHeaders
 
@@ -60,3 +116,225 @@ class UnknownHeadersTestCase(BaseCommandTestCase):
         self.assertEqual(context_manager.exception.message,
                          "`ezjail-admin` on `{system.name}` returned: 'output has unknown headers\n"
                          "['STA', 'JOID', 'IP', 'Hostname', 'Root Directory']'".format(system=self.system))
+
+
+class ManyJailsTestCase(BaseCommandTestCase):
+    executor_class = TestExecutorManyJails
+
+    def test_single_invocation(self):
+        self.system.ezjail_admin.list()
+        self.assertEqual(self.system.execute.calls, 1, 'list should invoke ezjail-admin once')
+
+    def test_unchanged_previous(self):
+        previous = self.system.ezjail_admin.list()
+        self.assertIs(self.system.ezjail_admin.list(previous=previous), previous)
+        self.assertEqual(self.system.execute.calls, 2, 'the probe should still invoke ezjail-admin')
+
+    def test_changed_previous(self):
+        previous = self.system.ezjail_admin.list()
+        self.system.execute.ezjail_admin_list_output = TestExecutor.ezjail_admin_list_output
+        jails = self.system.ezjail_admin.list(previous=previous)
+        self.assertIsNot(jails, previous)
+        self.assertEqual(sorted(jails), ['system'])
+        self.assertNotEqual(jails.digest, previous.digest)
+
+    def test_indexes(self):
+        jails = self.system.ezjail_admin.list()
+        self.assertEqual(sorted(jails), ['db', 'mail', 'web'])
+        self.assertEqual(jails.by_jid(3).name, 'mail')
+        self.assertEqual(jails.by_ip('127.0.1.41').name, 'web')
+        self.assertEqual(jails.by_ip('10.0.1.42/24').name, 'db')
+        with self.assertRaises(KeyError):
+            jails.by_jid('N/A')
+        with self.assertRaises(KeyError):
+            jails.by_ip('10.0.1.44')
+        del jails['mail']
+        with self.assertRaises(KeyError):
+            jails.by_jid(3)
+
+    def test_indexes_after_changes(self):
+        jails = self.system.ezjail_admin.list()
+        web = jails.pop('web')
+        with self.assertRaises(KeyError):
+            jails.by_jid(1)
+        jails.update(web=web)
+        self.assertIs(jails.by_jid(1), web)
+        jails.clear()
+        with self.assertRaises(KeyError):
+            jails.by_ip('10.0.1.41')
+        jails.setdefault('web', web)
+        self.assertIs(jails.by_ip('10.0.1.41'), web)
+        jails.popitem()
+        with self.assertRaises(KeyError):
+            jails.by_ip('10.0.1.41')
+
+    def test_root_with_whitespace(self):
+        self.assertEqual(self.system.ezjail_admin.list()['db'].root, '/usr/jails/my db')
+
+
+class MalformedRowTestCase(BaseCommandTestCase):
+    executor_class = TestExecutorMalformedRow
+
+    def test_malformed_row(self):
+        with self.assertRaises(InvalidOutputError):
+            self.system.ezjail_admin.list()
+
+
+FAKE_EZJAIL_ADMIN = r'''#!/bin/sh
+# Mimics ezjail-admin, keeping the jails in $state/jails and the running ones in $state/running
+state=$(dirname "$0")
+echo "$*" >> "$state/calls"
+touch "$state/jails" "$state/running"
+subcommand=$1
+shift
+case $subcommand in
+list)
+    echo "STA JID  IP              Hostname                       Root Directory"
+    echo "--- ---- --------------- ------------------------------ ------------------------"
+    i=0
+    for jail in $(cat "$state/jails"); do
+        i=$((i + 1))
+        if grep -qx "$jail" "$state/running"; then sta=ZR; jid=$i; else sta=ZS; jid=N/A; fi
+        printf '%-3s %-4s %-15s %-30s %s\n' "$sta" "$jid" "10.0.1.$i/24" "$jail" "/usr/jails/$jail"
+    done ;;
+create)
+    while getopts c:f: option; do :; done
+    shift $((OPTIND - 1))
+    echo "$1" >> "$state/jails" ;;
+start|restart)
+    for jail; do
+        if grep -qx "$jail" "$state/jails"; then echo "$jail" >> "$state/running"; else echo "$jail: no such jail" >&2; fi
+    done ;;
+stop)
+    for jail; do grep -vx "$jail" "$state/running" > "$state/tmp"; mv "$state/tmp" "$state/running"; done ;;
+delete)
+    shift
+    grep -qx "$1" "$state/jails" || { echo "Error: Nonexistent jail: $1" >&2; exit 1; }
+    for file in jails running; do grep -vx "$1" "$state/$file" > "$state/tmp"; mv "$state/tmp" "$state/$file"; done ;;
+esac
+'''
+
+
+class MutatingTestCase(BaseCommandTestCase):
+    executor_class = Executor
+
+    def setUp(self):
+        super(MutatingTestCase, self).setUp()
+        self.state = tempfile.mkdtemp()
+        binary = os.path.join(self.state, 'ezjail-admin')
+        with open(binary, 'w') as f:
+            f.write(FAKE_EZJAIL_ADMIN)
+        os.chmod(binary, 0o755)
+        self.system.ezjail_admin_binary = binary
+        self.ezjail_admin = self.system.ezjail_admin
+
+    def tearDown(self):
+        shutil.rmtree(self.state)
+
+    @property
+    def calls(self):
+        with open(os.path.join(self.state, 'calls')) as f:
+            return f.read().splitlines()
+
+    def create(self, *names):
+        for name in names:
+            self.ezjail_admin.create(name, ['10.0.1.1', 'lo1|127.0.1.1'])
+
+    def test_create(self):
+        self.ezjail_admin.create('web', ['10.0.1.41', 'lo1|127.0.1.41'], flavour='base')
+        self.ezjail_admin.create('db', '10.0.1.42', jail_type='D')
+        self.assertEqual(self.calls, ['create -c zfs -f base web 10.0.1.41,lo1|127.0.1.41', 'create db 10.0.1.42'])
+        self.assertEqual(sorted(self.ezjail_admin.list()), ['db', 'web'])
+
+    def test_create_whitespace(self):
+        with self.assertRaises(WhitespaceError):
+            self.ezjail_admin.create('web', '10.0.1.41', flavour='my flavour')
+
+    def test_start_stop(self):
+        self.create('web')
+        self.ezjail_admin.start('web')
+        self.assertEqual(self.ezjail_admin.list()['web'].status, 'ZR')
+        self.ezjail_admin.restart('web')
+        self.ezjail_admin.stop('web')
+        self.assertEqual(self.ezjail_admin.list()['web'].status, 'ZS')
+
+    def test_delete(self):
+        self.create('web')
+        self.ezjail_admin.delete('web')
+        self.assertEqual(self.calls[-1], 'delete -fw web')
+        self.assertEqual(self.ezjail_admin.list(), {})
+        with self.assertRaises(SubprocessError):
+            self.ezjail_admin.delete('web', wipe=False)
+        self.assertEqual(self.calls[-1], 'delete -f web')
+
+    def test_start_many(self):
+        names = ['jail{}'.format(i) for i in range(20)]
+        self.create(*names)
+        results = self.ezjail_admin.start_many(names + ['missing'])
+        self.assertEqual(results, dict([(name, True) for name in names] + [('missing', False)]))
+        self.assertEqual(self.calls[20:], ['start {} missing'.format(' '.join(names)), 'list'])
+
+    def test_bulk_size(self):
+        self.ezjail_admin.bulk_size = 2
+        self.create('web', 'db', 'mail')
+        self.assertEqual(self.ezjail_admin.start_many(['web', 'db', 'mail']), {'web': True, 'db': True, 'mail': True})
+        self.assertEqual(self.calls[3:], ['start web db', 'start mail', 'list'])
+
+    def test_many_without_jails(self):
+        for method in (self.ezjail_admin.start_many, self.ezjail_admin.stop_many, self.ezjail_admin.restart_many,
+                       self.ezjail_admin.delete_many):
+            self.assertEqual(method([]), {})
+        self.assertFalse(os.path.exists(os.path.join(self.state, 'calls')), 'ezjail-admin should not be invoked without jails')
+
+    def test_stop_many(self):
+        self.create('web', 'db')
+        self.ezjail_admin.start_many(['web', 'db'])
+        self.assertEqual(self.ezjail_admin.stop_many(['web', 'db', 'missing']), {'web': True, 'db': True, 'missing': False})
+        self.assertEqual(self.calls[-2:], ['stop web db missing', 'list'])
+
+    def test_restart_many(self):
+        self.create('web', 'db')
+        self.assertEqual(self.ezjail_admin.restart_many(['web', 'db']), {'web': True, 'db': True})
+
+    def test_delete_many(self):
+        self.create('web', 'db', 'mail')
+        self.assertEqual(self.ezjail_admin.delete_many(['web', 'missing', 'mail']),
+                         {'web': True, 'missing': False, 'mail': True})
+        self.assertEqual(sorted(self.ezjail_admin.list()), ['db'])
+
+    def test_delete_many_split_lines(self):
+        self.system.execute.splitlines = True
+        self.assertEqual(self.ezjail_admin.delete_many(['missing']), {'missing': False})
+
+    def test_delete_many_instrumented(self):
+        self.create('web', 'db')
+        self.system.execute.instrumentation = Instrumentation()
+        self.ezjail_admin.timeouts = {'delete': 5}
+        self.ezjail_admin.delete_many(['web', 'db'])
+        self.assertEqual(list(self.system.execute.instrumentation.stats()), [('system', 'ezjail-admin', 'delete')])
+
+    def test_delete_many_connection_error(self):
+        self.create('web')
+        self.assertEqual(self.system.jail_snapshot['web'].status, 'ZS')
+
+        def unreachable(*args, **kwargs):
+            raise socket.error('unreachable')
+        self.system.execute._run = unreachable
+        with self.assertRaises(CommandConnectionError):
+            self.ezjail_admin.delete_many(['web'])
+        del self.system.execute._run
+        self.assertEqual(self.system.jail_snapshot['web'].status, 'ZS')
+        self.assertEqual(self.calls.count('list'), 2, 'the snapshot should be invalidated')
+
+    def test_bulk_whitespace(self):
+        with self.assertRaises(WhitespaceError):
+            self.ezjail_admin.start_many(['web', 'my db'])
+        self.assertFalse(os.path.exists(os.path.join(self.state, 'calls')))
+
+    def test_invalidates_snapshot(self):
+        self.create('web')
+        self.assertEqual(self.system.jail_snapshot['web'].status, 'ZS')
+        self.ezjail_admin.start('web')
+        self.assertEqual(self.system.jail_snapshot['web'].status, 'ZR')
+        self.ezjail_admin.delete_many(['web'])
+        self.assertEqual(self.system.jail_snapshot, {})
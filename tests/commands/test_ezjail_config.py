@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, print_function, unicode_literals
+
+import os
+import shutil
+import tempfile
+
+from pybsd import EzjailConfig, InvalidOutputError
+from pybsd.commands.ezjail_admin import JailList
+
+from .test_base import BaseCommandTestCase
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'test_ezjail_config')
+
+
+class EzjailConfigTestCase(BaseCommandTestCase):
+
+    def setUp(self):
+        super(EzjailConfigTestCase, self).setUp()
+        self.root = tempfile.mkdtemp()
+        shutil.rmtree(self.root)
+        shutil.copytree(FIXTURE, self.root)
+        self.reader = self.system.ezjail_config
+        self.reader.root = self.root
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_registered(self):
+        self.assertIsInstance(self.system.ezjail_config, EzjailConfig)
+        self.assertIs(self.system.state_source, self.system.ezjail_admin)
+
+    def test_list(self):
+        jails = self.reader.list()
+        self.assertIsInstance(jails, JailList)
+        self.assertEqual(dict((name, dict(entry)) for name, entry in jails.items()),
+                         {'web.foo.bar': {'status': 'ZR',
+                                          'jid': '3',
+                                          'ip': '10.0.1.41',
+                                          'ips': ['10.0.1.41', '2a01:4f8:210:41e6::1:41:1', '127.0.1.41'],
+                                          'root': '/usr/jails/web.foo.bar'},
+                          'db.foo.bar': {'status': 'DSN',
+                                         'jid': 'N/A',
+                                         'ip': '10.0.1.42',
+                                         'ips': ['10.0.1.42'],
+                                         'root': '/usr/jails/db.foo.bar'}})
+        self.assertEqual(jails.by_jid(3).name, 'web.foo.bar')
+
+    def test_unchanged_previous(self):
+        previous = self.reader.list()
+        self.assertIs(self.reader.list(previous=previous), previous)
+
+    def test_changed_previous(self):
+        previous = self.reader.list()
+        os.remove(os.path.join(self.root, 'var/run/jail_web_foo_bar.id'))
+        jails = self.reader.list(previous=previous)
+        self.assertIsNot(jails, previous)
+        self.assertEqual((jails['web.foo.bar'].status, jails['web.foo.bar'].jid), ('ZS', 'N/A'))
+
+    def test_ignored_files(self):
+        os.mkdir(os.path.join(self.root, 'usr/local/etc/ezjail/flavours'))
+        with open(os.path.join(self.root, 'usr/local/etc/ezjail/.web_foo_bar.swp'), 'w') as f:
+            f.write('garbage')
+        self.assertEqual(sorted(self.reader.list()), ['db.foo.bar', 'web.foo.bar'])
+
+    def test_no_hostname(self):
+        with open(os.path.join(self.root, 'usr/local/etc/ezjail/mail'), 'w') as f:
+            f.write('export jail_mail_ip="10.0.1.43"\n')
+        with self.assertRaises(InvalidOutputError):
+            self.reader.list()
+
+    def test_malformed_line(self):
+        with open(os.path.join(self.root, 'usr/local/etc/ezjail/mail'), 'w') as f:
+            f.write('export jail_mail_hostname\n')
+        with self.assertRaises(InvalidOutputError):
+            self.reader.list()
+
+    def test_no_config_dir(self):
+        self.reader.root = os.path.join(self.root, 'missing')
+        with self.assertRaises(InvalidOutputError):
+            self.reader.list()
+
+    def test_state_source(self):
+        self.system.state_source = self.reader
+        self.assertEqual(sorted(self.system.refresh()), ['db.foo.bar', 'web.foo.bar'])
+        self.assertIs(self.system.refresh(), self.system.jail_snapshot)
+        self.assertEqual(self.system.refresh_stats, {'refreshes': 2, 'skipped': 1})
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, print_function, unicode_literals
+
+import os
+import shutil
+import tempfile
+
+from pybsd import Executor, InvalidOutputError, Jail, Jexec, MasterJailMismatchError, SubprocessError
+from pybsd.transcripts import RecordingExecutor, ReplayExecutor, Transcript
+
+from .test_base import BaseCommandTestCase
+from .test_ezjail_config import FIXTURE
+
+FAKE_JEXEC = r'''#!/bin/sh
+# Mimics jexec, running the command on the host with the jid in $JID, and failing for jid 13
+state=$(dirname "$0")
+echo "$*" >> "$state/calls"
+if [ "$1" = 13 ]; then echo "jexec: jail \"13\" not found" >&2; exit 1; fi
+JID=$1
+export JID
+shift
+exec "$@"
+'''
+
+
+class JexecTestCase(BaseCommandTestCase):
+    executor_class = Executor
+    params = dict(BaseCommandTestCase.params, j_if=('re0', ['10.0.2.0/24']), jlo_if=('lo1', ['127.0.2.0/24']))
+
+    def setUp(self):
+        super(JexecTestCase, self).setUp()
+        self.state = tempfile.mkdtemp()
+        binary = os.path.join(self.state, 'jexec')
+        with open(binary, 'w') as f:
+            f.write(FAKE_JEXEC)
+        os.chmod(binary, 0o755)
+        self.system.jexec_binary = binary
+        self.jexec = self.system.jexec
+
+    def tearDown(self):
+        shutil.rmtree(self.state)
+
+    @property
+    def calls(self):
+        with open(os.path.join(self.state, 'calls')) as f:
+            return f.read().splitlines()
+
+    def test_registered(self):
+        self.assertIsInstance(self.system.jexec, Jexec)
+        self.assertEqual(self.system.jexec.binary, self.system.jexec_binary)
+
+    def test_run(self):
+        self.assertEqual(self.jexec.run(3, 'echo "in $JID"'), 'in 3\n')
+        self.assertEqual(self.calls, ['3 /bin/sh -c echo "in $JID"'])
+
+    def test_run_error(self):
+        with self.assertRaises(SubprocessError) as context_manager:
+            self.jexec.run(3, 'echo failed >&2; exit 2')
+        self.assertEqual(context_manager.exception.parameters['err'], 'failed')
+
+    def test_fan_out(self):
+        results = self.jexec.fan_out('echo "out $JID"; printf "err $JID" >&2; exit $JID', [3, 4, 5])
+        self.assertEqual(results, {3: (3, 'out 3\n', 'err 3'), 4: (4, 'out 4\n', 'err 4'), 5: (5, 'out 5\n', 'err 5')})
+        self.assertEqual(len(self.calls), 3, 'jexec must be run once per jail by a single host invocation')
+
+    def test_fan_out_outputs(self):
+        # Empty outputs, missing trailing newlines, blank lines and lines mimicking the framing are all preserved
+        results = self.jexec.fan_out('[ $JID = 3 ] && printf "a\\n\\nb"; [ $JID = 4 ] && echo "pybsd- end 4 0"; true',
+                                     [3, 4, 5])
+        self.assertEqual(results, {3: (0, 'a\n\nb', ''), 4: (0, 'pybsd- end 4 0\n', ''), 5: (0, '', '')})
+
+    def test_fan_out_failed_jail(self):
+        results = self.jexec.fan_out('echo ok', [3, 13])
+        self.assertEqual(results[3], (0, 'ok\n', ''))
+        self.assertEqual(results[13], (1, '', 'jexec: jail "13" not found\n'))
+
+    def test_fan_out_no_jids(self):
+        self.assertEqual(self.jexec.fan_out('echo ok', []), {})
+
+    def test_fan_out_missing_output(self):
+        with self.assertRaises(InvalidOutputError):
+            self.jexec._parse_frames('b start 3\nout\n\nb end 4 0\n', 'b')
+        self.assertEqual(self.jexec._parse_frames('b start 3\nout\n\nb end 3 0\nb start 4\nou', 'b'), {3: ('out\n', 0)})
+
+    def test_fan_out_boundary_in_output(self):
+        with self.assertRaises(InvalidOutputError):
+            self.jexec._parse_frames('b start 3\nb start 4\n\nb end 3 0\n', 'b')
+        with self.assertRaises(InvalidOutputError):
+            self.jexec._parse_frames('b start 3\n\nb end 3 0\nb forged\n', 'b')
+
+    def test_fan_out_replay(self):
+        transcript = Transcript()
+        self.system.execute = RecordingExecutor(transcript)
+        recorded = self.jexec.fan_out('echo "out $JID"', [3, 4])
+        self.system.execute = ReplayExecutor(transcript)
+        self.assertEqual(self.jexec.fan_out('echo "out $JID"', [3, 4]), recorded)
+        self.assertEqual(recorded, {3: (0, 'out 3\n', ''), 4: (0, 'out 4\n', '')})
+        self.assertEqual(len(self.calls), 2, 'replayed fan-outs must not run jexec')
+
+    def test_fan_out_host_error(self):
+        self.jexec.shell = 'false'
+        with self.assertRaises(SubprocessError):
+            self.jexec.fan_out('echo ok', [3])
+
+    def test_run_in_jails(self):
+        root = tempfile.mkdtemp()
+        shutil.rmtree(root)
+        shutil.copytree(FIXTURE, root)
+        self.addCleanup(shutil.rmtree, root)
+        self.system.ezjail_config.root = root
+        self.system.state_source = self.system.ezjail_config
+        web = Jail(name='web', uid=12, hostname='web.foo.bar', master=self.system)
+        db = Jail(name='db', uid=13, hostname='db.foo.bar', master=self.system)
+        self.assertEqual(self.system.run_in_jails('echo "in $JID"'), {web: (0, 'in 3\n', ''), db: None})
+        self.assertEqual(self.system.run_in_jails('echo "in $JID"', [db]), {db: None})
+        other = Jail(name='other', uid=14, hostname='other.foo.bar')
+        with self.assertRaises(MasterJailMismatchError):
+            self.system.run_in_jails('true', [web, other])
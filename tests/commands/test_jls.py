@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, print_function, unicode_literals
+
+from pybsd import InvalidOutputError, Jls, SubprocessError
+from pybsd.commands.jls import _iter_json_array
+
+from .test_base import BaseCommandTestCase
+from ..test_executors import TestExecutor
+
+
+class TestExecutorJlsStrings(TestExecutor):
+    jls_output = (0,
+                  '{"__version": "1", "jail-information": {"jail": [\n'
+                  '{"jid":"2","name":"web","ip4.addr":"10.0.1.42,127.0.1.42","ip6.addr":""}\n'
+                  ']}}\n',
+                  '')
+
+
+class TestExecutorJlsError(TestExecutor):
+    jls_output = (1, '', 'jls: unknown parameter: foo\n')
+
+
+class TestExecutorJlsTruncated(TestExecutor):
+    jls_output = (0, '{"__version": "2", "jail-information": {"jail": [{"jid":1,"name":"system', '')
+
+
+class TestExecutorJlsCalls(TestExecutor):
+    def __init__(self, *args, **kwargs):
+        super(TestExecutorJlsCalls, self).__init__(*args, **kwargs)
+        self.calls = []
+
+    def __call__(self, binary, subcommand, *cmd_args, **kwargs):
+        self.calls.append((binary, subcommand) + cmd_args)
+        return super(TestExecutorJlsCalls, self).__call__(binary, subcommand, *cmd_args, **kwargs)
+
+
+class JlsTestCase(BaseCommandTestCase):
+
+    def test_registered(self):
+        self.assertIsInstance(self.system.jls, Jls)
+        self.assertEqual(self.system.jls.binary, '/usr/sbin/jls')
+
+    def test_list(self):
+        self.assertEqual(self.system.jls.list(),
+                         {'system_foo_bar': {'jid': 1,
+                                             'name': 'system_foo_bar',
+                                             'host.hostname': 'system.foo.bar',
+                                             'ip4.addr': ['10.0.1.41', '127.0.1.41'],
+                                             'ip6.addr': ['2a01:4f8:210:41e6::1:41:1']}})
+
+    def test_iter_list(self):
+        self.assertEqual([name for name, jail in self.system.jls.iter_list()], ['system_foo_bar'])
+
+    def test_iter_json_array_chunks(self):
+        out = self.system.execute.jls_output[1]
+        for size in (1, 2, 7, len(out)):
+            chunks = [out[i:i + size] for i in range(0, len(out), size)]
+            self.assertEqual([jail['jid'] for jail in _iter_json_array(chunks, 'jail')], [1])
+
+    def test_iter_json_array_skips_other_values(self):
+        self.assertEqual(list(_iter_json_array(['{"a": "jail", "jail": {}, "b": {"jail" : [ {"c": 1} ]}}'], 'jail')),
+                         [{'c': 1}])
+
+    def test_iter_json_array_empty(self):
+        self.assertEqual(list(_iter_json_array(['{"jail-information": {"jail": []}}'], 'jail')), [])
+
+
+class JlsStringsTestCase(BaseCommandTestCase):
+    executor_class = TestExecutorJlsStrings
+
+    def test_list_strings(self):
+        self.assertEqual(self.system.jls.list(),
+                         {'web': {'jid': 2, 'name': 'web', 'ip4.addr': ['10.0.1.42', '127.0.1.42'], 'ip6.addr': []}})
+
+
+class JlsErrorTestCase(BaseCommandTestCase):
+    executor_class = TestExecutorJlsError
+
+    def test_list_error(self):
+        with self.assertRaises(SubprocessError):
+            self.system.jls.list('foo')
+
+    def test_iter_list_error(self):
+        with self.assertRaises(SubprocessError):
+            list(self.system.jls.iter_list('foo'))
+
+
+class JlsTruncatedTestCase(BaseCommandTestCase):
+    executor_class = TestExecutorJlsTruncated
+
+    def test_list_truncated(self):
+        with self.assertRaises(InvalidOutputError):
+            self.system.jls.list()
+
+    def test_iter_list_truncated(self):
+        with self.assertRaises(InvalidOutputError):
+            list(self.system.jls.iter_list())
+
+
+class JlsParametersTestCase(BaseCommandTestCase):
+    executor_class = TestExecutorJlsCalls
+
+    def test_requested_parameters(self):
+        self.system.jls.list('jid')
+        self.assertEqual(self.system.execute.calls, [('/usr/sbin/jls', '--libxo', 'json', 'name', 'jid')])
+
+    def test_default_parameters(self):
+        self.system.jls.list()
+        self.assertEqual(self.system.execute.calls[0][3:], Jls.default_parameters)
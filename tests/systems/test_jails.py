@@ -7,10 +7,25 @@ import ipaddress
 import unipath
 
 from pybsd import AttachNonMasterError, InvalidUIDError, Jail, Master, System
+from pybsd.cache import CommandCache
 
+from ..test_executors import CountingTestExecutor, TestExecutor
 from ..utils import extract_message
 
 
+class TestExecutorJails(CountingTestExecutor):
+    ezjail_admin_list_output = (0,
+                    """STA JID  IP              Hostname                       Root Directory\n"""
+                    """--- ---- --------------- ------------------------------ ------------------------\n"""
+                    """ZR  4    10.0.2.12/24    system.foo.bar                 /usr/jails/system\n"""
+                    """ZS  N/A  10.0.2.13/24    other.foo.bar                  /usr/jails/other\n""",
+                    '')
+
+
+class TestMaster(Master):
+    ExecutorClass = TestExecutorJails
+
+
 class JailTestCase(unittest.TestCase):
     master_params = {
         'name': 'master',
@@ -32,7 +47,7 @@ class JailTestCase(unittest.TestCase):
 
     def setUp(self):
         params = self.params.copy()
-        self.master = params['master'] = Master(**self.master_params)
+        self.master = params['master'] = TestMaster(**self.master_params)
         self.system = Jail(**params)
 
     def test_bad_master(self):
@@ -174,10 +189,20 @@ class JailTestCase(unittest.TestCase):
         self.assertEqual(self.system.auto_start, True,
                         'incorrect auto_start')
 
-    def test_attached_default_status(self):
-        self.assertEqual(self.system.status, 'S',
+    def test_attached_status(self):
+        self.assertEqual(self.system.status, 'R',
                         'incorrect status')
 
+    def test_stopped_status(self):
+        self.system.hostname = 'other.foo.bar'
+        self.assertEqual((self.system.status, self.system.jid), ('S', None),
+                        'incorrect stopped status')
+
+    def test_missing_status(self):
+        self.system.hostname = 'missing.foo.bar'
+        self.assertEqual((self.system.status, self.system.jid), (None, None),
+                        'incorrect missing status')
+
     def test_unattached_default_status(self):
         params = self.params.copy()
         del params['master']
@@ -200,9 +225,87 @@ class JailTestCase(unittest.TestCase):
                         'incorrect jid')
 
     def test_jid(self):
-        self.assertEqual(self.system.jid, 1,
+        self.assertEqual(self.system.jid, 4,
                         'incorrect jid')
 
+    def test_shared_snapshot(self):
+        jails = [self.master.clone_jail(self.system, 'system{}'.format(i), 100 + i, 'system{}.foo.bar'.format(i))
+                 for i in range(50)]
+        self.assertEqual([jail.status for jail in [self.system] + jails], ['R'] + [None] * 50)
+        self.assertEqual(self.master.execute.calls, 1,
+                        'the snapshot must be fetched once')
+
+    def test_stale_snapshot(self):
+        self.system.status
+        self.master._jail_snapshot_time -= self.master.state_max_age
+        self.system.status
+        self.assertEqual(self.master.execute.calls, 2,
+                        'a stale snapshot must be fetched again')
+
+    def test_no_max_age(self):
+        self.master.state_max_age = None
+        self.system.status
+        self.master._jail_snapshot_time -= 3600
+        self.system.status
+        self.assertEqual(self.master.execute.calls, 1,
+                        'the snapshot must only be fetched again on refresh')
+
+    def test_refresh(self):
+        self.system.status
+        self.assertIsNot(self.master.refresh(), None)
+        self.system.status
+        self.assertEqual(self.master.execute.calls, 2,
+                        'refresh must fetch the snapshot again')
+
+    def test_refresh_keeps_other_results(self):
+        self.master.command_cache = CommandCache()
+        other = (self.master, 'jls', ('list',))
+        self.master.command_cache.set(other, (0, '', ''), ttl=60)
+        self.system.status
+        generation = self.master.command_cache.generation(self.master)
+        self.master.refresh()
+        self.assertEqual(self.master.execute.calls, 2,
+                        'refresh must drop the cached listing')
+        self.assertEqual(self.master.command_cache.get(other), (True, (0, '', '')),
+                        'refresh must keep the other cached results')
+        self.assertEqual(self.master.command_cache.generation(self.master), generation)
+
+    def test_unchanged_refresh(self):
+        self.assertIsNone(self.master.last_jail_snapshot)
+        snapshot = self.master.jail_snapshot
+        self.master.invalidate()
+        self.assertIs(self.master.last_jail_snapshot, snapshot)
+        self.assertIs(self.master.refresh(), snapshot)
+        self.assertEqual(self.master.refresh_stats, {'refreshes': 2, 'skipped': 1})
+
+    def test_changed_refresh(self):
+        snapshot = self.master.jail_snapshot
+        self.master.execute.ezjail_admin_list_output = TestExecutor.ezjail_admin_list_output
+        self.assertIsNot(self.master.refresh(), snapshot)
+        self.assertEqual(self.master.refresh_stats, {'refreshes': 2, 'skipped': 0})
+        self.assertEqual(self.system.status, None,
+                        'a changed listing must be parsed again')
+
+    def test_no_discovered_ips(self):
+        self.assertEqual(self.system.discovered_ips, None,
+                        'incorrect discovered_ips')
+
+    def test_discovered_ips(self):
+        self.master.jail_states = {'system.foo.bar': {'jid': 4, 'ip4.addr': ['10.0.2.12'], 'ip6.addr': ['::2:12']}}
+        self.assertEqual(self.system.discovered_ips, ['10.0.2.12', '::2:12'],
+                        'incorrect discovered_ips')
+
+    def test_refresh_jail_states(self):
+
+        class JlsMaster(Master):
+            ExecutorClass = TestExecutor
+
+        master = JlsMaster(**self.master_params)
+        system = master.attach_jail(self.system.__class__(**dict(self.params, master=None)))
+        self.assertEqual(sorted(master.refresh_jail_states()), ['system.foo.bar'])
+        self.assertEqual(system.discovered_ips, ['10.0.1.41', '127.0.1.41', '2a01:4f8:210:41e6::1:41:1'],
+                        'incorrect discovered_ips')
+
     def test_no_master_path(self):
         params = self.params.copy()
         del params['master']
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, print_function, unicode_literals
+
+import asyncio
+import time
+import unittest
+
+from pybsd import CommandNotImplementedError, ExecutionTimeoutError, Master
+from pybsd.aio import AsyncExecutor, AsyncSingleFlight, ConcurrencyLimits, gather
+from pybsd.cache import CommandCache
+
+from .commands.test_base import NoBinaryCommand
+from .test_executors import CountingTestExecutor, TestExecutor
+
+
+class TestAsyncExecutor(AsyncExecutor):
+    """Serves the canned outputs of :py:class:`tests.test_executors.TestExecutor` and keeps track of concurrency"""
+    delay = 0
+
+    def __init__(self, *args, **kwargs):
+        super(TestAsyncExecutor, self).__init__(*args, **kwargs)
+        self.running = 0
+        self.max_running = 0
+        self.canned = CountingTestExecutor()
+
+    @property
+    def calls(self):
+        return self.canned.calls
+
+    async def _run(self, args, stdin=None):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(self.delay)
+        self.running -= 1
+        return self.canned(*args)
+
+
+class AsyncExecutorTestCase(unittest.TestCase):
+
+    def test_ls_output(self):
+        executor = AsyncExecutor()
+        rc, out, err = asyncio.run(executor('ls', 'tests/test_executors'))
+        self.assertEqual(rc, 0, 'incorrect executor return code')
+        self.assertEqual(out, 'readme\n', 'incorrect executor stdout')
+        self.assertEqual(err, '', 'incorrect executor stderr')
+
+    def test_no_synchronous_api(self):
+        executor = AsyncExecutor()
+        for call in (lambda: executor.batch(), lambda: executor.map([('echo', 'foo')]),
+                     lambda: executor.pipe(('echo', 'foo'), ('cat',)), lambda: executor.stream('echo', 'foo')):
+            with self.assertRaises(TypeError) as context_manager:
+                call()
+            self.assertIn('use an Executor instead', str(context_manager.exception))
+
+    def test_ls_with_rc_out_err_output(self):
+        executor = AsyncExecutor()
+        rc = asyncio.run(executor('ls', 'tests/test_executors', rc=0, out='readme\n', err=''))
+        self.assertEqual(rc, None, 'incorrect executor return code')
+
+    def test_stdin(self):
+        executor = AsyncExecutor()
+        rc, out, err = asyncio.run(executor('cat', stdin=b'foo'))
+        self.assertEqual(out, 'foo', 'incorrect executor stdout')
+
+    def test_per_host_limit(self):
+        executor = TestAsyncExecutor(limits=ConcurrencyLimits(per_host_limit=2))
+        executor.delay = 0.01
+
+        async def run():
+            await asyncio.gather(*[executor('/usr/local/bin/ezjail-admin', 'list') for _ in range(6)])
+        asyncio.run(run())
+        self.assertEqual(executor.max_running, 2, 'per host limit not enforced')
+
+    def test_global_limit(self):
+        limits = ConcurrencyLimits(global_limit=3)
+        executors = [TestAsyncExecutor(instance='host{}'.format(i), limits=limits) for i in range(6)]
+
+        async def run():
+            await asyncio.gather(*[e('/usr/local/bin/ezjail-admin', 'list') for e in executors])
+        TestAsyncExecutor.delay = 0.01
+        try:
+            asyncio.run(run())
+        finally:
+            TestAsyncExecutor.delay = 0
+        self.assertTrue(all(e.max_running == 1 for e in executors))
+
+    def test_host(self):
+        self.assertEqual(AsyncExecutor().host, 'localhost')
+        self.assertEqual(AsyncExecutor(instance='box01').host, 'box01')
+
+    def test_timeout(self):
+        executor = AsyncExecutor()
+        start = time.time()
+        with self.assertRaises(ExecutionTimeoutError):
+            asyncio.run(executor('sleep', '10', timeout=0.2))
+        self.assertLess(time.time() - start, 1, 'the command should have been terminated')
+
+
+class GatherTestCase(unittest.TestCase):
+
+    def test_partial_results(self):
+        executor = AsyncExecutor()
+        start = time.time()
+        results = asyncio.run(gather(executor('echo', 'foo'), executor('sleep', '10'), executor('echo', 'bar'),
+                                     timeout=0.5))
+        self.assertLess(time.time() - start, 1.5, 'overdue commands should have been terminated')
+        self.assertEqual(results, [(0, 'foo\n', ''), None, (0, 'bar\n', '')])
+
+    def test_no_timeout(self):
+        executor = AsyncExecutor()
+        self.assertEqual(asyncio.run(gather(executor('echo', 'foo'))), [(0, 'foo\n', '')])
+
+    def test_exceptions(self):
+        executor = AsyncExecutor()
+        with self.assertRaises(ExecutionTimeoutError):
+            asyncio.run(gather(executor('echo', 'foo'), executor('sleep', '10', timeout=0.1)))
+        results = asyncio.run(gather(executor('echo', 'foo'), executor('sleep', '10', timeout=0.1),
+                                     return_exceptions=True))
+        self.assertEqual(results[0], (0, 'foo\n', ''))
+        self.assertIsInstance(results[1], ExecutionTimeoutError)
+
+    def test_empty(self):
+        self.assertEqual(asyncio.run(gather()), [])
+
+
+class AsyncCommandTestCase(unittest.TestCase):
+    params = {
+        'name': 'system',
+        'hostname': 'system.foo.bar',
+        'ext_if': ('re0', ['8.8.8.8/24']),
+        'int_if': ('eth0', ['192.168.0.0/24'])
+    }
+
+    def setUp(self):
+
+        class TestMaster(Master):
+            ExecutorClass = TestExecutor
+            AsyncExecutorClass = TestAsyncExecutor
+
+        self.system = TestMaster(**self.params)
+
+    def test_default_aexecute(self):
+        system = Master(**self.params)
+        self.assertIsInstance(system.aexecute, AsyncExecutor)
+
+    def test_alist(self):
+        self.assertEqual(asyncio.run(self.system.ezjail_admin.alist()),
+                         self.system.ezjail_admin.list(),
+                         'incorrect ezjail-admin alist output')
+
+    def test_alist_single_invocation(self):
+        asyncio.run(self.system.ezjail_admin.alist())
+        self.assertEqual(self.system.aexecute.calls, 1)
+
+    def test_aconsole(self):
+        self.assertEqual(asyncio.run(self.system.ezjail_admin.aconsole('service', 'test_jail')),
+                         'The output of command `service` in jail `test_jail`',
+                         'incorrect ezjail-admin aconsole output')
+
+    def test_single_flight(self):
+        self.system.single_flight = AsyncSingleFlight()
+        self.system.aexecute.delay = 0.01
+
+        async def run():
+            return await asyncio.gather(*[self.system.ezjail_admin.ainvoke('list') for _ in range(10)])
+        results = asyncio.run(run())
+        self.assertEqual(self.system.aexecute.calls, 1)
+        self.assertTrue(all(result == results[0] for result in results), 'all callers should get the same result')
+        self.assertEqual((self.system.single_flight.executions, self.system.single_flight.shared), (1, 9))
+
+    def test_single_flight_invalidated(self):
+        self.system.single_flight = AsyncSingleFlight()
+        self.system.command_cache = CommandCache()
+        self.system.aexecute.delay = 0.05
+
+        async def run():
+            first = asyncio.ensure_future(self.system.ezjail_admin.ainvoke('list'))
+            await asyncio.sleep(0.01)
+            self.system.invalidate()
+            return await asyncio.gather(first, self.system.ezjail_admin.ainvoke('list'))
+        asyncio.run(run())
+        self.assertEqual(self.system.aexecute.calls, 2, 'a call made after an invalidation must not join an older flight')
+        self.assertEqual(self.system.single_flight.shared, 0)
+
+    def test_single_flight_mutating(self):
+        self.system.single_flight = AsyncSingleFlight()
+
+        async def run():
+            return await asyncio.gather(*[self.system.ezjail_admin.ainvoke('console', '-e', 'ls', 'jail') for _ in range(3)])
+        asyncio.run(run())
+        self.assertEqual(self.system.aexecute.calls, 3)
+
+    def test_no_binary_command(self):
+        _bc = NoBinaryCommand(env=self.system)
+        with self.assertRaises(CommandNotImplementedError):
+            asyncio.run(_bc.ainvoke())
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, print_function, unicode_literals
+
+import threading
+import time
+import unittest
+
+from pybsd import Master
+from pybsd.cache import CommandCache, SingleFlight
+
+from .test_executors import TestExecutor
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class CountingExecutor(TestExecutor):
+    delay = 0
+
+    def __init__(self, *args, **kwargs):
+        super(CountingExecutor, self).__init__(*args, **kwargs)
+        self.calls = []
+        # Called once, while the next list is running, which then returns an outdated listing
+        self.during_list = None
+
+    def __call__(self, binary, subcommand, *cmd_args, **kwargs):
+        self.calls.append(subcommand)
+        time.sleep(self.delay)
+        if subcommand == 'list' and self.during_list is not None:
+            during_list, self.during_list = self.during_list, None
+            during_list()
+            return (0, 'old', '')
+        if subcommand in ('start', 'stop'):
+            return (0, '', '')
+        if subcommand == 'fail':
+            return (1, '', 'error')
+        return super(CountingExecutor, self).__call__(binary, subcommand, *cmd_args, **kwargs)
+
+
+class CommandCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.cache = CommandCache(clock=self.clock)
+
+    def test_ttl(self):
+        self.cache.set(('box01', 'ls', ()), 'foo', ttl=10)
+        self.assertEqual(self.cache.get(('box01', 'ls', ())), (True, 'foo'))
+        self.clock.now += 10
+        self.assertEqual(self.cache.get(('box01', 'ls', ())), (False, None))
+        self.assertEqual(self.cache.stats, {'hits': 1, 'misses': 1, 'entries': 0})
+
+    def test_no_ttl(self):
+        self.cache.set(('box01', 'ls', ()), 'foo', ttl=0)
+        self.assertEqual(len(self.cache), 0, 'entries with no ttl should not be stored')
+
+    def test_invalidate_system(self):
+        self.cache.set(('box01', 'ls', ()), 'foo', ttl=10)
+        self.cache.set(('box02', 'ls', ()), 'bar', ttl=10)
+        self.cache.invalidate('box01')
+        self.assertEqual(self.cache.get(('box01', 'ls', ())), (False, None))
+        self.assertEqual(self.cache.get(('box02', 'ls', ())), (True, 'bar'))
+
+    def test_stale_generation(self):
+        generation = self.cache.generation('box01')
+        other = self.cache.generation('box02')
+        self.cache.invalidate('box01')
+        self.cache.set(('box01', 'ls', ()), 'old', ttl=10, generation=generation)
+        self.cache.set(('box02', 'ls', ()), 'bar', ttl=10, generation=other)
+        self.assertEqual(self.cache.get(('box01', 'ls', ())), (False, None))
+        self.assertEqual(self.cache.get(('box02', 'ls', ())), (True, 'bar'))
+        self.cache.invalidate()
+        self.cache.set(('box02', 'ls', ()), 'bar', ttl=10, generation=other)
+        self.assertEqual(len(self.cache), 0, 'entries started before invalidating all systems should not be stored')
+
+    def test_invalidate_all(self):
+        self.cache.set(('box01', 'ls', ()), 'foo', ttl=10)
+        self.cache.set(('box02', 'ls', ()), 'bar', ttl=10)
+        self.cache.invalidate()
+        self.assertEqual(len(self.cache), 0, 'all entries should have been dropped')
+
+
+class InvokeCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+
+        class TestMaster(Master):
+            ExecutorClass = CountingExecutor
+
+        self.clock = Clock()
+        self.system = TestMaster(name='system', ext_if=('re0', ['8.8.8.8/24']))
+        self.system.command_cache = CommandCache(clock=self.clock)
+        self.ezjail_admin = self.system.ezjail_admin
+
+    def test_no_cache(self):
+        self.system.command_cache = None
+        self.ezjail_admin.invoke('list')
+        self.ezjail_admin.invoke('list')
+        self.assertEqual(self.system.execute.calls, ['list', 'list'])
+
+    def test_read_only_cached(self):
+        self.ezjail_admin.list()
+        self.ezjail_admin.list()
+        self.assertEqual(self.system.execute.calls, ['list'])
+        self.assertEqual(self.system.command_cache.hits, 1)
+
+    def test_ttl(self):
+        self.ezjail_admin.invoke('list')
+        self.clock.now += self.ezjail_admin.cache_ttls['list']
+        self.ezjail_admin.invoke('list')
+        self.assertEqual(self.system.execute.calls, ['list', 'list'])
+
+    def test_mutating_invalidates(self):
+        self.ezjail_admin.invoke('list')
+        self.ezjail_admin.invoke('start', 'system')
+        self.ezjail_admin.invoke('list')
+        self.assertEqual(self.system.execute.calls, ['list', 'start', 'list'])
+
+    def test_other_systems_not_invalidated(self):
+
+        class TestMaster(Master):
+            ExecutorClass = CountingExecutor
+
+        other = TestMaster(name='other', ext_if=('re0', ['8.8.4.4/24']))
+        other.command_cache = self.system.command_cache
+        other.ezjail_admin.invoke('list')
+        self.ezjail_admin.invoke('start', 'system')
+        other.ezjail_admin.invoke('list')
+        self.assertEqual(other.execute.calls, ['list'])
+
+    def test_overlapping_mutation(self):
+        # A start runs while a list is in flight: the list's result may predate it, so it must not be cached
+        self.system.execute.during_list = lambda: self.ezjail_admin.invoke('start', 'system')
+        self.assertEqual(self.ezjail_admin.invoke('list'), (0, 'old', ''))
+        self.assertEqual(self.ezjail_admin.invoke('list'), self.system.execute.ezjail_admin_list_output)
+        self.assertEqual(self.system.execute.calls, ['list', 'start', 'list'])
+
+    def test_failures_not_cached(self):
+        self.ezjail_admin.read_only_subcommands = ('fail',)
+        self.ezjail_admin.invoke('fail')
+        self.ezjail_admin.invoke('fail')
+        self.assertEqual(self.system.execute.calls, ['fail', 'fail'])
+
+
+class SingleFlightTestCase(unittest.TestCase):
+
+    def setUp(self):
+
+        class TestMaster(Master):
+            ExecutorClass = CountingExecutor
+
+        self.system = TestMaster(name='system', ext_if=('re0', ['8.8.8.8/24']))
+        self.system.single_flight = SingleFlight()
+        self.system.execute.delay = 0.1
+
+    def invoke_concurrently(self, *args):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.system.ezjail_admin.invoke(*args))) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_read_only_coalesced(self):
+        results = self.invoke_concurrently('list')
+        self.assertEqual(self.system.execute.calls, ['list'])
+        self.assertEqual(len(results), 10)
+        self.assertTrue(all(result == results[0] for result in results), 'all callers should get the same result')
+        self.assertEqual((self.system.single_flight.executions, self.system.single_flight.shared), (1, 9))
+
+    def test_mutating_not_coalesced(self):
+        self.system.execute.delay = 0
+        self.invoke_concurrently('start', 'system')
+        self.assertEqual(self.system.execute.calls, ['start'] * 10)
+
+    def test_sequential_calls_not_coalesced(self):
+        self.system.execute.delay = 0
+        self.system.ezjail_admin.invoke('list')
+        self.system.ezjail_admin.invoke('list')
+        self.assertEqual(self.system.execute.calls, ['list', 'list'])
+
+    def test_no_joining_after_invalidation(self):
+        # A list starts, then a start invalidates the system: a list called after it must not get the first one's result
+        self.system.command_cache = CommandCache()
+        self.system.execute.delay = 0
+        results = []
+
+        def during_list():
+            self.system.ezjail_admin.invoke('start', 'system')
+            follower = threading.Thread(target=lambda: results.append(self.system.ezjail_admin.invoke('list')))
+            follower.start()
+            follower.join(2)
+
+        self.system.execute.during_list = during_list
+        self.assertEqual(self.system.ezjail_admin.invoke('list'), (0, 'old', ''))
+        self.assertEqual(results, [self.system.execute.ezjail_admin_list_output])
+        self.assertEqual(self.system.execute.calls, ['list', 'start', 'list'])
+        self.assertEqual(self.system.single_flight.shared, 0)
+
+    def test_no_joining_after_mutation_without_cache(self):
+        # Without a cache, a list called after a start must not join a list that started before it either
+        self.system.execute.delay = 0
+        results = []
+
+        def during_list():
+            self.system.ezjail_admin.invoke('start', 'system')
+            follower = threading.Thread(target=lambda: results.append(self.system.ezjail_admin.invoke('list')))
+            follower.start()
+            follower.join(2)
+
+        self.system.execute.during_list = during_list
+        self.assertIsNone(self.system.command_cache)
+        self.assertEqual(self.system.ezjail_admin.invoke('list'), (0, 'old', ''))
+        self.assertEqual(results, [self.system.execute.ezjail_admin_list_output])
+        self.assertEqual(self.system.execute.calls, ['list', 'start', 'list'])
+        self.assertEqual(self.system.single_flight.shared, 0)
+
+    def test_exceptions_shared(self):
+        flights = SingleFlight()
+        errors = []
+        started = threading.Event()
+
+        def fail():
+            started.set()
+            time.sleep(0.1)
+            raise ValueError('failed')
+
+        def call():
+            try:
+                flights.do('key', fail)
+            except ValueError as e:
+                errors.append(e)
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait()
+        follower = threading.Thread(target=call)
+        follower.start()
+        leader.join()
+        follower.join()
+        self.assertEqual(len(errors), 2, 'every caller should get the exception')
+        self.assertEqual(flights.executions, 1)
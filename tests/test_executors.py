@@ -1,10 +1,35 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, print_function, unicode_literals
 
+import os
 import subprocess
+import tempfile
+import threading
+import time
 import unittest
 
-from pybsd import Executor
+from pybsd import ExecutionTimeoutError, Executor, Master, executors
+from pybsd.executors import RawOutput, SessionExecutor, SpilledOutput, frame, unframe
+from pybsd.transports import LocalTransport
+
+
+class TestStreamResult(object):
+    def __init__(self, rc, out, err):
+        self.lines = iter(out.splitlines())
+        self._rc, self._err = rc, err
+        self.rc = self.err = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.lines)
+
+    next = __next__
+
+    def close(self):
+        self.rc, self.err = self._rc, self._err
+
 
 class TestExecutor(Executor):
     ezjail_admin_list_output = (0,
@@ -15,8 +40,16 @@ class TestExecutor(Executor):
                     """    1    lo1|127.0.1.41/24\n"""
                     """    1    lo1|::1:41/100\n""",
                     '')
+    jls_output = (0,
+                  """{"__version": "2", "jail-information": {"jail": [\n"""
+                  """{"jid":1,"name":"system_foo_bar","host.hostname":"system.foo.bar","""
+                  """"ip4.addr":["10.0.1.41","127.0.1.41"],"ip6.addr":["2a01:4f8:210:41e6::1:41:1"]}\n"""
+                  """]}}\n""",
+                  '')
 
     def __call__(self, binary, subcommand, *cmd_args, **kwargs):
+        if 'jls' in binary:
+            return self.jls_output
         if 'ezjail-admin' in binary:
             if subcommand == 'list':
                 return self.ezjail_admin_list_output
@@ -25,6 +58,21 @@ class TestExecutor(Executor):
                         'The output of command `{}` in jail `{}`'.format(cmd_args[1], cmd_args[2]),
                         '')
 
+    def stream(self, binary, subcommand, *cmd_args, **kwargs):
+        return TestStreamResult(*self(binary, subcommand, *cmd_args, **kwargs))
+
+
+class CountingTestExecutor(TestExecutor):
+    """Counts the commands it serves"""
+
+    def __init__(self, *args, **kwargs):
+        super(CountingTestExecutor, self).__init__(*args, **kwargs)
+        self.calls = 0
+
+    def __call__(self, binary, subcommand, *cmd_args, **kwargs):
+        self.calls += 1
+        return super(CountingTestExecutor, self).__call__(binary, subcommand, *cmd_args, **kwargs)
+
 
 class TestExecutorUnknownHeaders(TestExecutor):
     ezjail_admin_list_output = (0,
@@ -43,6 +91,10 @@ class TestExecutorShortOutput(TestExecutor):
                     '')
 
 
+class TestExecutorListError(TestExecutor):
+    ezjail_admin_list_output = (1, '', 'ezjail-admin: error\n')
+
+
 class ExecutorTestCase(unittest.TestCase):
 
     def test_ls_output(self):
@@ -123,3 +175,541 @@ class ExecutorTestCase(unittest.TestCase):
         with self.assertRaises(subprocess.CalledProcessError) as context_manager:
             executor('ls', 'i/do/not/exist', rc=[1, 2, 3], out='readme\n', err='something')
         self.assertEqual(context_manager.exception.returncode, 2, 'incorrect executor return code')
+
+
+class StreamTestCase(unittest.TestCase):
+
+    def test_stream_lines(self):
+        executor = Executor()
+        lines = executor.stream('ls', 'tests/test_executors')
+        self.assertEqual(list(lines), ['readme'], 'incorrect streamed stdout')
+        self.assertEqual(lines.rc, 0, 'incorrect executor return code')
+        self.assertEqual(lines.err, '', 'incorrect executor stderr')
+
+    def test_stream_rc_unavailable_until_exhausted(self):
+        lines = Executor().stream('printf', 'foo\\nbar')
+        self.assertEqual(lines.rc, None, 'return code should not be available yet')
+        self.assertEqual(next(lines), 'foo', 'incorrect streamed line')
+        self.assertEqual(next(lines), 'bar', 'incorrect streamed line')
+        with self.assertRaises(StopIteration):
+            next(lines)
+        self.assertEqual(lines.rc, 0, 'incorrect executor return code')
+
+    def test_stream_stderr(self):
+        lines = Executor().stream('ls', 'i/do/not/exist')
+        self.assertEqual(list(lines), [], 'incorrect streamed stdout')
+        self.assertNotEqual(lines.rc, 0, 'incorrect executor return code')
+        self.assertIn('i/do/not/exist', lines.err, 'incorrect executor stderr')
+
+    def test_stream_stdin(self):
+        with Executor().stream('cat', stdin=b'foo\r\nbar\n') as lines:
+            self.assertEqual(list(lines), ['foo', 'bar'], 'incorrect streamed stdout')
+
+    def test_stream_spawn_failure(self):
+        spooled = []
+        TemporaryFile = tempfile.TemporaryFile
+        self.addCleanup(setattr, tempfile, 'TemporaryFile', TemporaryFile)
+        tempfile.TemporaryFile = lambda *args, **kwargs: spooled.append(TemporaryFile(*args, **kwargs)) or spooled[-1]
+        with self.assertRaises(OSError):
+            Executor().stream('i/do/not/exist', stdin=b'foo')
+        self.assertEqual(len(spooled), 2)
+        self.assertTrue(all(f.closed for f in spooled), 'the spooled stdin and stderr should be closed')
+
+    def test_stream_close_early(self):
+        lines = Executor().stream('seq', '1000000')
+        self.assertEqual(next(lines), '1', 'incorrect streamed line')
+        lines.close()
+        self.assertIsNotNone(lines.rc, 'return code should be available once closed')
+        self.assertEqual(list(lines), [], 'a closed stream should be exhausted')
+
+
+class SessionExecutorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.executor = SessionExecutor()
+
+    def tearDown(self):
+        self.executor.close()
+
+    def test_ls_output(self):
+        rc, out, err = self.executor('ls', 'tests/test_executors')
+        self.assertEqual(rc, 0, 'incorrect executor return code')
+        self.assertEqual(out, 'readme\n', 'incorrect executor stdout')
+        self.assertEqual(err, '', 'incorrect executor stderr')
+
+    def test_ls_file_not_found_output(self):
+        rc, out, err = self.executor('ls', 'i/do/not/exist')
+        self.assertNotEqual(rc, 0, 'incorrect executor return code')
+        self.assertEqual(out, '', 'incorrect executor stdout')
+        self.assertIn('i/do/not/exist', err, 'incorrect executor stderr')
+
+    def test_output_without_trailing_newline(self):
+        rc, out, err = self.executor('sh', '-c', 'printf foo; printf bar >&2; exit 3')
+        self.assertEqual((rc, out, err), (3, 'foo', 'bar'), 'incorrect executor output')
+
+    def test_quoting(self):
+        rc, out, err = self.executor('echo', "it's $HOME; `true`")
+        self.assertEqual(out, "it's $HOME; `true`\n", 'arguments should not be interpreted by the shell')
+
+    def test_stdin(self):
+        rc, out, err = self.executor('cat', stdin=b'foo')
+        self.assertEqual(out, 'foo', 'incorrect executor stdout')
+
+    def test_binary_stdin(self):
+        data = bytes(bytearray(range(256))) * 2 + b"'%s\\n-"
+        self.assertEqual(self.executor('od', '-An', '-v', '-tx1', stdin=data)[1].split(),
+                         ['{:02x}'.format(byte) for byte in bytearray(data)], 'every byte should reach the command')
+        self.assertEqual(self.executor('cat', stdin=b'')[1], '')
+
+    def test_stdin_on_remote_session(self):
+        # The stdin of a remote session's commands must travel through the session, as the host can not read local files
+        scripts = []
+
+        class RecordingSessionExecutor(SessionExecutor):
+            def _exchange(self, script, *args, **kwargs):
+                scripts.append(script)
+                return super(RecordingSessionExecutor, self)._exchange(script, *args, **kwargs)
+
+        with RecordingSessionExecutor(instance='box01', transport=LocalTransport('box01')) as executor:
+            self.assertEqual(executor('cat', stdin=b'foo\nbar'), (0, 'foo\nbar', ''))
+            with executor.batch() as batch:
+                batch.add('echo', 'foo')
+                batch.add('sh', '-c', 'echo bar >&2; exit 3')
+        self.assertEqual(batch.results, [(0, 'foo\n', ''), (3, '', 'bar\n')])
+        self.assertFalse(any(tempfile.gettempdir().encode('utf8') in script for script in scripts),
+                         'no local file should be passed to the session')
+
+    def test_no_stdin(self):
+        rc, out, err = self.executor('cat')
+        self.assertEqual(out, '', 'commands should not read the session stdin')
+
+    def test_session_is_reused(self):
+        self.executor('true')
+        pid = self.executor._session.pid
+        self.executor('true')
+        self.assertEqual(self.executor._session.pid, pid, 'the session shell should be reused')
+
+    def test_session_restarts(self):
+        with self.assertRaises(IOError):
+            self.executor('sh', '-c', 'kill -9 $PPID')
+        self.assertFalse(self.executor.is_open, 'the session should be closed')
+        self.assertEqual(self.executor('echo', 'foo'), (0, 'foo\n', ''), 'the session should restart')
+
+    def test_large_output(self):
+        rc, out, err = self.executor('seq', '100000')
+        self.assertEqual(out.splitlines()[-1], '100000', 'incorrect executor stdout')
+
+    def test_as_executor_class(self):
+
+        class SessionMaster(Master):
+            ExecutorClass = SessionExecutor
+
+        master = SessionMaster(name='master', ext_if=('re0', ['8.8.8.8/24']))
+        self.assertIsInstance(master.execute, SessionExecutor)
+        master.execute.close()
+
+
+class BatchTestCase(unittest.TestCase):
+
+    def test_results_in_order(self):
+        with Executor().batch() as batch:
+            batch.add('ls', 'tests/test_executors')
+            batch.add('sh', '-c', 'printf foo; printf bar >&2; exit 3')
+            batch.add('echo', "it's $HOME")
+        self.assertEqual(batch.results, [(0, 'readme\n', ''), (3, 'foo', 'bar'), (0, "it's $HOME\n", '')],
+                         'incorrect batch results')
+
+    def test_single_spawn(self):
+        executor = Executor()
+        calls = []
+        run = executor._run
+        executor._run = lambda args, stdin=None: calls.append(args) or run(args, stdin)
+        with executor.batch() as batch:
+            for _ in range(10):
+                batch.add('true')
+        self.assertEqual(len(calls), 1, 'a batch should spawn a single process')
+        self.assertEqual(len(batch.results), 10)
+
+    def test_stop_on_error(self):
+        with Executor().batch(stop_on_error=True) as batch:
+            batch.add('true')
+            batch.add('false')
+            batch.add('echo', 'foo')
+        self.assertEqual(batch.results, [(0, '', ''), (1, '', ''), None], 'commands after a failure should be skipped')
+
+    def test_no_stop_on_error(self):
+        with Executor().batch() as batch:
+            batch.add('false')
+            batch.add('echo', 'foo')
+        self.assertEqual(batch.results, [(1, '', ''), (0, 'foo\n', '')])
+
+    def test_commands_do_not_read_script(self):
+        with Executor().batch() as batch:
+            batch.add('cat')
+            batch.add('echo', 'foo')
+        self.assertEqual(batch.results, [(0, '', ''), (0, 'foo\n', '')])
+
+    def test_splitlines(self):
+        batch = Executor(splitlines=True).batch()
+        batch.add('printf', 'foo\\nbar\\n')
+        self.assertEqual(batch.run(), [(0, ['foo', 'bar'], [])])
+
+    def test_not_run_on_exception(self):
+        with self.assertRaises(ValueError):
+            with Executor().batch() as batch:
+                batch.add('true')
+                raise ValueError
+        self.assertIsNone(batch.results, 'the batch should not have run')
+
+    def test_unframe_missing(self):
+        script = frame(('true',), 'm0')
+        self.assertIn('m0', script)
+        self.assertEqual(unframe(b'm0:0\n', b'm0\n', ['m0', 'm1']), [(0, b'', b''), None])
+
+
+class RawTestCase(unittest.TestCase):
+
+    def test_raw_output(self):
+        rc, out, err = Executor()('printf', '\\377\\376', raw=True)
+        self.assertEqual(rc, 0, 'incorrect executor return code')
+        self.assertIsInstance(out, RawOutput)
+        self.assertEqual(out.data, b'\xff\xfe', 'output should not be decoded')
+        self.assertEqual(out.view.tobytes(), b'\xff\xfe')
+        self.assertEqual(err, b'')
+
+    def test_lazy_decoding(self):
+        rc, out, err = Executor()('ls', 'tests/test_executors', raw=True)
+        self.assertIsNone(out._text, 'output should not be decoded until accessed')
+        self.assertEqual(out.text, 'readme\n')
+        self.assertEqual(out.splitlines(), ['readme'])
+
+    def test_raw_ignores_splitlines(self):
+        rc, out, err = Executor(splitlines=True)('ls', 'tests/test_executors', raw=True)
+        self.assertEqual(out, b'readme\n')
+
+    def test_raw_byte_comparison(self):
+        executor = Executor()
+        self.assertEqual(executor('printf', '\\377', out=b'\xff', err='', raw=True), 0)
+        self.assertEqual(executor('ls', 'tests/test_executors', out='readme\n', err=b'', raw=True), 0)
+        with self.assertRaises(subprocess.CalledProcessError):
+            executor('printf', '\\377', out=b'\xfe', raw=True)
+
+    def test_raw_output_equality(self):
+        self.assertEqual(RawOutput(b'foo'), RawOutput(b'foo'))
+        self.assertEqual(RawOutput(b'foo'), 'foo')
+        self.assertNotEqual(RawOutput(b'foo'), b'bar')
+        self.assertEqual(len({RawOutput(b'foo'), RawOutput(b'foo')}), 1)
+
+
+class MapTestCase(unittest.TestCase):
+
+    def test_ordered(self):
+        commands = [('sh', '-c', 'sleep 0.{}; echo {}'.format(i, i)) for i in (3, 1, 2)]
+        self.assertEqual(list(Executor().map(commands)), [(0, '3\n', ''), (0, '1\n', ''), (0, '2\n', '')],
+                         'results should be in submission order')
+
+    def test_as_completed(self):
+        commands = [('sh', '-c', 'sleep 0.{}; echo {}'.format(i, i)) for i in (3, 1, 2)]
+        results = list(Executor().map(commands, ordered=False))
+        self.assertEqual(results, [(1, (0, '1\n', '')), (2, (0, '2\n', '')), (0, (0, '3\n', ''))],
+                         'results should be in completion order')
+
+    def test_errors(self):
+        results = list(Executor().map([('ls', 'i/do/not/exist'), ('ls', 'tests/test_executors')]))
+        self.assertNotEqual(results[0][0], 0, 'incorrect return code')
+        self.assertIn('i/do/not/exist', results[0][2], 'incorrect stderr')
+        self.assertEqual(results[1], (0, 'readme\n', ''))
+
+    def test_large_output(self):
+        results = list(Executor().map([('seq', '200000')] * 3))
+        self.assertTrue(all(out.splitlines()[-1] == '200000' for rc, out, err in results), 'output should be complete')
+
+    def test_concurrency(self):
+        start = time.time()
+        list(Executor().map([('sleep', '0.2')] * 4, max_workers=4))
+        self.assertLess(time.time() - start, 0.6, 'commands should run concurrently')
+
+    def test_max_workers(self):
+        start = time.time()
+        list(Executor().map([('sleep', '0.2')] * 4, max_workers=2))
+        self.assertGreaterEqual(time.time() - start, 0.4, 'max_workers should be respected')
+
+    def test_process_limit(self):
+        executor = Executor()
+        executor.process_limit = threading.BoundedSemaphore(1)
+        start = time.time()
+        list(executor.map([('sleep', '0.1')] * 3, max_workers=3))
+        self.assertGreaterEqual(time.time() - start, 0.3, 'process_limit should be respected')
+        self.assertTrue(executor.process_limit.acquire(False), 'slots should have been released')
+
+    def test_close_kills_running(self):
+        executor = Executor()
+        executor.process_limit = threading.BoundedSemaphore(2)
+        results = executor.map([('echo', 'foo'), ('sleep', '10'), ('sleep', '10')], max_workers=2)
+        self.assertEqual(next(results), (0, 'foo\n', ''))
+        start = time.time()
+        results.close()
+        self.assertLess(time.time() - start, 1, 'running commands should have been killed')
+        self.assertTrue(executor.process_limit.acquire(False) and executor.process_limit.acquire(False),
+                        'slots should have been released')
+
+    def test_empty(self):
+        self.assertEqual(list(Executor().map([])), [])
+
+
+class SpillTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.lines = ''.join('{}\n'.format(i) for i in range(1, 20001))
+
+    def test_below_threshold(self):
+        self.assertEqual(Executor()('seq', '10', spill_threshold=1024), (0, '1\n2\n3\n4\n5\n6\n7\n8\n9\n10\n', ''))
+
+    def test_spilled(self):
+        rc, out, err = Executor()('seq', '20000', spill_threshold=1024)
+        with out:
+            self.assertIsInstance(out, SpilledOutput)
+            self.assertEqual(len(out), len(self.lines))
+            self.assertEqual(out, self.lines)
+            self.assertEqual(out.text, self.lines)
+
+    def test_session_only_with_timeout(self):
+        popen_kwargs = []
+
+        class RecordingExecutor(Executor):
+            def _popen(self, args, **kwargs):
+                popen_kwargs.append(kwargs)
+                return super(RecordingExecutor, self)._popen(args, **kwargs)
+
+        RecordingExecutor()('seq', '10', spill_threshold=1024)
+        RecordingExecutor()('seq', '10', spill_threshold=1024, timeout=5)
+        self.assertEqual([bool(kwargs.get('start_new_session') or kwargs.get('preexec_fn')) for kwargs in popen_kwargs],
+                         [False, True])
+        # Python 2 has neither start_new_session nor posix_spawn
+        saved, executors._HAS_NEW_SESSION = executors._HAS_NEW_SESSION, False
+        RecordingExecutor.use_posix_spawn = False
+        try:
+            self.assertEqual(RecordingExecutor()('seq', '1', spill_threshold=1024, timeout=5), (0, '1\n', ''))
+        finally:
+            executors._HAS_NEW_SESSION = saved
+        self.assertNotIn('start_new_session', popen_kwargs[-1], 'python 2 has no start_new_session')
+        self.assertIn('preexec_fn', popen_kwargs[-1], 'the child should start its session itself')
+
+    def test_default_threshold(self):
+        executor = Executor()
+        executor.spill_threshold = 1024
+        self.assertIsInstance(executor('seq', '20000')[1], SpilledOutput)
+
+    def test_slicing(self):
+        out = Executor()('seq', '20000', spill_threshold=1024)[1]
+        self.assertEqual(out[:6], b'1\n2\n3\n')
+        self.assertEqual(out[-6:], b'20000\n')
+        self.assertEqual(out.view[-6:].tobytes(), b'20000\n')
+
+    def test_lines(self):
+        out = Executor()('printf', 'foo\r\nbar\nbaz', spill_threshold=1)[1]
+        self.assertEqual(list(out), ['foo', 'bar', 'baz'])
+        self.assertEqual(out.splitlines(), ['foo', 'bar', 'baz'])
+
+    def test_search(self):
+        out = Executor()('seq', '20000', spill_threshold=1024)[1]
+        self.assertEqual(out.search(br'^1999.$').group(), b'19990')
+        self.assertEqual(out.search('^1234$').start(), self.lines.index('1234\n'))
+        self.assertEqual(len(list(out.finditer(br'^\d*7$'))), 2000)
+        self.assertIsNone(out.search(b'foo'))
+
+    def test_stdin(self):
+        out = Executor()('cat', stdin=b'x' * 5000, spill_threshold=100)[1]
+        self.assertEqual(out, b'x' * 5000)
+
+    def test_expected_output(self):
+        self.assertEqual(Executor()('seq', '20000', spill_threshold=1024, out=self.lines), (0, ''))
+        with self.assertRaises(subprocess.CalledProcessError):
+            Executor()('seq', '20000', spill_threshold=1024, out='foo')
+
+    def test_close(self):
+        out = Executor()('seq', '20000', spill_threshold=1024)[1]
+        out.close()
+        with self.assertRaises(ValueError):
+            out[:1]
+
+    def test_session_does_not_spill(self):
+        with SessionExecutor() as executor:
+            self.assertEqual(executor('seq', '3', spill_threshold=1), (0, '1\n2\n3\n', ''))
+
+
+class PipeTestCase(unittest.TestCase):
+
+    def test_output(self):
+        result = Executor().pipe(('printf', 'foo\nbar\n'), ('grep', 'bar'), ('tr', 'a-z', 'A-Z'))
+        self.assertEqual(result.returncodes, [0, 0, 0])
+        self.assertEqual(result.out, 'BAR\n')
+        self.assertEqual(result.errs, ['', '', ''])
+        self.assertIsNone(result.byte_counts, 'bytes should only be counted on demand')
+
+    def test_returncodes(self):
+        result = Executor().pipe(('sh', '-c', 'echo foo >&2; exit 3'), ('cat',), ('sh', '-c', 'cat; exit 2'))
+        self.assertEqual(result.returncodes, [3, 0, 2])
+        self.assertEqual(result.rc, 2, 'the last failure should be reported')
+        self.assertEqual(result.errs, ['foo\n', '', ''])
+
+    def test_sigpipe(self):
+        result = Executor().pipe(('seq', '1000000'), ('head', '-1'))
+        self.assertEqual(result.out, '1\n')
+        self.assertEqual(result.returncodes[1], 0)
+        self.assertNotEqual(result.returncodes[0], 0, 'the first stage should have been stopped by its closed pipe')
+
+    def test_large_output(self):
+        result = Executor().pipe(('seq', '200000'), ('gzip',), ('gunzip',), ('tail', '-1'))
+        self.assertEqual(result.out, '200000\n')
+
+    def test_byte_counts(self):
+        result = Executor().pipe(('seq', '200000'), ('gzip',), ('gunzip',), ('wc', '-l'), count=True)
+        self.assertEqual(result.byte_counts[0], result.byte_counts[2], 'gunzip should restore the bytes seq wrote')
+        self.assertEqual(result.byte_counts[3], len(result.out))
+        self.assertEqual(result.out.strip(), '200000')
+
+    def test_redirections(self):
+        with tempfile.TemporaryFile() as stdin, tempfile.TemporaryFile() as stdout:
+            stdin.write(b'foo\nbar\n')
+            stdin.seek(0)
+            result = Executor().pipe(('grep', 'foo'), ('cat',), stdin=stdin, stdout=stdout, count=True)
+            stdout.seek(0)
+            self.assertEqual(stdout.read(), b'foo\n')
+        self.assertIsNone(result.out, 'redirected output should not be captured')
+        self.assertEqual(result.byte_counts, [4, 4])
+
+    def test_byte_counts_two_stages(self):
+        # The stages must not inherit the relays' pipes, which are inheritable on python 2
+        result = Executor().pipe(('seq', '5'), ('cat',), count=True)
+        self.assertEqual(result.out, '1\n2\n3\n4\n5\n')
+        self.assertEqual(result.byte_counts, [10, 10])
+
+    @unittest.skipUnless(hasattr(subprocess, 'DEVNULL'), 'subprocess.DEVNULL requires python 3')
+    def test_devnull(self):
+        result = Executor().pipe(('seq', '10'), ('tail', '-2'), stdout=subprocess.DEVNULL, count=True)
+        self.assertEqual(result.byte_counts, [21, 5])
+
+    def test_devnull_file(self):
+        with open(os.devnull, 'wb') as devnull:
+            result = Executor().pipe(('seq', '10'), ('tail', '-2'), stdout=devnull, count=True)
+        self.assertEqual(result.byte_counts, [21, 5])
+
+    def test_byte_counts_without_splice(self):
+        # The relays copy the data through a buffer where os.splice is not available, as on FreeBSD
+        saved, executors._HAS_SPLICE = executors._HAS_SPLICE, False
+        try:
+            result = Executor().pipe(('seq', '200000'), ('gzip',), ('gunzip',), ('wc', '-l'), count=True)
+        finally:
+            executors._HAS_SPLICE = saved
+        self.assertEqual(result.byte_counts[0], result.byte_counts[2])
+        self.assertEqual(result.out.strip(), '200000')
+
+    def test_append_redirection(self):
+        # Files opened for appending can not be spliced to
+        with tempfile.NamedTemporaryFile() as target:
+            with open(target.name, 'ab') as stdout:
+                result = Executor().pipe(('seq', '3'), ('cat',), stdout=stdout, count=True)
+            self.assertEqual(target.read(), b'1\n2\n3\n')
+        self.assertEqual(result.byte_counts, [6, 6])
+
+    def test_raw(self):
+        result = Executor().pipe(('printf', 'foo'), ('cat',), raw=True)
+        self.assertEqual(result.out, RawOutput(b'foo'))
+
+    def test_prefix_args(self):
+        result = Executor(prefix_args=('env',)).pipe(('echo', 'foo'), ('cat',))
+        self.assertEqual(result.out, 'foo\n')
+
+    def test_timeout(self):
+        start = time.time()
+        with self.assertRaises(ExecutionTimeoutError) as context_manager:
+            Executor().pipe(('sh', '-c', 'echo foo; sleep 10'), ('cat',), count=True, timeout=0.3)
+        self.assertLess(time.time() - start, 1, 'the stages should have been terminated')
+        self.assertEqual(context_manager.exception.out, b'foo\n', 'the partial output should be kept')
+
+    def test_binary_not_found(self):
+        with self.assertRaises(OSError):
+            Executor().pipe(('seq', '10'), ('i-do-not-exist',))
+
+
+class TimeoutTestCase(unittest.TestCase):
+
+    def test_within_timeout(self):
+        self.assertEqual(Executor()('echo', 'foo', timeout=5), (0, 'foo\n', ''))
+
+    def test_timeout(self):
+        start = time.time()
+        with self.assertRaises(ExecutionTimeoutError) as context_manager:
+            Executor()('sh', '-c', 'echo foo; sleep 10', timeout=0.2)
+        self.assertLess(time.time() - start, 1, 'the command should have been terminated')
+        self.assertEqual(context_manager.exception.out, b'foo\n', 'the partial output should be kept')
+        self.assertEqual(context_manager.exception.message, "`sh -c echo foo; sleep 10` did not complete within 0.2s.")
+
+    def test_default_timeout(self):
+        executor = Executor()
+        executor.timeout = 0.2
+        with self.assertRaises(ExecutionTimeoutError):
+            executor('sleep', '10')
+
+    def test_kill_after_grace(self):
+        executor = Executor()
+        executor.kill_grace = 0.2
+        start = time.time()
+        with self.assertRaises(ExecutionTimeoutError):
+            executor('sh', '-c', 'trap "" TERM; sleep 10', timeout=0.2)
+        self.assertLess(time.time() - start, 1, 'the command should have been killed')
+
+    def test_session_timeout(self):
+        with SessionExecutor() as executor:
+            with self.assertRaises(ExecutionTimeoutError):
+                executor('sleep', '10', timeout=0.2)
+            self.assertFalse(executor.is_open, 'the session should have been terminated')
+            self.assertEqual(executor('echo', 'foo'), (0, 'foo\n', ''), 'a new session should be started')
+
+    def test_timeout_without_sessions(self):
+        # Python 2's subprocess supports neither sessions nor timeouts, and has no posix_spawn: overdue commands are still
+        # terminated, along with the processes they started
+        saved = executors._HAS_NEW_SESSION, executors._HAS_COMMUNICATE_TIMEOUT, Executor.use_posix_spawn
+        executors._HAS_NEW_SESSION = executors._HAS_COMMUNICATE_TIMEOUT = Executor.use_posix_spawn = False
+        try:
+            start = time.time()
+            with self.assertRaises(ExecutionTimeoutError) as context_manager:
+                Executor()('sh', '-c', 'echo foo; exec sleep 10', timeout=0.2)
+            self.assertLess(time.time() - start, 1, 'the command should have been terminated')
+            self.assertEqual(context_manager.exception.out, b'foo\n', 'the partial output should be kept')
+            start = time.time()
+            with self.assertRaises(ExecutionTimeoutError):
+                Executor().pipe(('sh', '-c', 'echo foo; sleep 10'), ('cat',), count=True, timeout=0.3)
+            self.assertLess(time.time() - start, 1, 'the stages should have been terminated with their children')
+            self.assertEqual(Executor()('cat', stdin=b'bar', timeout=5), (0, 'bar', ''))
+            with SessionExecutor() as executor:
+                self.assertEqual(executor('echo', 'foo'), (0, 'foo\n', ''))
+                with self.assertRaises(ExecutionTimeoutError):
+                    executor('sleep', '10', timeout=0.2)
+                self.assertFalse(executor.is_open, 'the session should have been terminated')
+        finally:
+            executors._HAS_NEW_SESSION, executors._HAS_COMMUNICATE_TIMEOUT, Executor.use_posix_spawn = saved
+
+    def test_batch_partial_results(self):
+        with Executor().batch(timeout=0.5) as batch:
+            batch.add('echo', 'foo')
+            batch.add('sleep', '10')
+            batch.add('echo', 'bar')
+        self.assertTrue(batch.timed_out)
+        self.assertEqual(batch.results, [(0, 'foo\n', ''), None, None])
+
+    def test_map_partial_results(self):
+        start = time.time()
+        results = list(Executor().map([('echo', 'foo'), ('sleep', '10'), ('echo', 'bar'), ('sleep', '10')],
+                                      max_workers=3, timeout=0.5))
+        self.assertLess(time.time() - start, 1.5, 'overdue commands should have been terminated')
+        self.assertEqual(results, [(0, 'foo\n', ''), None, (0, 'bar\n', ''), None])
+
+    def test_map_partial_results_as_completed(self):
+        executor = Executor()
+        executor.process_limit = threading.BoundedSemaphore(2)
+        results = list(executor.map([('sleep', '10'), ('echo', 'foo')], ordered=False, timeout=0.5))
+        self.assertEqual(results, [(1, (0, 'foo\n', ''))])
+        self.assertTrue(executor.process_limit.acquire(False) and executor.process_limit.acquire(False),
+                        'slots should have been released')
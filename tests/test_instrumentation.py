@@ -0,0 +1,148 @@
+from __future__ import absolute_import, print_function, unicode_literals
+
+import sys
+import unittest
+
+from pybsd import EzjailAdmin, Executor, Master
+from pybsd.instrumentation import Histogram, Instrumentation
+from pybsd.transports import LocalTransport
+
+from .test_executors import TestExecutor
+
+
+class HistogramTestCase(unittest.TestCase):
+    def test_empty(self):
+        histogram = Histogram()
+        self.assertIsNone(histogram.percentile(50))
+        self.assertEqual(histogram.summary(), {'count': 0, 'mean': None, 'min': None, 'max': None,
+                                               'p50': None, 'p90': None, 'p99': None})
+
+    def test_percentiles_within_precision(self):
+        histogram = Histogram()
+        for value in range(1, 10001):
+            histogram.add(value / 1000.0)
+        error = 2 ** (1 / 16.0) - 1
+        for q in (1, 50, 90, 99):
+            expected = q * 10 / 100.0
+            self.assertLessEqual(abs(histogram.percentile(q) - expected) / expected, error)
+        self.assertEqual(histogram.percentile(100), 10.0)
+        self.assertEqual(histogram.min, 0.001)
+        self.assertAlmostEqual(histogram.mean, 5.0005)
+
+    def test_zero(self):
+        histogram = Histogram()
+        histogram.add(0)
+        self.assertEqual(histogram.percentile(50), 0)
+
+
+class InstrumentedExecutorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.instrumentation = Instrumentation()
+        self.pre, self.post = [], []
+        self.instrumentation.add_hooks(pre=lambda sample: self.pre.append((sample.key, sample.wall_time)),
+                                       post=self.post.append)
+        self.execute = Executor()
+        self.execute.instrumentation = self.instrumentation
+
+    def test_call(self):
+        self.execute('cat', stdin=b'foo')
+        self.assertEqual(self.pre, [(('localhost', 'cat', None), None)])
+        sample, = self.post
+        self.assertEqual((sample.bytes_in, sample.bytes_out, sample.rc), (3, 3, 0))
+        self.assertGreater(sample.spawn_time, 0)
+        self.assertGreaterEqual(sample.wall_time, sample.spawn_time)
+
+    def test_default_tag(self):
+        self.execute('/bin/sh', '-c', 'exit 2')
+        self.execute('/bin/sh', '-c', 'exit 0')
+        stats = self.instrumentation.stats(('localhost', 'sh', '-c'))
+        self.assertEqual(stats['calls'], 2)
+        self.assertEqual(stats['rcs'], {0: 1, 2: 1})
+        self.assertEqual(stats['wall_time']['count'], 2)
+
+    def test_remote_tag(self):
+        execute = Executor(instance='box01', transport=LocalTransport('box01'))
+        execute.instrumentation = self.instrumentation
+        execute('echo', 'foo', tag=('box01', 'echo', 'foo'))
+        self.assertEqual(list(self.instrumentation.stats()), [('box01', 'echo', 'foo')])
+
+    def test_error(self):
+        with self.assertRaises(OSError):
+            self.execute('/nonexistent/binary')
+        sample, = self.post
+        self.assertIsNone(sample.rc)
+        self.assertIsInstance(sample.error, OSError)
+        self.assertEqual(self.instrumentation.stats(sample.key)['rcs'], {None: 1})
+
+    def test_failing_hook(self):
+        def hook(sample):
+            raise ValueError
+        self.instrumentation.add_hooks(pre=hook, post=hook)
+        self.assertEqual(self.execute('echo', 'foo'), (0, 'foo\n', ''))
+        self.assertEqual(len(self.post), 1)
+
+    def test_map(self):
+        list(self.execute.map([('echo', 'foo'), ('sh', '-c', 'exit 1')]))
+        self.assertEqual(sorted(sample.key for sample in self.post), [('localhost', 'echo', 'foo'),
+                                                                      ('localhost', 'sh', '-c')])
+        for sample in self.post:
+            self.assertGreater(sample.spawn_time, 0)
+        self.assertEqual(self.instrumentation.stats(('localhost', 'sh', '-c'))['rcs'], {1: 1})
+
+    def test_reset(self):
+        self.execute('true')
+        self.instrumentation.reset()
+        self.assertEqual(self.instrumentation.stats(), {})
+        self.assertEqual(self.instrumentation.stats(('localhost', 'true', None))['calls'], 0)
+
+    def test_not_instrumented(self):
+        Executor()('true')
+        self.assertEqual(self.post, [])
+
+
+class InstrumentedInvokeTestCase(unittest.TestCase):
+    def test_invoke_tag(self):
+        tags = []
+
+        class InstrumentedExecutor(TestExecutor):
+            instrumentation = Instrumentation()
+
+            def __call__(self, *args, **kwargs):
+                tags.append(kwargs.get('tag'))
+                return (0, '', '')
+
+        class TestMaster(Master):
+            ExecutorClass = InstrumentedExecutor
+
+        master = TestMaster(name='master', hostname='master.foo.bar', ext_if=('re0', ['8.8.8.8/24']))
+        EzjailAdmin(master).invoke('list')
+        self.assertEqual(tags, [('master', 'ezjail-admin', 'list')])
+
+    def test_invoke_untagged_when_not_instrumented(self):
+        calls = []
+
+        class RecordingTestExecutor(TestExecutor):
+            def __call__(self, *args, **kwargs):
+                calls.append(kwargs)
+                return (0, '', '')
+
+        class TestMaster(Master):
+            ExecutorClass = RecordingTestExecutor
+
+        master = TestMaster(name='master', hostname='master.foo.bar', ext_if=('re0', ['8.8.8.8/24']))
+        EzjailAdmin(master).invoke('list')
+        self.assertEqual(calls, [{}])
+
+
+@unittest.skipIf(sys.version_info < (3, 7), 'requires python >= 3.7')
+class InstrumentedAsyncExecutorTestCase(unittest.TestCase):
+    def test_call(self):
+        import asyncio
+        from pybsd.aio import AsyncExecutor
+        instrumentation = Instrumentation()
+        execute = AsyncExecutor()
+        execute.instrumentation = instrumentation
+        asyncio.run(execute('cat', stdin=b'foo', tag=('box01', 'cat', None)))
+        stats = instrumentation.stats(('box01', 'cat', None))
+        self.assertEqual((stats['calls'], stats['bytes_in'], stats['bytes_out']), (1, 3, 3))
+        self.assertEqual(stats['spawn_time']['count'], 1)
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, print_function, unicode_literals
+
+import threading
+import time
+import unittest
+
+from pybsd import DependencyCycleError, Jail, Master
+from pybsd.orchestrator import Orchestrator
+
+from .test_executors import TestExecutor
+
+
+class OrchestratedMaster(Master):
+    ExecutorClass = TestExecutor
+
+
+class RecordingEzjailAdmin(object):
+    # Records the invocations of the bulk actions, and how many ran at once
+    def __init__(self, log, lock, delay=0.05, failing=(), broken=False):
+        self.log = log
+        self.lock = lock
+        self.delay = delay
+        self.failing = failing
+        self.broken = broken
+        self.running = 0
+        self.max_running = 0
+
+    def _many(self, action, hostnames):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            self.log.append((action, sorted(hostnames)))
+        time.sleep(self.delay)
+        with self.lock:
+            self.running -= 1
+        if self.broken:
+            raise OSError('connection lost')
+        return dict((hostname, hostname not in self.failing) for hostname in hostnames)
+
+    def start_many(self, hostnames):
+        return self._many('start', hostnames)
+
+    def stop_many(self, hostnames):
+        return self._many('stop', hostnames)
+
+    def restart_many(self, hostnames):
+        return self._many('restart', hostnames)
+
+
+class OrchestratorTestCase(unittest.TestCase):
+    params = {
+        'ext_if': ('re0', ['8.8.8.8/24']),
+        'j_if': ('re0', ['10.0.2.0/24']),
+        'jlo_if': ('lo1', ['127.0.2.0/24']),
+    }
+
+    def setUp(self):
+        self.log = []
+        self.lock = threading.Lock()
+        self.masters = []
+        for name in ('system', 'other'):
+            master = OrchestratedMaster(name=name, hostname='{}.foo.bar'.format(name), **self.params)
+            master.ezjail_admin = RecordingEzjailAdmin(self.log, self.lock)
+            self.masters.append(master)
+        self.jails = []
+        uid = 0
+        for master in self.masters:
+            for jail_class, count in (('dns', 1), ('db', 2), ('web', 4)):
+                for index in range(count):
+                    uid += 1
+                    self.jails.append(Jail(name='{}{}'.format(jail_class, index), uid=uid, master=master,
+                                           hostname='{}{}.{}.foo.bar'.format(jail_class, index, master.name),
+                                           jail_class=jail_class))
+        self.orchestrator = Orchestrator(dependencies={'web': ['db'], 'db': ['dns', 'ntp']}, max_workers=8,
+                                         per_master=2)
+
+    def classes(self, log):
+        return [sorted(set(hostname.split('.')[0].rstrip('0123456789') for hostname in hostnames))
+                for _, hostnames in log]
+
+    def test_waves(self):
+        waves = self.orchestrator.waves(self.jails)
+        self.assertEqual([classes for classes, _ in waves], [['dns'], ['db'], ['web']])
+        self.assertEqual([len(jails) for _, jails in waves], [2, 4, 8])
+        self.assertEqual([classes for classes, _ in self.orchestrator.waves(self.jails, reverse=True)],
+                         [['web'], ['db'], ['dns']])
+
+    def test_no_dependencies(self):
+        waves = Orchestrator().waves(self.jails)
+        self.assertEqual(len(waves), 1)
+        self.assertEqual(waves[0][0], ['db', 'dns', 'web'])
+
+    def test_missing_middle_class(self):
+        orchestrator = Orchestrator(dependencies={'web': ['app'], 'app': ['db']})
+        jails = [jail for jail in self.jails if jail.jail_class in ('web', 'db')]
+        self.assertEqual([classes for classes, _ in orchestrator.waves(jails)], [['db'], ['web']])
+
+    def test_cycle_classes(self):
+        orchestrator = Orchestrator(dependencies={'web': ['app'], 'app': ['cache'], 'cache': ['app'], 'db': ['web']})
+        with self.assertRaises(DependencyCycleError) as context_manager:
+            orchestrator.waves(self.jails)
+        self.assertEqual(context_manager.exception.message, 'Jail classes `[app, cache]` depend on each other.')
+
+    def test_cycle(self):
+        orchestrator = Orchestrator(dependencies={'web': ['db'], 'db': ['web'], 'dns': ['dns']})
+        with self.assertRaises(DependencyCycleError) as context_manager:
+            orchestrator.start(self.jails)
+        self.assertEqual(context_manager.exception.message, 'Jail classes `[db, web]` depend on each other.')
+        self.assertEqual(self.log, [])
+
+    def test_start(self):
+        report = self.orchestrator.start(self.jails)
+        self.assertTrue(report.succeeded)
+        self.assertEqual(report.results, dict((jail, True) for jail in self.jails))
+        self.assertEqual([wave.classes for wave in report.waves], [['dns'], ['db'], ['web']])
+        self.assertEqual(self.classes(self.log), [['dns']] * 2 + [['db']] * 4 + [['web']] * 4)
+        self.assertEqual(set(action for action, _ in self.log), {'start'})
+
+    def test_stop(self):
+        report = self.orchestrator.stop(self.jails)
+        self.assertTrue(report.succeeded)
+        self.assertEqual([wave.classes for wave in report.waves], [['web'], ['db'], ['dns']])
+        self.assertEqual(self.classes(self.log), [['web']] * 4 + [['db']] * 4 + [['dns']] * 2)
+
+    def test_restart(self):
+        report = self.orchestrator.restart(self.jails)
+        self.assertEqual([wave.classes for wave in report.waves], [['dns'], ['db'], ['web']])
+        self.assertEqual(set(action for action, _ in self.log), {'restart'})
+
+    def test_unknown_action(self):
+        with self.assertRaises(ValueError):
+            self.orchestrator.run('destroy', self.jails)
+
+    def test_per_master(self):
+        self.orchestrator.per_master = 1
+        self.orchestrator.start(self.jails)
+        self.assertEqual([len(hostnames) for _, hostnames in self.log], [1, 1, 2, 2, 4, 4])
+        for master in self.masters:
+            self.assertEqual(master.ezjail_admin.max_running, 1)
+
+    def test_max_workers(self):
+        self.orchestrator.max_workers = 1
+        report = self.orchestrator.start(self.jails)
+        self.assertTrue(report.succeeded)
+        self.assertEqual(max(master.ezjail_admin.max_running for master in self.masters), 1)
+
+    def test_critical_path(self):
+        self.masters[1].ezjail_admin.delay = 0.2
+        report = self.orchestrator.start(self.jails)
+        for wave in report.waves:
+            master, duration = wave.critical_path
+            self.assertIs(master, self.masters[1])
+            self.assertGreaterEqual(duration, 0.2)
+            self.assertLess(wave.durations[self.masters[0]], duration)
+            self.assertGreaterEqual(wave.elapsed, duration)
+        self.assertAlmostEqual(report.critical_path, sum(wave.critical_path[1] for wave in report.waves))
+        self.assertGreaterEqual(report.elapsed, report.critical_path)
+
+    def test_failure_stops(self):
+        self.masters[0].ezjail_admin.failing = ('db1.system.foo.bar',)
+        report = self.orchestrator.start(self.jails)
+        self.assertFalse(report.succeeded)
+        self.assertEqual([wave.classes for wave in report.waves], [['dns'], ['db']])
+        self.assertEqual(sorted(jail.hostname for jail, result in report.results.items() if not result),
+                         ['db1.system.foo.bar'])
+        self.assertEqual(sorted(jail.jail_class for jail in report.skipped), ['web'] * 8)
+
+    def test_failure_goes_on(self):
+        self.orchestrator.stop_on_error = False
+        self.masters[0].ezjail_admin.failing = ('db1.system.foo.bar',)
+        report = self.orchestrator.start(self.jails)
+        self.assertFalse(report.succeeded)
+        self.assertEqual(len(report.waves), 3)
+        self.assertEqual(report.skipped, [])
+
+    def test_broken_master(self):
+        self.orchestrator.stop_on_error = False
+        self.masters[1].ezjail_admin.broken = True
+        report = self.orchestrator.start(self.jails)
+        for wave in report.waves:
+            self.assertIsInstance(wave.errors[self.masters[1]], OSError)
+            self.assertNotIn(self.masters[0], wave.errors)
+        self.assertEqual(set(jail.master for jail, result in report.results.items() if not result), {self.masters[1]})
+
+    def test_detached(self):
+        jail = Jail(name='lost', uid=99, hostname='lost.foo.bar', jail_class='dns')
+        report = self.orchestrator.start(self.jails + [jail])
+        self.assertFalse(report.results[jail])
+        self.assertNotIn('lost.foo.bar', [hostname for _, hostnames in self.log for hostname in hostnames])
+        self.assertEqual(len(report.waves), 1)
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, print_function, unicode_literals
+
+import threading
+import time
+import unittest
+
+from pybsd import Master, SubprocessError
+from pybsd.poller import APPEARED, DISAPPEARED, STARTED, STOPPED, Poller
+
+from .test_executors import CountingTestExecutor, TestExecutor
+
+HEADER = ('STA JID  IP              Hostname                       Root Directory\n'
+          '--- ---- --------------- ------------------------------ ------------------------\n')
+
+
+def listing(*jails):
+    return (0, HEADER + ''.join('{:<3} {:<4} 10.0.1.{}/24    {:<30} /usr/jails/{}\n'.format(status, jid, i, name, name)
+                                for i, (status, jid, name) in enumerate(jails)), '')
+
+
+class ListingsExecutor(CountingTestExecutor):
+    # Returns its listings one after the other, then the last one forever
+    listings = [listing(('ZR', '1', 'web'), ('ZS', 'N/A', 'db'), ('ZR', '3', 'mail')),
+                listing(('ZS', 'N/A', 'web'), ('ZR', '2', 'db'), ('ZR', '4', 'dns'))]
+
+    def __call__(self, binary, subcommand, *cmd_args, **kwargs):
+        super(ListingsExecutor, self).__call__(binary, subcommand, *cmd_args, **kwargs)
+        return self.listings[min(self.calls, len(self.listings)) - 1]
+
+
+class FailingExecutor(TestExecutor):
+    ezjail_admin_list_output = (1, '', 'ezjail-admin: error\n')
+
+
+class PollerTestCase(unittest.TestCase):
+    params = {
+        'name': 'system',
+        'hostname': 'system.foo.bar',
+        'ext_if': ('re0', ['8.8.8.8/24']),
+    }
+
+    def make_master(self, executor_class=ListingsExecutor, **params):
+
+        class TestMaster(Master):
+            ExecutorClass = executor_class
+
+        return TestMaster(**dict(self.params, **params))
+
+    def setUp(self):
+        self.master = self.make_master()
+        self.poller = Poller(interval=60)
+        self.poller.register(self.master)
+        self.events = []
+        self.poller.subscribe(self.events.append)
+
+    def test_baseline(self):
+        self.assertEqual(self.poller.poll(self.master), [])
+        self.assertEqual(sorted(self.poller.snapshot(self.master)), ['db', 'mail', 'web'])
+
+    def test_events(self):
+        self.poller.poll(self.master)
+        events = self.poller.poll(self.master)
+        self.assertEqual([(event.kind, event.name) for event in events],
+                         [(STARTED, 'db'), (APPEARED, 'dns'), (DISAPPEARED, 'mail'), (STOPPED, 'web')])
+        self.assertEqual(events, self.events)
+        self.assertEqual(events[0].previous.status, 'ZS')
+        self.assertEqual(events[0].current.jid, '2')
+        self.assertIs(events[0].master, self.master)
+
+    def test_no_changes(self):
+        self.poller.poll(self.master)
+        self.poller.poll(self.master)
+        self.assertEqual(self.poller.poll(self.master), [])
+
+    def test_master_refreshed(self):
+        self.poller.poll(self.master)
+        self.poller.poll(self.master)
+        self.assertIs(self.master.jail_snapshot, self.poller.snapshot(self.master))
+
+    def test_failing_subscriber(self):
+        def fail(event):
+            raise ValueError(event)
+
+        self.poller.subscribers.insert(0, fail)
+        self.poller.poll(self.master)
+        self.assertEqual(len(self.poller.poll(self.master)), 4)
+        self.assertEqual(len(self.events), 4)
+
+    def test_unsubscribe(self):
+        self.poller.unsubscribe(self.events.append)
+        self.poller.poll(self.master)
+        self.poller.poll(self.master)
+        self.assertEqual(self.events, [])
+
+    def test_failing_poll(self):
+        master = self.make_master(FailingExecutor)
+        self.poller.register(master)
+        with self.assertRaises(SubprocessError):
+            self.poller.poll(master)
+        self.assertIsNone(self.poller.snapshot(master))
+
+    def test_unregister(self):
+        self.poller.unregister(self.master)
+        self.assertEqual(self.poller.masters, [])
+        with self.assertRaises(KeyError):
+            self.poller.poll(self.master)
+
+    def test_spread(self):
+        poller = Poller(interval=60)
+        start = time.time()
+        for i in range(20):
+            poller.register(self.make_master(name='system{}'.format(i), hostname=None), interval=30 if i % 2 else None)
+        dues = [(due, registration.interval) for due, _, registration in poller._schedule]
+        self.assertTrue(all(start <= due <= start + interval + 1 for due, interval in dues))
+        self.assertEqual(len(set(due for due, _ in dues)), 20)
+
+    def test_background(self):
+        master = self.make_master(name='fast')
+        self.poller.register(master, interval=0.02, concurrency=2)
+        received = threading.Event()
+        self.poller.subscribe(lambda event: received.set())
+        with self.poller:
+            self.assertTrue(received.wait(5))
+        self.assertGreaterEqual(master.execute.calls, 2)
+        self.assertEqual(self.master.execute.calls, 0)
+        self.assertEqual(set(event.master for event in self.events), {master})
+
+    def test_background_failures(self):
+        master = self.make_master(FailingExecutor, name='failing')
+        self.poller.register(master, interval=0.01)
+        with self.poller:
+            time.sleep(0.1)
+        self.assertIsNone(self.poller.snapshot(master))
+
+    def test_concurrency(self):
+        registration = self.poller._registrations[self.master]
+        registration.in_flight = registration.concurrency
+        self.poller._schedule = [(0, 0, registration)]
+        self.poller.start()
+        time.sleep(0.05)
+        self.poller.stop()
+        self.assertEqual(self.master.execute.calls, 0, 'a master must not be polled beyond its concurrency')
@@ -0,0 +1,142 @@
+from __future__ import absolute_import, print_function, unicode_literals
+
+import os
+import signal
+import subprocess
+import tempfile
+import unittest
+
+from pybsd.executors import Executor, SessionExecutor
+from pybsd.processes import HAS_POSIX_SPAWN, SpawnedProcess
+
+PIPES = dict(stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+@unittest.skipUnless(HAS_POSIX_SPAWN, 'os.posix_spawnp is not available')
+class SpawnedProcessTestCase(unittest.TestCase):
+
+    def test_communicate(self):
+        proc = SpawnedProcess(['sh', '-c', 'cat; echo bar >&2; exit 3'], **PIPES)
+        self.assertEqual(proc.communicate(b'foo'), (b'foo', b'bar\n'))
+        self.assertEqual(proc.returncode, 3)
+
+    def test_communicate_large_input(self):
+        data = b'x' * (1024 * 1024)
+        proc = SpawnedProcess(['cat'], **PIPES)
+        self.assertEqual(proc.communicate(data), (data, b''))
+
+    def test_communicate_without_input(self):
+        proc = SpawnedProcess(['cat'], **PIPES)
+        self.assertEqual(proc.communicate(), (b'', b''))
+        self.assertEqual(proc.returncode, 0)
+
+    def test_communicate_timeout(self):
+        proc = SpawnedProcess(['sh', '-c', 'echo foo; exec sleep 10'], **PIPES)
+        with self.assertRaises(subprocess.TimeoutExpired) as context_manager:
+            proc.communicate(timeout=0.2)
+        self.assertEqual(context_manager.exception.output, b'foo\n')
+        proc.kill()
+        self.assertEqual(proc.communicate(), (b'foo\n', b''), 'the output read before the timeout should be kept')
+
+    def test_sigpipe(self):
+        reader, writer = os.pipe()
+        proc = SpawnedProcess(['yes'], stdout=writer)
+        os.close(writer)
+        os.close(reader)
+        self.assertEqual(proc.wait(), -signal.SIGPIPE, 'SIGPIPE should have its default disposition')
+
+    def test_unpiped_streams(self):
+        proc = SpawnedProcess(['echo', 'foo'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        self.assertIsNone(proc.stdin)
+        self.assertEqual(proc.communicate(), (b'foo\n', None))
+
+    def test_file_streams(self):
+        with tempfile.TemporaryFile() as stdin, tempfile.TemporaryFile() as stderr:
+            stdin.write(b'foo')
+            stdin.seek(0)
+            proc = SpawnedProcess(['sh', '-c', 'cat >&2'], stdin=stdin, stdout=subprocess.PIPE, stderr=stderr.fileno())
+            self.assertEqual(proc.communicate(), (b'', None))
+            stderr.seek(0)
+            self.assertEqual(stderr.read(), b'foo')
+
+    def test_readline(self):
+        proc = SpawnedProcess(['printf', 'a\\nb\\n'], stdout=subprocess.PIPE)
+        self.assertEqual(proc.stdout.readline(), b'a\n')
+        self.assertEqual(proc.stdout.readline(), b'b\n')
+        proc.stdout.close()
+        self.assertEqual(proc.wait(), 0)
+
+    def test_poll_and_kill(self):
+        proc = SpawnedProcess(['sleep', '10'])
+        self.assertIsNone(proc.poll())
+        proc.kill()
+        self.assertEqual(proc.wait(), -signal.SIGKILL)
+        self.assertEqual(proc.poll(), -signal.SIGKILL)
+        proc.terminate()  # no-op once the process exited
+
+    def test_descriptors_are_not_inherited(self):
+        read_fd, write_fd = os.pipe()
+        try:
+            proc = SpawnedProcess(['sh', '-c', 'ls /dev/fd/{}'.format(read_fd)], stdout=subprocess.PIPE,
+                                  stderr=subprocess.PIPE)
+            proc.communicate()
+            self.assertNotEqual(proc.returncode, 0)
+        finally:
+            os.close(read_fd)
+            os.close(write_fd)
+
+    def test_inheritable_descriptors_are_closed(self):
+        read_fd, write_fd = os.pipe()
+        os.set_inheritable(read_fd, True)
+        try:
+            proc = SpawnedProcess(['sh', '-c', 'ls /dev/fd/{}'.format(read_fd)], stdout=subprocess.PIPE,
+                                  stderr=subprocess.PIPE)
+            proc.communicate()
+            self.assertNotEqual(proc.returncode, 0, 'inheritable descriptors should be closed')
+            proc = SpawnedProcess(['sh', '-c', 'ls /dev/fd/{}'.format(read_fd)], stdout=subprocess.PIPE,
+                                  stderr=subprocess.PIPE, close_fds=False)
+            proc.communicate()
+            self.assertEqual(proc.returncode, 0, 'inheritable descriptors should be kept without close_fds')
+        finally:
+            os.close(read_fd)
+            os.close(write_fd)
+
+    def test_stream_descriptor_is_closed(self):
+        read_fd, write_fd = os.pipe()
+        os.set_inheritable(write_fd, True)
+        proc = SpawnedProcess(['sh', '-c', 'echo foo; ls /dev/fd/{}'.format(write_fd)], stdout=write_fd,
+                              stderr=subprocess.DEVNULL)
+        os.close(write_fd)
+        with os.fdopen(read_fd, 'rb') as reader:
+            self.assertEqual(reader.read(), b'foo\n', 'the descriptor stdout was duplicated from should be closed')
+        self.assertNotEqual(proc.wait(), 0)
+
+    def test_binary_not_found(self):
+        with self.assertRaises(OSError):
+            SpawnedProcess(['/nonexistent/binary'], **PIPES)
+
+
+class LauncherTestCase(unittest.TestCase):
+    def setUp(self):
+        self.executors = [type(str('PopenExecutor'), (Executor,), {'use_posix_spawn': False})()]
+        if HAS_POSIX_SPAWN:
+            self.executors.append(type(str('SpawnExecutor'), (Executor,), {'use_posix_spawn': True})())
+
+    def test_call(self):
+        for execute in self.executors:
+            self.assertEqual(execute('cat', stdin=b'foo'), (0, 'foo', ''))
+
+    def test_stream(self):
+        for execute in self.executors:
+            result = execute.stream('printf', 'a\\nb\\n')
+            self.assertEqual(list(result), ['a', 'b'])
+            self.assertEqual(result.rc, 0)
+
+    def test_map(self):
+        for execute in self.executors:
+            self.assertEqual([r[0] for r in execute.map([('true',), ('false',)])], [0, 1])
+
+    def test_session(self):
+        for execute in self.executors:
+            with type(str('Session'), (SessionExecutor,), {'use_posix_spawn': execute.use_posix_spawn})() as session:
+                self.assertEqual(session('echo', 'foo'), (0, 'foo\n', ''))
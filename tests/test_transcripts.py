@@ -0,0 +1,145 @@
+from __future__ import absolute_import, print_function, unicode_literals
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from pybsd import EzjailAdmin, Master, TranscriptMissError
+from pybsd.transcripts import RecordingExecutor, ReplayExecutor, Transcript
+
+
+class TranscriptTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'transcript.jsonl')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_file_roundtrip(self):
+        with Transcript(self.path) as transcript:
+            transcript.append('box01', ('cat',), b'foo', 0, b'foo', b'')
+            transcript.append('box01', ('cat',), b'\xff', 1, b'\xff\xfe', b'err')
+        transcript = Transcript(self.path)
+        self.assertEqual(len(transcript), 2)
+        self.assertEqual(transcript.lookup('box01', ('cat',), b'foo'), (0, b'foo', b''))
+        self.assertEqual(transcript.lookup('box01', ('cat',), b'\xff'), (1, b'\xff\xfe', b'err'))
+
+    def test_pipeline_file_roundtrip(self):
+        with Transcript(self.path) as transcript:
+            transcript.append('box01', ('seq', '3', '|', 'wc', '-l'), None, [0, 0], b'3\n', [b'', b'\xff'], [6, 2])
+        self.assertEqual(Transcript(self.path).lookup('box01', ('seq', '3', '|', 'wc', '-l')),
+                         ([0, 0], b'3\n', [b'', b'\xff'], [6, 2]))
+
+    def test_binary_is_base64_encoded(self):
+        with Transcript(self.path) as transcript:
+            transcript.append('box01', ('cat',), None, 0, b'\xff', b'')
+        with open(self.path) as f:
+            entry = json.loads(f.read())
+        self.assertEqual(entry['out'], {'base64': '/w=='})
+        self.assertIsNone(entry['stdin'])
+
+    def test_appends_to_existing_file(self):
+        with Transcript(self.path) as transcript:
+            transcript.append('box01', ('uname',), None, 0, b'FreeBSD\n', b'')
+        with Transcript(self.path) as transcript:
+            transcript.append('box02', ('uname',), None, 0, b'FreeBSD\n', b'')
+        self.assertEqual(len(Transcript(self.path)), 2)
+
+    def test_results_served_in_order_then_last_repeated(self):
+        transcript = Transcript()
+        transcript.append('box01', ('date',), None, 0, b'1', b'')
+        transcript.append('box01', ('date',), None, 0, b'2', b'')
+        self.assertEqual([transcript.lookup('box01', ('date',))[1] for _ in range(3)], [b'1', b'2', b'2'])
+        transcript.rewind()
+        self.assertEqual(transcript.lookup('box01', ('date',))[1], b'1')
+
+    def test_miss(self):
+        transcript = Transcript()
+        transcript.append('box01', ('date',), None, 0, b'1', b'')
+        for host, args, stdin in (('box02', ('date',), None), ('box01', ('uname',), None), ('box01', ('date',), b'x')):
+            with self.assertRaises(TranscriptMissError) as context_manager:
+                transcript.lookup(host, args, stdin)
+        self.assertEqual(context_manager.exception.message, "`date` on `box01` was not recorded in the transcript.")
+
+
+class RecordReplayTestCase(unittest.TestCase):
+    def setUp(self):
+        self.transcript = Transcript()
+        record = RecordingExecutor(self.transcript)
+        self.recorded = record('sh', '-c', 'echo foo; echo bar >&2; exit 2')
+        self.recorded_stdin = record('cat', stdin=b'baz')
+        self.recorded_lines = list(record.stream('printf', 'a\\nb\\n'))
+        self.recorded_map = list(record.map([('echo', '1'), ('echo', '2')]))
+        with record.batch(stop_on_error=True) as batch:
+            batch.add('false')
+            batch.add('echo', '3')
+        self.recorded_batch = batch.results
+        self.replay = ReplayExecutor(self.transcript)
+
+    def test_recorded(self):
+        self.assertEqual(self.recorded, (2, 'foo\n', 'bar\n'))
+        self.assertEqual(self.recorded_stdin, (0, 'baz', ''))
+        self.assertEqual(self.recorded_lines, ['a', 'b'])
+        self.assertEqual(self.recorded_map, [(0, '1\n', ''), (0, '2\n', '')])
+        self.assertEqual(self.recorded_batch, [(1, '', ''), None])
+        self.assertEqual(len(self.transcript), 6)
+
+    def test_replay_call(self):
+        self.assertEqual(self.replay('sh', '-c', 'echo foo; echo bar >&2; exit 2'), self.recorded)
+        self.assertEqual(self.replay('cat', stdin=b'baz'), self.recorded_stdin)
+        self.assertEqual(self.replay('cat', stdin=b'baz', rc=0, err=b'', raw=True), b'baz')
+
+    def test_replay_stream(self):
+        lines = self.replay.stream('printf', 'a\\nb\\n')
+        self.assertEqual(list(lines), self.recorded_lines)
+        self.assertEqual((lines.rc, lines.err), (0, ''))
+
+    def test_replay_map(self):
+        self.assertEqual(list(self.replay.map([('echo', '1'), ('echo', '2')])), self.recorded_map)
+        self.assertEqual(list(self.replay.map([('echo', '2')], ordered=False)), [(0, (0, '2\n', ''))])
+
+    def test_replay_batch(self):
+        with self.replay.batch(stop_on_error=True) as batch:
+            batch.add('false')
+            batch.add('echo', '3')
+        self.assertEqual(batch.results, self.recorded_batch)
+
+    def test_replay_pipe(self):
+        transcript = Transcript(os.path.join(tempfile.mkdtemp(), 'pipe.jsonl'))
+        self.addCleanup(shutil.rmtree, os.path.dirname(transcript.path))
+        with transcript:
+            recorded = RecordingExecutor(transcript).pipe(('printf', 'foo\\nbar\\n'), ('grep', 'bar'), count=True)
+        self.assertEqual((recorded.returncodes, recorded.out, recorded.byte_counts), ([0, 0], 'bar\n', [8, 4]))
+        self.assertEqual(len(transcript), 1)
+        replayed = ReplayExecutor(Transcript(transcript.path)).pipe(('printf', 'foo\\nbar\\n'), ('grep', 'bar'), count=True)
+        self.assertEqual((replayed.returncodes, replayed.out, replayed.errs, replayed.byte_counts),
+                         (recorded.returncodes, recorded.out, recorded.errs, recorded.byte_counts))
+        self.assertEqual(replayed.args, recorded.args)
+        with self.assertRaises(TranscriptMissError):
+            self.replay.pipe(('printf', 'foo\\nbar\\n'), ('grep', 'foo'))
+
+    def test_record_spilled(self):
+        transcript = Transcript()
+        out = RecordingExecutor(transcript)('seq', '1000', spill_threshold=100)[1]
+        self.assertEqual(ReplayExecutor(transcript)('seq', '1000'), (0, out.text, ''))
+
+    def test_replay_miss(self):
+        with self.assertRaises(TranscriptMissError):
+            self.replay('echo', 'not recorded')
+
+    def test_replay_as_system_executor(self):
+        transcript = Transcript()
+        transcript.append('localhost', ('/usr/local/bin/ezjail-admin', 'list'), None, 1, b'', b'replayed\n')
+
+        class FleetReplay(ReplayExecutor):
+            pass
+        FleetReplay.transcript = transcript
+
+        class ReplayedMaster(Master):
+            ExecutorClass = FleetReplay
+
+        master = ReplayedMaster(name='master', hostname='master.foo.bar', ext_if=('re0', ['8.8.8.8/24']))
+        self.assertEqual(EzjailAdmin(master).invoke('list'), (1, '', 'replayed\n'))
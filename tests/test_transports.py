@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, print_function, unicode_literals
+
+import socket
+import threading
+import unittest
+
+from pybsd import CommandConnectionError, EzjailAdmin, Executor, Master
+from pybsd.transports import BaseTransport, LocalTransport, SSHTransport, TransportPool
+
+
+class FailingTransport(LocalTransport):
+
+    def check(self, rc, err):
+        raise socket.error('connection refused')
+
+
+class CountingTransport(LocalTransport):
+
+    def __init__(self, *args, **kwargs):
+        super(CountingTransport, self).__init__(*args, **kwargs)
+        self.lock = threading.Lock()
+        self.running = self.max_running = 0
+
+    def wrap(self, args):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        return super(CountingTransport, self).wrap(args)
+
+    def check(self, rc, err):
+        with self.lock:
+            self.running -= 1
+
+
+class TransportTestCase(unittest.TestCase):
+
+    def test_base_wrap(self):
+        with self.assertRaises(NotImplementedError):
+            BaseTransport('box01').wrap(('ls',))
+
+    def test_local_wrap(self):
+        self.assertEqual(LocalTransport('box01').wrap(('echo', 'foo bar')), ['/bin/sh', '-c', "echo 'foo bar'"])
+
+    def test_ssh_wrap(self):
+        transport = SSHTransport('box01', port=2222, control_dir='/tmp', options=('StrictHostKeyChecking=no',))
+        self.assertEqual(transport.wrap(('echo', 'foo bar')),
+                         ['ssh', '-o', 'ControlMaster=auto', '-o', 'ControlPath=/tmp/pybsd-%C', '-o', 'ControlPersist=600',
+                          '-o', 'BatchMode=yes', '-o', 'StrictHostKeyChecking=no', '-p', '2222', 'box01', '--',
+                          "echo 'foo bar'"])
+
+    def test_ssh_check(self):
+        transport = SSHTransport('box01')
+        transport.check(1, b'')
+        with self.assertRaises(socket.error):
+            transport.check(255, b'ssh: connect to host box01 port 22: Connection refused')
+
+    def test_pool(self):
+        pool = TransportPool()
+        transport = pool.get('box01', LocalTransport)
+        self.assertIs(pool.get('box01', LocalTransport), transport, 'transports should be shared per host')
+        self.assertIsNot(pool.get('box02', LocalTransport), transport, 'transports should not be shared between hosts')
+        pool.add(LocalTransport('box01'))
+        self.assertIsNot(pool.get('box01', LocalTransport), transport, 'transport should have been replaced')
+        pool.close()
+        self.assertIsNot(pool.get('box01', LocalTransport), transport, 'pool should have been emptied')
+
+
+class RemoteExecutorTestCase(unittest.TestCase):
+
+    def test_ls_output(self):
+        executor = Executor(instance='box01', transport=LocalTransport('box01'))
+        rc, out, err = executor('ls', 'tests/test_executors')
+        self.assertEqual(rc, 0, 'incorrect executor return code')
+        self.assertEqual(out, 'readme\n', 'incorrect executor stdout')
+        self.assertEqual(err, '', 'incorrect executor stderr')
+
+    def test_stream(self):
+        executor = Executor(instance='box01', transport=LocalTransport('box01'))
+        self.assertEqual(list(executor.stream('ls', 'tests/test_executors')), ['readme'], 'incorrect streamed stdout')
+
+    def test_map(self):
+        transport = CountingTransport('box01', max_channels=2)
+        executor = Executor(instance='box01', transport=transport)
+        results = list(executor.map([('echo', 'foo'), ('sleep', '0.1'), ('sleep', '0.1'), ('echo', 'bar')], max_workers=4))
+        self.assertEqual([out for rc, out, err in results], ['foo\n', '', '', 'bar\n'], 'incorrect map results')
+        self.assertEqual(transport.max_running, 2, 'channel cap not enforced')
+
+    def test_host_from_instance(self):
+        master = Master(name='master', hostname='master.foo.bar', ext_if=('re0', ['8.8.8.8/24']))
+        self.assertEqual(Executor(instance=master).host, 'master.foo.bar')
+        self.assertEqual(Executor().host, 'localhost')
+
+    def test_default_transport(self):
+        executor = Executor(instance='box01')
+        self.assertIsInstance(executor.transport, SSHTransport)
+        self.assertIs(Executor(instance='box01').transport, executor.transport, 'transports should be pooled')
+        self.assertIsNone(Executor().transport, 'local executors do not need a transport')
+
+    def test_channel_cap(self):
+        transport = CountingTransport('box01', max_channels=2)
+        executor = Executor(instance='box01', transport=transport)
+        threads = [threading.Thread(target=executor, args=('sleep', '0.1')) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(transport.max_running, 2, 'channel cap not enforced')
+
+    def test_connection_error(self):
+
+        class RemoteMaster(Master):
+            def __init__(self, *args, **kwargs):
+                super(RemoteMaster, self).__init__(*args, **kwargs)
+                self.execute = Executor(instance=self, transport=FailingTransport(self.hostname))
+
+        master = RemoteMaster(name='master', hostname='master.foo.bar', ext_if=('re0', ['8.8.8.8/24']))
+        with self.assertRaises(CommandConnectionError) as context_manager:
+            EzjailAdmin(env=master).invoke('list')
+        self.assertEqual(context_manager.exception.message,
+                         "Can't execute command: `ezjail-admin`- can't connect to `master`.")
@@ -1,11 +1,14 @@
 from __future__ import absolute_import, print_function, unicode_literals
 
+import os
+import subprocess
+import sys
 import unittest
 
 import ipaddress
 import six
 
-from pybsd.utils import safe_unicode, split_if, from_split_if
+from pybsd.utils import HAS_AIO, import_aio, safe_bytes, safe_text, safe_unicode, split_if, from_split_if
 
 
 class UtilsTestCase(unittest.TestCase):
@@ -18,6 +21,30 @@ class UtilsTestCase(unittest.TestCase):
             self.assertIsInstance(safe_unicode('abcd'), str)
             self.assertIsInstance(safe_unicode(b'abcd'), str)
 
+    def test_safe_bytes(self):
+        self.assertIsInstance(safe_bytes(u'abcd'), six.binary_type)
+        self.assertIsInstance(safe_bytes(b'abcd'), six.binary_type)
+        self.assertEqual(safe_bytes(u'\xe9'), b'\xc3\xa9')
+        self.assertIsNone(safe_bytes(None))
+
+    def test_safe_text(self):
+        self.assertEqual(safe_text(b' Error: foo\n'), 'Error: foo')
+        self.assertEqual(safe_text(['Error: foo', 'bar', '']), 'Error: foo\nbar')
+
+    def test_aio_not_imported(self):
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        self.assertEqual(subprocess.call([sys.executable, '-c', "import sys, pybsd; sys.exit('pybsd.aio' in sys.modules)"],
+                                         env=env), 0, 'importing pybsd should not import pybsd.aio')
+
+    @unittest.skipIf(HAS_AIO, 'requires python < 3.5')
+    def test_import_aio_unavailable(self):
+        with self.assertRaises(ImportError):
+            import_aio()
+
+    @unittest.skipUnless(HAS_AIO, 'requires python >= 3.5')
+    def test_import_aio(self):
+        self.assertEqual(import_aio().__name__, 'pybsd.aio')
+
     def test_split_ipv4(self):
         interface = ipaddress.ip_interface('1.2.3.4')
         self.assertListEqual(split_if(interface), [4, 32, '1', '2', '3', '4'],
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, print_function, unicode_literals
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from pybsd import Jail, Master
+from pybsd.cache import CommandCache
+from pybsd.watcher import StatBackend, Watcher, default_backend
+
+from .commands.test_ezjail_config import FIXTURE
+from .test_executors import TestExecutor
+
+
+class WatchedMaster(Master):
+    ExecutorClass = TestExecutor
+
+
+class WatcherTestCase(unittest.TestCase):
+    params = {
+        'name': 'system',
+        'hostname': 'system.foo.bar',
+        'ext_if': ('re0', ['8.8.8.8/24']),
+        'j_if': ('re0', ['10.0.2.0/24']),
+        'jlo_if': ('lo1', ['127.0.2.0/24']),
+    }
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        shutil.rmtree(self.root)
+        shutil.copytree(FIXTURE, self.root)
+        self.master = WatchedMaster(**self.params)
+        self.master.ezjail_config.root = self.root
+        self.master.state_source = self.master.ezjail_config
+        self.master.state_max_age = None
+        self.watcher = Watcher(interval=60, backend=StatBackend())
+        self.watcher.watch(self.master)
+        self.changes = []
+        self.watcher.subscribe(lambda master, hostnames: self.changes.append((master, hostnames)))
+
+    def tearDown(self):
+        self.watcher.stop()
+        shutil.rmtree(self.root)
+
+    def path(self, *path):
+        return os.path.join(self.root, *path)
+
+    def write(self, content, *path):
+        with open(self.path(*path), 'w') as f:
+            f.write(content)
+
+    def test_no_changes(self):
+        self.assertEqual(self.watcher.check(), {})
+        self.assertEqual(self.changes, [])
+
+    def test_jail_started(self):
+        snapshot = self.master.jail_snapshot
+        self.write('4\n', 'var/run/jail_db_foo_bar.id')
+        self.assertEqual(self.watcher.check(), {self.master: {'db.foo.bar'}})
+        self.assertEqual(self.changes, [(self.master, {'db.foo.bar'})])
+        self.assertIsNot(self.master.jail_snapshot, snapshot)
+        self.assertEqual(self.master.jail_snapshot['db.foo.bar'].status, 'DRN')
+        self.assertEqual(self.watcher.check(), {})
+
+    def test_jail_stopped(self):
+        self.master.jail_snapshot
+        os.remove(self.path('var/run/jail_web_foo_bar.id'))
+        self.assertEqual(self.watcher.check(), {self.master: {'web.foo.bar'}})
+        self.assertEqual(self.master.jail_snapshot['web.foo.bar'].status, 'ZS')
+
+    def test_norun(self):
+        os.rename(self.path('usr/local/etc/ezjail/db_foo_bar.norun'), self.path('usr/local/etc/ezjail/db_foo_bar'))
+        self.assertEqual(self.watcher.check(), {self.master: {'db_foo_bar'}})
+
+    def test_attached_jail(self):
+        Jail(name='db', uid=12, hostname='db.foo.bar', master=self.master)
+        self.write('export jail_db_foo_bar_hostname="db.foo.bar"\n', 'usr/local/etc/ezjail/db_foo_bar.norun')
+        self.assertEqual(self.watcher.check(), {self.master: {'db.foo.bar'}})
+
+    def test_ignored_files(self):
+        self.write('1\n', 'var/run/sshd.pid')
+        self.write('', 'usr/local/etc/ezjail/.db_foo_bar.swp')
+        self.assertEqual(self.watcher.check(), {})
+
+    def test_unchanged_listing(self):
+        snapshot = self.master.jail_snapshot
+        self.write('3\n', 'var/run/jail_web_foo_bar.id')
+        os.utime(self.path('var/run/jail_web_foo_bar.id'), (0, 0))
+        self.assertEqual(self.watcher.check(), {self.master: {'web.foo.bar'}})
+        self.assertIs(self.master.jail_snapshot, snapshot, 'an unchanged listing must not be parsed again')
+
+    def test_invalidate(self):
+        self.master.command_cache = CommandCache()
+        self.master.ezjail_admin.list()
+        self.master.jail_states = {'web.foo.bar': {'jid': 3}, 'db.foo.bar': {'jid': 4}}
+        self.master.invalidate({'web.foo.bar'})
+        self.assertEqual(len(self.master.command_cache), 0)
+        self.assertEqual(list(self.master.jail_states), ['db.foo.bar'])
+        self.master.invalidate()
+        self.assertIsNone(self.master.jail_states)
+
+    def test_other_master(self):
+        other = WatchedMaster(**dict(self.params, name='other', hostname='other.foo.bar'))
+        other.ezjail_config.root = os.path.join(self.root, 'missing')
+        self.watcher.watch(other)
+        self.write('4\n', 'var/run/jail_db_foo_bar.id')
+        self.assertEqual(list(self.watcher.check()), [self.master])
+        self.watcher.unwatch(self.master)
+        self.assertEqual(self.watcher.masters, [other])
+
+    def test_background(self):
+        self.watcher.interval = 0.01
+        changed = threading.Event()
+        self.watcher.subscribe(lambda master, hostnames: changed.set())
+        with self.watcher:
+            self.write('4\n', 'var/run/jail_db_foo_bar.id')
+            self.assertTrue(changed.wait(5))
+
+    def test_restart(self):
+        self.watcher.interval = 0.01
+        changed = threading.Event()
+        self.watcher.subscribe(lambda master, hostnames: changed.set())
+        backend = self.watcher.backend
+        self.watcher.start()
+        self.watcher.stop()
+        self.watcher.start()
+        self.assertIsNot(self.watcher.backend, backend, 'a stopped watcher must not reuse its closed backend')
+        self.write('4\n', 'var/run/jail_db_foo_bar.id')
+        self.assertTrue(changed.wait(5))
+        self.watcher.stop()
+
+    def test_restart_while_stopping(self):
+        self.watcher.interval = 0.01
+        entered, release = threading.Event(), threading.Event()
+        self.watcher.subscribe(lambda master, hostnames: entered.set() or release.wait(5))
+        self.watcher.start()
+        self.write('4\n', 'var/run/jail_db_foo_bar.id')
+        self.assertTrue(entered.wait(5))
+        self.watcher.stop(timeout=0.01)
+        thread = self.watcher._thread
+        self.assertTrue(thread.is_alive(), 'the thread of a timed out stop must be kept')
+        with self.assertRaises(RuntimeError):
+            self.watcher.start()
+        release.set()
+        thread.join(5)
+        self.watcher.start()
+        self.assertIsNot(self.watcher._thread, thread)
+
+    def test_stop_notified(self):
+        backend = default_backend()
+        if backend.name == 'stat':
+            backend.close()
+            self.skipTest('no notifying backend on this platform')
+        watcher = Watcher(interval=30, backend=backend)
+        watcher.watch(self.master)
+        watcher.start()
+        thread = watcher._thread
+        # Lets the thread block in the backend's wait
+        time.sleep(0.1)
+        watcher.stop(timeout=5)
+        self.assertFalse(thread.is_alive(), 'stopping must wake the {} backend'.format(backend.name))
+        self.assertIsNone(watcher._thread)
+
+    def test_restart_notified(self):
+        backend = default_backend()
+        backend.close()
+        if backend.name == 'stat':
+            self.skipTest('no notifying backend on this platform')
+        watcher = Watcher(interval=30, backend=type(backend)())
+        watcher.watch(self.master)
+        changed = threading.Event()
+        watcher.subscribe(lambda master, hostnames: changed.set())
+        watcher.start()
+        watcher.stop()
+        with watcher:
+            self.write('4\n', 'var/run/jail_db_foo_bar.id')
+            self.assertTrue(changed.wait(5), 'the restarted {} backend must wake the watcher'.format(backend.name))
+
+    def test_notified(self):
+        backend = default_backend()
+        if backend.name == 'stat':
+            backend.close()
+            self.skipTest('no notifying backend on this platform')
+        watcher = Watcher(interval=30, backend=backend)
+        watcher.watch(self.master)
+        changed = threading.Event()
+        watcher.subscribe(lambda master, hostnames: changed.set())
+        with watcher:
+            self.write('4\n', 'var/run/jail_db_foo_bar.id')
+            self.assertTrue(changed.wait(5), 'the {} backend must wake the watcher'.format(backend.name))